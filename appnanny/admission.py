@@ -0,0 +1,139 @@
+import collections
+import math
+import threading
+import time
+
+from config import active_config as config
+from proxy_stats import LatencyHistogram
+
+
+def limits_for(app_meta, replicas):
+    """Get (max_inflight, max_queue) of an app from its metadata
+
+    max_inflight is configured per replica, scaling out raises the app's cap.
+    """
+    per_replica = app_meta.get("max_inflight", config.PROXY_MAX_INFLIGHT)
+    return per_replica * max(replicas, 1), app_meta.get(
+        "max_queue", config.PROXY_MAX_QUEUE
+    )
+
+
+class _Waiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.admitted = False
+
+
+class AdmissionLimiter:
+    """Cap the in-flight upstream requests of one app, queueing the excess
+
+    A request beyond the limit waits in a bounded FIFO queue until a slot
+    frees up or queue_timeout passes. A request arriving at a full queue is
+    rejected at once, so an overloaded app answers 503 quickly instead of
+    piling up threads in the proxy. Released slots are handed straight to
+    the oldest waiter, so new arrivals cannot overtake the queue.
+    """
+
+    def __init__(self, max_inflight=None, max_queue=None, queue_timeout=None):
+        """
+        Args:
+            max_inflight: Concurrent upstream requests, 0 for no limit
+            max_queue: Requests waiting for a slot before new ones are rejected
+            queue_timeout: Seconds a request waits before it is rejected
+        """
+        self.max_inflight = (
+            config.PROXY_MAX_INFLIGHT if max_inflight is None else max_inflight
+        )
+        self.max_queue = config.PROXY_MAX_QUEUE if max_queue is None else max_queue
+        self.queue_timeout = (
+            config.PROXY_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        )
+        self._inflight = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+        # Counters since start, see snapshot()
+        self._admitted = 0
+        self._queued = 0
+        self._rejected_full = 0
+        self._rejected_timeout = 0
+        self._max_queue_depth = 0
+        self._wait = LatencyHistogram()
+
+    def set_limits(self, max_inflight, max_queue):
+        """Change the limits, e.g. when the replica count changes"""
+        with self._lock:
+            self.max_inflight, self.max_queue = max_inflight, max_queue
+            self._admit_waiters()
+
+    def _has_slot(self):
+        return not self.max_inflight or self._inflight < self.max_inflight
+
+    def _admit_waiters(self):
+        # Called with the lock held
+        while self._waiters and self._has_slot():
+            waiter = self._waiters.popleft()
+            waiter.admitted = True
+            self._inflight += 1
+            waiter.event.set()
+
+    def acquire(self):
+        """Take an upstream slot, waiting in the queue if needed
+
+        Returns:
+            bool: True if admitted; the caller must then call release()
+        """
+        with self._lock:
+            if self._has_slot() and not self._waiters:
+                self._inflight += 1
+                self._admitted += 1
+                return True
+            if len(self._waiters) >= self.max_queue:
+                self._rejected_full += 1
+                return False
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+            self._queued += 1
+            self._max_queue_depth = max(self._max_queue_depth, len(self._waiters))
+
+        begin = time.time()
+        waiter.event.wait(self.queue_timeout)
+        with self._lock:
+            self._wait.record(time.time() - begin)
+            if waiter.admitted:
+                self._admitted += 1
+                return True
+            self._waiters.remove(waiter)
+            self._rejected_timeout += 1
+            return False
+
+    def release(self):
+        """Give back a slot taken by acquire()"""
+        with self._lock:
+            self._inflight -= 1
+            self._admit_waiters()
+
+    def retry_after(self):
+        """Seconds a rejected client should wait, for the Retry-After header
+
+        Estimated from how long queued requests have been waiting; at least
+        1 and at most queue_timeout.
+        """
+        wait = self._wait
+        mean = wait.sum / wait.count if wait.count else 1
+        return max(1, min(math.ceil(mean), math.ceil(self.queue_timeout)))
+
+    def snapshot(self):
+        """Get current depths and counters since start"""
+        with self._lock:
+            return {
+                "inflight": self._inflight,
+                "queued": len(self._waiters),
+                "max_inflight": self.max_inflight,
+                "max_queue": self.max_queue,
+                "max_queue_depth": self._max_queue_depth,
+                "admitted": self._admitted,
+                "queued_total": self._queued,
+                "rejected_full": self._rejected_full,
+                "rejected_timeout": self._rejected_timeout,
+                "wait": self._wait.to_dict(),
+            }
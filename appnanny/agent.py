@@ -0,0 +1,58 @@
+import os
+import socket
+
+from flask import Blueprint, jsonify
+
+from logging_config import logger
+
+agent_controller = Blueprint("agent_controller", __name__)
+_app_service = None
+
+
+def init_agent(app_service):
+    """Initialize agent with app service instance"""
+    global _app_service
+    _app_service = app_service
+
+
+def _app_metrics(app_name):
+    """Get live resource usage of a running app, summed over its replicas"""
+    import psutil  # slow to import, load it on first use
+
+    replicas = _app_service.state_manager.get_app_replicas(app_name)
+    if not replicas:
+        return None
+    try:
+        metrics = {"pids": [], "cpu_percent": 0.0, "rss": 0}
+        for replica in replicas:
+            process = replica["process"]
+            with process.oneshot():
+                metrics["pids"].append(process.pid)
+                metrics["cpu_percent"] += process.cpu_percent(interval=None)
+                metrics["rss"] += process.memory_info().rss
+        return metrics
+    except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+        logger.warning("Failed to read metrics of app '%s': %s", app_name, e)
+        return None
+
+
+@agent_controller.route("/node", methods=["GET"])
+def node_info():
+    """Report host capacity and live metrics to the coordinator"""
+    import psutil
+
+    memory = psutil.virtual_memory()
+    running = list(_app_service.state_manager.running_apps)
+    return jsonify(
+        {
+            "hostname": socket.gethostname(),
+            "cpu_count": psutil.cpu_count(),
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "load_avg": os.getloadavg(),
+            "memory_total": memory.total,
+            "memory_available": memory.available,
+            "app_count": len(_app_service.state_manager.get_all_metadata()),
+            "running_count": len(running),
+            "apps": {app_name: _app_metrics(app_name) for app_name in running},
+        }
+    )
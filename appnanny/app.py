@@ -5,12 +5,21 @@
 AppNanny: A service that manages multiple apps (Streamlit, Voila, etc.)
 """
 
-from flask import Flask, render_template
+import atexit
+import os
+import signal
+import sys
+import threading
+import uuid
 
+from flask import Flask, g, render_template, request
+
+from agent import agent_controller, init_agent
 from app_controller import app_controller, init_controller
 from app_service import AppService
-from logging_config import logger
+from logging_config import bind_log_context, logger, reset_log_context
 from config import active_config as config
+from start_scheduler import StartScheduler
 
 
 def create_app():
@@ -18,14 +27,63 @@ def create_app():
 
     # Create AppService instance and initialize controller with it
     app_service = AppService(config.STORAGE_PATH)
-    init_controller(app_service)
+    start_scheduler = StartScheduler(app_service)
+    init_controller(app_service, start_scheduler)
+    init_agent(app_service)
 
-    # Register blueprint after initializing controller
+    # Register blueprints after initializing controllers
     app.register_blueprint(app_controller)
+    app.register_blueprint(agent_controller)
+
+    @app.before_request
+    def bind_request_context():
+        context = {
+            "request_id": request.headers.get("X-Request-ID") or uuid.uuid4().hex[:12]
+        }
+        app_name = (request.view_args or {}).get("app_name")
+        if app_name:
+            context["app_name"] = app_name
+        g.log_context_token = bind_log_context(**context)
+
+    @app.teardown_request
+    def reset_request_context(exc):
+        token = g.pop("log_context_token", None)
+        if token is not None:
+            reset_log_context(token)
+
+    # With the debug reloader only the child process serves requests
+    serving = not config.DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    if serving:
+        # Snapshot for a fast next start, only written on clean shutdown
+        atexit.register(app_service.state_manager.save_snapshot)
+    if config.RESTORE_ON_BOOT and serving:
+        # Waits for startup reconciliation, which must not delay serving
+        threading.Thread(
+            target=start_scheduler.restore_previous, name="restore", daemon=True
+        ).start()
+    if config.WATCH_APP_DIRS and serving:
+        from hot_reload import CodeWatcher
+
+        CodeWatcher(config.STORAGE_PATH, app_service.apply_watched_changes).start()
+
+    gateway = None
+    if config.GATEWAY_ENABLED:
+        gateway = {
+            "port": config.GATEWAY_PORT,
+            "routing": config.GATEWAY_ROUTING,
+            "domain": config.GATEWAY_DOMAIN,
+        }
+        if serving:
+            # The gateway pulls in requests, only load it when enabled
+            from gateway import create_gateway
+
+            threading.Thread(
+                target=create_gateway(app_service).start, name="gateway", daemon=True
+            ).start()
 
     @app.route("/")
     def index():
-        return render_template("main.html")
+        return render_template("main.html", gateway=gateway)
 
     @app.route("/create")
     def create():
@@ -35,6 +93,8 @@ def create_app():
 
 
 if __name__ == "__main__":
+    # Exit through atexit handlers on SIGTERM too, e.g. under systemd
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app = create_app()
-    logger.info(f"Starting Flask server on {config.HOST}:{config.PORT}")
+    logger.info("Starting Flask server on %s:%s", config.HOST, config.PORT)
     app.run(host=config.HOST, port=config.PORT, debug=config.DEBUG)
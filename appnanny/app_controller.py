@@ -1,21 +1,44 @@
-from flask import Blueprint, request, jsonify, render_template
+import json
+
+from flask import Blueprint, Response, request, jsonify, render_template
 
 from logging_config import logger
+from config import active_config as config
 
 app_controller = Blueprint("app_controller", __name__)
 _app_service = None
+_start_scheduler = None
 
 
-def init_controller(app_service):
-    """Initialize controller with app service instance"""
-    global _app_service
+def init_controller(app_service, start_scheduler):
+    """Initialize controller with app service and start scheduler instances"""
+    global _app_service, _start_scheduler
     _app_service = app_service
+    _start_scheduler = start_scheduler
+
+
+def _non_integer_field(data, *names):
+    """Get the first of the given request fields set to a non-integer"""
+    for name in names:
+        value = data.get(name)
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return name
+        try:
+            int(value)
+        except (TypeError, ValueError):
+            return name
+    return None
 
 
 @app_controller.route("/create", methods=["POST"])
 def create_app():
     """Handle app creation requests"""
     data = request.json
+    invalid = _non_integer_field(data, "replicas", "workers", "threads")
+    if invalid:
+        return jsonify({"error": f"{invalid} must be an integer"}), 400
     if _app_service.create_app(
         data["name"],
         data["type"],
@@ -23,9 +46,13 @@ def create_app():
         data["path"],
         data["email"],
         data.get("env", {}),
+        data.get("replicas", 1),
+        workers=data.get("workers"),
+        threads=data.get("threads"),
+        entrypoint=data.get("entrypoint"),
     ):
         return jsonify({"message": f"App '{data['name']}' created successfully"})
-    return jsonify({"error": f"Failed to create app '{data['name']}'"}, 400)
+    return jsonify({"error": f"Failed to create app '{data['name']}'"}), 400
 
 
 @app_controller.route("/stop/<app_name>", methods=["POST"])
@@ -33,28 +60,185 @@ def stop_app(app_name):
     """Handle app stop requests"""
     if _app_service.stop_app(app_name):
         return jsonify({"message": f"App '{app_name}' stopped"})
-    return jsonify({"error": f"Failed to stop app '{app_name}'"}, 400)
+    return jsonify({"error": f"Failed to stop app '{app_name}'"}), 400
+
+
+@app_controller.route("/delete/<app_name>", methods=["POST"])
+def delete_app(app_name):
+    """Handle app deletion requests"""
+    if _app_service.delete_app(app_name):
+        return jsonify({"message": f"App '{app_name}' deleted, backup kept"})
+    return jsonify({"error": f"Failed to delete app '{app_name}'"}), 400
 
 
 @app_controller.route("/restart/<app_name>", methods=["POST"])
 def restart_app(app_name):
     """Handle app restart requests"""
-    port = _app_service.restart_app(app_name)
+    mode = request.args.get("mode", config.RESTART_MODE)
+    # full=1 restarts even when the pulled changes could be applied in place
+    full = request.args.get("full") in ("1", "true")
+    if mode == "rolling":
+        result = _app_service.rolling_restart_app(app_name, full)
+        if result:
+            message = f"App '{app_name}' restarted on port {result['port']}"
+            if result["action"] != "restart":
+                message = f"App '{app_name}' updated in place ({result['action']})"
+            return jsonify({"message": message, **result})
+        return jsonify({"error": f"Failed to restart app '{app_name}'"}), 400
+
+    port = _app_service.restart_app(app_name, full)
     if port:
         return jsonify(
             {"message": f"App '{app_name}' restarted on port {port}", "port": port}
         )
-    return jsonify({"error": f"Failed to restart app '{app_name}'"}, 400)
+    return jsonify({"error": f"Failed to restart app '{app_name}'"}), 400
+
+
+@app_controller.route("/pin/<app_name>", methods=["POST"])
+def pin_app(app_name):
+    """Handle eviction pin/priority updates"""
+    data = request.json or {}
+    if _non_integer_field(data, "priority"):
+        return jsonify({"error": "priority must be an integer"}), 400
+    if _app_service.set_app_pin(app_name, data.get("pinned"), data.get("priority")):
+        return jsonify({"message": f"App '{app_name}' eviction settings updated"})
+    return jsonify({"error": "App not found"}), 404
+
+
+@app_controller.route("/scale/<app_name>", methods=["POST"])
+def scale_app(app_name):
+    """Handle replica count, autoscaling, worker count and proxy limit updates"""
+    data = request.json or {}
+    invalid = _non_integer_field(
+        data,
+        "replicas",
+        "max_replicas",
+        "workers",
+        "threads",
+        "max_inflight",
+        "max_queue",
+    )
+    if invalid:
+        return jsonify({"error": f"{invalid} must be an integer"}), 400
+    if _app_service.scale_app(
+        app_name,
+        data.get("replicas"),
+        data.get("autoscale"),
+        data.get("max_replicas"),
+        data.get("workers"),
+        data.get("threads"),
+        data.get("max_inflight"),
+        data.get("max_queue"),
+    ):
+        ports = _app_service.state_manager.get_app_ports(app_name)
+        return jsonify({"message": f"App '{app_name}' scaled", "ports": ports})
+    return jsonify({"error": f"Failed to scale app '{app_name}'"}), 400
+
+
+@app_controller.route("/autoscale", methods=["POST"])
+def autoscale():
+    """Adjust replicas of autoscaled apps to their load"""
+    return jsonify({"changes": _app_service.autoscale()})
 
 
 @app_controller.route("/heartbeat/<app_name>", methods=["POST"])
 def update_access_time(app_name):
     """Handle app heartbeat requests"""
     if _app_service.update_access_time(app_name):
-        return jsonify({"status": "ok"})
+        # Proxies follow the current upstream ports, which change on rolling
+        # restart and scaling, and the admission limits set by /scale
+        ports = _app_service.state_manager.get_app_ports(app_name)
+        app_meta = _app_service.state_manager.get_app_metadata(app_name) or {}
+        limits = {
+            k: app_meta[k] for k in ("max_inflight", "max_queue") if k in app_meta
+        }
+        return jsonify(
+            {"status": "ok", "port": ports[0], "ports": ports, "limits": limits}
+        )
     return jsonify({"error": "App not found"}), 404
 
 
+@app_controller.route("/stats/<app_name>", methods=["POST"])
+def report_stats(app_name):
+    """Handle request stats reports from proxies"""
+    data = request.json or {}
+    if "source" not in data or "stats" not in data:
+        return jsonify({"error": "source and stats are required"}), 400
+    # A late report from the proxy of a deleted app must not bring it back
+    if not _app_service.state_manager.get_app_metadata(app_name):
+        return jsonify({"error": "App not found"}), 404
+    _app_service.proxy_stats.report(app_name, data["source"], data["stats"])
+    return jsonify({"status": "ok"})
+
+
+@app_controller.route("/stats", methods=["GET"])
+def list_stats():
+    """Handle request stats listing, slowest apps first"""
+    registry = _app_service.proxy_stats
+    stats = {name: registry.summary(name) for name in registry.app_names()}
+    return jsonify(
+        sorted(
+            ({"name": name, **summary} for name, summary in stats.items()),
+            key=lambda s: s["latency_ms"]["p90"] or 0,
+            reverse=True,
+        )
+    )
+
+
+@app_controller.route("/stats/<app_name>", methods=["GET"])
+def get_stats(app_name):
+    """Handle request stats queries for one app"""
+    summary = _app_service.proxy_stats.summary(app_name)
+    if summary is None:
+        return jsonify({"error": f"No stats for app '{app_name}'"}), 404
+    return jsonify(summary)
+
+
+def _ndjson(items):
+    """Stream dicts as JSON lines, None items become keepalive empty lines"""
+    for item in items:
+        yield "\n" if item is None else json.dumps(item) + "\n"
+
+
+@app_controller.route("/logs/<app_name>", methods=["GET"])
+def stream_logs(app_name):
+    """Stream log lines of an app as JSON lines
+
+    Query: stream=stdout|stderr, tail=N lines to start with, follow=1 to keep
+    streaming new lines
+    """
+    lines = _app_service.read_log(
+        app_name,
+        request.args.get("stream", "stdout"),
+        request.args.get("tail", 100, type=int),
+        request.args.get("follow") in ("1", "true"),
+    )
+    if lines is None:
+        return jsonify({"error": "App not found"}), 404
+    items = ({"line": line} if line is not None else None for line in lines)
+    return Response(_ndjson(items), mimetype="application/x-ndjson")
+
+
+@app_controller.route("/events", methods=["GET"])
+def stream_events():
+    """Stream app events (state, created, deleted, updated) as JSON lines
+
+    Query: app=<name> to only get events of one app
+    """
+    events = _app_service.events
+    subscriber = events.subscribe(request.args.get("app"))
+
+    def generate():
+        try:
+            while True:
+                yield events.next_event(subscriber, config.STREAM_KEEPALIVE)
+        finally:
+            # Runs when the client disconnects and the next write fails
+            events.unsubscribe(subscriber)
+
+    return Response(_ndjson(generate()), mimetype="application/x-ndjson")
+
+
 @app_controller.route("/apps", methods=["GET"])
 def list_apps():
     """Handle app listing requests"""
@@ -62,14 +246,16 @@ def list_apps():
         apps = _app_service.list_apps()
         return jsonify(apps)
     except Exception as e:
-        logger.error(f"Error listing apps: {str(e)}")
+        logger.error("Error listing apps: %s", e)
         return jsonify({"error": "Failed to list apps"}), 500
 
 
 @app_controller.route("/start/<app_name>", methods=["POST"])
 def start_app(app_name):
     """Handle app start requests"""
-    port = _app_service.start_app(app_name)
+    if not _app_service.state_manager.get_app_metadata(app_name):
+        return jsonify({"error": "App not found"}), 404
+    port = _start_scheduler.start(app_name)
     if port:
         return jsonify(
             {"message": f"App '{app_name}' started on port {port}", "port": port}
@@ -77,19 +263,95 @@ def start_app(app_name):
     return jsonify({"error": "Failed to start app"}), 400
 
 
+@app_controller.route("/start-all", methods=["POST"])
+def start_all():
+    """Queue starts for many apps, hottest first
+
+    Body: {"apps": [...]} to pick apps, or {"restore": true} to start the apps
+    that were running before the last shutdown. Defaults to all stopped apps.
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get("restore"):
+        order = _start_scheduler.restore_previous()
+    else:
+        app_names = data.get("apps") or [
+            am["name"]
+            for am in _app_service.state_manager.get_all_metadata()
+            if not _app_service.state_manager.is_app_running(am["name"])
+        ]
+        order = _start_scheduler.submit(app_names)
+    return jsonify({"message": f"Queued {len(order)} apps", "order": order}), 202
+
+
 @app_controller.route("/env/<app_name>")
 def edit_env(app_name):
     """Show environment variables editor"""
     app_meta = _app_service.state_manager.get_app_metadata(app_name)
     if not app_meta:
         return jsonify({"error": "App not found"}), 404
-    return render_template("env.html", app_name=app_name, env=app_meta.get("env", {}))
+    env = _app_service.env_store.get(app_name)
+    return render_template("env.html", app_name=app_name, env=env)
 
 
 @app_controller.route("/env/<app_name>", methods=["POST"])
 def update_env(app_name):
-    """Update environment variables"""
+    """Replace environment variables, ?scope=secret for the secret ones"""
     env = request.json
-    if _app_service.update_app_env(app_name, env):
-        return jsonify({"message": "Environment variables updated successfully"})
+    diff = _app_service.update_app_env(
+        app_name, env, request.args.get("apply"), request.args.get("scope", "app")
+    )
+    if diff is not None:
+        return jsonify(
+            {"message": "Environment variables updated successfully", "diff": diff}
+        )
+    return jsonify({"error": "Failed to update environment variables"}), 400
+
+
+@app_controller.route("/env/<app_name>", methods=["PATCH"])
+def patch_env(app_name):
+    """Set/unset individual environment variables, ?scope=secret for secrets"""
+    data = request.json
+    diff = _app_service.patch_app_env(
+        app_name,
+        data.get("set"),
+        data.get("unset"),
+        apply=data.get("apply"),
+        scope=request.args.get("scope", "app"),
+    )
+    if diff is not None:
+        return jsonify(
+            {"message": "Environment variables updated successfully", "diff": diff}
+        )
+    return jsonify({"error": "Failed to update environment variables"}), 400
+
+
+@app_controller.route("/env", methods=["POST", "PATCH"])
+def update_shared_env():
+    """Change variables of all apps (?scope=global) or of one type
+    (?scope=type&type=<app_type>) and apply them to the affected apps
+
+    POST replaces all variables of the scope with the JSON body, PATCH takes
+    {"set": {...}, "unset": [...], "apply": ...} like /env/<app_name>.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON object required"}), 400
+    scope = request.args.get("scope", "global")
+    app_type = request.args.get("type")
+    if request.method == "POST":
+        result = _app_service.patch_shared_env(
+            scope, app_type, replace=data, apply=request.args.get("apply")
+        )
+    else:
+        result = _app_service.patch_shared_env(
+            scope,
+            app_type,
+            data.get("set"),
+            data.get("unset"),
+            apply=data.get("apply"),
+        )
+    if result is not None:
+        return jsonify(
+            {"message": "Environment variables updated successfully", **result}
+        )
     return jsonify({"error": "Failed to update environment variables"}), 400
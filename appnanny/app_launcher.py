@@ -1,79 +1,123 @@
 import os
 import socket
 import subprocess
+import threading
+import time
 
-import git
-import psutil
-from dotenv import dotenv_values
-
+from app_store import exclude_from_git, state_dir
+from app_types import get_app_type
 from port_utils import find_available_port
 from logging_config import logger
+from config import active_config as config
 
 
 class AppLauncher:
     def __init__(self, storage_path):
         self.storage_path = storage_path
+        # Ports handed out recently: a new app may take a while to bind its
+        # port, concurrent launches must not pick the same one meanwhile
+        self._reserved_ports = {}  # port -> (app_name, reservation time)
+        self._port_lock = threading.Lock()
 
     def clone_repository(self, app_name, repo):
         """Initial repository clone for new app"""
+        import git  # GitPython is slow to import, load it on first use
+
         app_dir = os.path.join(self.storage_path, app_name)
         if not os.path.exists(app_dir):
-            logger.info(f"Creating directory for app '{app_name}': {app_dir}")
+            logger.info("Creating directory for app '%s': %s", app_name, app_dir)
             os.makedirs(app_dir)
 
         try:
             if os.path.exists(os.path.join(app_dir, ".git")):
-                logger.error(f"Git repository already exists for app '{app_name}'")
+                logger.error("Git repository already exists for app '%s'", app_name)
                 return None
 
-            logger.info(f"Cloning repository for app '{app_name}' from {repo}")
+            logger.info("Cloning repository for app '%s' from %s", app_name, repo)
             git.Repo.clone_from(repo, app_dir)
+            exclude_from_git(app_dir)
             return app_dir
         except git.GitCommandError as e:
             logger.error(
-                f"Git clone failed for app '{app_name}': {str(e)}", exc_info=True
+                "Git clone failed for app '%s': %s", app_name, e, exc_info=True
             )
             return None
         except Exception as e:
             logger.error(
-                f"Unexpected error during git clone for app '{app_name}': {str(e)}",
+                "Unexpected error during git clone for app '%s': %s",
+                app_name,
+                e,
                 exc_info=True,
             )
             return None
 
     def update_repository(self, app_name):
-        """Update existing repository"""
+        """Update existing repository
+
+        Returns:
+            list: Paths changed by the pull, relative to the app directory,
+                or None on failure
+        """
+        import git  # GitPython is slow to import, load it on first use
+
         app_dir = os.path.join(self.storage_path, app_name)
         try:
             if not os.path.exists(os.path.join(app_dir, ".git")):
-                logger.error(f"No git repository found for app '{app_name}'")
-                return False
+                logger.error("No git repository found for app '%s'", app_name)
+                return None
 
-            logger.info(f"Updating repository for app '{app_name}'")
+            logger.info("Updating repository for app '%s'", app_name)
             git_repo = git.Repo(app_dir)
+            old_commit = git_repo.head.commit.hexsha
             git_repo.remotes.origin.pull()
-            return True
-        except git.GitCommandError as e:
-            logger.error(
-                f"Git pull failed for app '{app_name}': {str(e)}", exc_info=True
+            new_commit = git_repo.head.commit.hexsha
+            if old_commit == new_commit:
+                return []
+            changed = git_repo.git.diff("--name-only", old_commit, new_commit)
+            logger.info(
+                "Repository of app '%s' updated %s..%s",
+                app_name,
+                old_commit[:8],
+                new_commit[:8],
             )
-            return False
+            return changed.splitlines()
+        except git.GitCommandError as e:
+            logger.error("Git pull failed for app '%s': %s", app_name, e, exc_info=True)
+            return None
         except Exception as e:
             logger.error(
-                f"Unexpected error during git pull for app '{app_name}': {str(e)}",
+                "Unexpected error during git pull for app '%s': %s",
+                app_name,
+                e,
                 exc_info=True,
             )
-            return False
+            return None
+
+    def launch(
+        self,
+        app_name,
+        app_type,
+        path,
+        env,
+        preferred_port=None,
+        exclude=(),
+        options=None,
+    ):
+        """Launch a new application instance
 
-    def launch(self, app_name, app_type, path, env_vars, preferred_port=None):
-        """Launch a new application instance"""
+        Args:
+            env: Complete process environment, see EnvStore.resolve()
+            exclude: Ports never to use, e.g. those of the app's other replicas
+            options: Per-app "workers", "threads" and "entrypoint" settings,
+                missing ones use the app type's defaults
+        """
         app_dir = os.path.join(self.storage_path, app_name)
         if not os.path.exists(app_dir):
-            logger.error(f"App directory not found for '{app_name}'")
+            logger.error("App directory not found for '%s'", app_name)
             return None
 
         # Allocate port
-        port = self._allocate_port(app_name, preferred_port)
+        port = self._allocate_port(app_name, preferred_port, exclude)
         if not port:
             return None
 
@@ -82,46 +126,82 @@ class AppLauncher:
 
         # Launch process
         process = self._start_process(
-            app_name, app_type, app_dir, path, port, env_vars, stdout_log, stderr_log
+            app_name,
+            app_type,
+            app_dir,
+            path,
+            port,
+            env,
+            stdout_log,
+            stderr_log,
+            options or {},
         )
         if not process:
             return None
 
         return port, process
 
-    def _allocate_port(self, app_name, preferred_port=None):
+    def _allocate_port(self, app_name, preferred_port=None, exclude=()):
         """Allocate a port for the application"""
+        with self._port_lock:
+            now = time.time()
+            self._reserved_ports = {
+                p: (name, t)
+                for p, (name, t) in self._reserved_ports.items()
+                if now - t < config.READINESS_TIMEOUT
+            }
+            taken = {
+                p for p, (name, _) in self._reserved_ports.items() if name != app_name
+            }
+            taken.update(exclude)
+            port = self._find_port(app_name, preferred_port, taken)
+            if port:
+                self._reserved_ports[port] = (app_name, now)
+            return port
+
+    def _find_port(self, app_name, preferred_port, taken):
+        """Find a free port not in taken, trying the preferred one first"""
         try:
             port = None
-            if preferred_port:
+            if preferred_port in taken:
+                logger.warning(
+                    "Preferred port %s was just handed out, not using it for app '%s'",
+                    preferred_port,
+                    app_name,
+                )
+            elif preferred_port:
                 logger.info(
-                    f"Checking preferred port {preferred_port} for app '{app_name}'"
+                    "Checking preferred port %s for app '%s'", preferred_port, app_name
                 )
                 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                     if s.connect_ex(("127.0.0.1", preferred_port)) != 0:
                         port = preferred_port
-                        logger.info(f"Using preferred port {port} for app '{app_name}'")
+                        logger.info(
+                            "Using preferred port %s for app '%s'", port, app_name
+                        )
                     else:
                         logger.warning(
-                            f"Preferred port {preferred_port} is in use for app '{app_name}'"
+                            "Preferred port %s is in use for app '%s'",
+                            preferred_port,
+                            app_name,
                         )
 
             if not port:
-                port = find_available_port()
+                port = find_available_port(exclude=taken)
                 if not port:
-                    logger.error(f"No available ports found for app '{app_name}'")
+                    logger.error("No available ports found for app '%s'", app_name)
                     return None
-                logger.info(f"Assigned new port {port} for app '{app_name}'")
+                logger.info("Assigned new port %s for app '%s'", port, app_name)
             return port
         except Exception as e:
             logger.error(
-                f"Port allocation failed for app '{app_name}': {str(e)}", exc_info=True
+                "Port allocation failed for app '%s': %s", app_name, e, exc_info=True
             )
             return None
 
     def _setup_logging(self, app_dir, app_name):
         """Setup log files for stdout and stderr"""
-        log_dir = os.path.join(app_dir, "logs")
+        log_dir = os.path.join(state_dir(self.storage_path, app_name), "logs")
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
 
@@ -130,26 +210,46 @@ class AppLauncher:
         return stdout_log, stderr_log
 
     def _start_process(
-        self, app_name, app_type, app_dir, path, port, env_vars, stdout_log, stderr_log
+        self,
+        app_name,
+        app_type,
+        app_dir,
+        path,
+        port,
+        env,
+        stdout_log,
+        stderr_log,
+        options,
     ):
         """Start the application process"""
+        import psutil  # slow to import, load it on first use
+
         try:
-            # Load .env file if exists
-            env = os.environ.copy()
-            env_file = os.path.join(app_dir, ".env")
-            if os.path.exists(env_file):
-                env.update(dotenv_values(env_file))
+            type_handler = get_app_type(app_type)
+            if not type_handler:
+                logger.error(
+                    "Unsupported app type '%s' for app '%s'", app_type, app_name
+                )
+                return None
 
+            workers = options.get("workers") or type_handler.default_workers
+            threads = options.get("threads") or type_handler.default_threads
+            workdir = os.path.dirname(os.path.join(app_dir, path))
+            cmd = type_handler.command(
+                os.path.basename(path),
+                port,
+                workers,
+                threads,
+                options.get("entrypoint"),
+            )
             # Add runtime variables
-            env.update(env_vars)
-            env["PORT"] = str(port)
+            env = {
+                **env,
+                **type_handler.env(port, workers, threads),
+                "PORT": str(port),
+            }
 
-            cmd, workdir = self._build_command(app_type, app_dir, path, port)
-            if not cmd:
-                logger.error(f"Unsupported app type '{app_type}' for app '{app_name}'")
-                return None
-
-            logger.info(f"Launching app '{app_name}' with command: {' '.join(cmd)}")
+            logger.info("Launching app '%s' with command: %s", app_name, " ".join(cmd))
             process = subprocess.Popen(
                 cmd,
                 cwd=workdir,
@@ -159,25 +259,11 @@ class AppLauncher:
             )
             # Convert subprocess.Popen to psutil.Process
             psutil_process = psutil.Process(process.pid)
-            logger.info(f"App '{app_name}' launched with PID {psutil_process.pid}")
+            logger.info("App '%s' launched with PID %s", app_name, psutil_process.pid)
             return psutil_process
 
         except Exception as e:
             logger.error(
-                f"Process launch failed for app '{app_name}': {str(e)}", exc_info=True
+                "Process launch failed for app '%s': %s", app_name, e, exc_info=True
             )
             return None
-
-    def _build_command(self, app_type, app_dir, path, port):
-        """Build command list based on app type"""
-        workdir = os.path.dirname(os.path.join(app_dir, path))
-        scriptfile = os.path.basename(path)
-        if app_type == "streamlit":
-            cmd = ["streamlit", "run", scriptfile, "--server.port", str(port)]
-        elif app_type == "voila":
-            cmd = ["voila", scriptfile, "--port", str(port)]
-        elif app_type == "flask":
-            cmd = ["python", scriptfile, "--port", str(port)]
-        else:
-            cmd = []
-        return cmd, workdir
@@ -1,27 +1,81 @@
+import functools
 import os
-
-import psutil
+import signal
+import threading
+import time
 
 from logging_config import logger
 from config import active_config as config
 from app_state_manager import AppStateManager
+from app_store import Archiver, state_dir
 from app_launcher import AppLauncher
+from env_store import EnvStore
+from event_hub import EventHub
+from proxy_stats import StatsRegistry
+from port_utils import wait_until_ready
+from app_types import get_app_type, readiness_path
+from hot_reload import classify_changes
+
+
+def _lifecycle(method):
+    """Run an AppService method holding the lock of the app it changes
+
+    Starts, stops, restarts, scaling and env reloads come from requests,
+    autoscaling, the code watcher and boot restore at the same time; one at
+    a time per app keeps them from launching or stopping the same processes.
+    The lock is reentrant, so e.g. restart_app can call stop_app.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, app_name, *args, **kwargs):
+        with self._app_lock(app_name):
+            return method(self, app_name, *args, **kwargs)
+
+    return wrapper
 
 
 class AppService:
     def __init__(self, storage_path):
         self.storage_path = storage_path
-        self.state_manager = AppStateManager(
-            os.path.join(storage_path, config.METADATA_FILE), storage_path
-        )
+        self.state_manager = AppStateManager(storage_path)
         self.app_launcher = AppLauncher(storage_path)
+        self.archiver = Archiver(storage_path)
+        self.env_store = EnvStore(storage_path)
+        # Request stats reported by the proxies and the gateway
+        self.proxy_stats = StatsRegistry()
+        # app_name -> time until which CodeWatcher events are ignored
+        self._watch_suppressed = {}
+        # Streamed to clients by /events
+        self.events = EventHub()
+        # app_name -> RLock, see _lifecycle
+        self._app_locks = {}
+        self._app_locks_lock = threading.Lock()
+        self.state_manager.add_listener(
+            lambda app_name, ports: self.events.publish(
+                "state", app_name, running=bool(ports), ports=ports
+            )
+        )
 
         if not os.path.exists(storage_path):
             os.makedirs(storage_path)
 
+        self._migrate_metadata_env()
+        # Finish archiving deleted apps left over by a previous run
+        self.archiver.archive_pending()
+
+    def _migrate_metadata_env(self):
+        """Move env vars kept in metadata by older versions into .env files"""
+        for am in self.state_manager.get_all_metadata():
+            if "env" not in am:
+                continue
+            if am["env"] and not self.env_store.get(am["name"]):
+                logger.info("Migrating env vars of app '%s' to .env", am["name"])
+                self.env_store.replace(am["name"], am["env"])
+            self.state_manager.remove_app_metadata_keys(am["name"], ["env"])
+
     def setup_app_logging(self, app_dir, app_name):
         """Setup rotating log files for app stdout and stderr"""
-        log_dir = os.path.join(app_dir, "logs")
+        log_dir = os.path.join(state_dir(self.storage_path, app_name), "logs")
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
 
@@ -30,60 +84,370 @@ class AppService:
 
         return stdout_log, stderr_log
 
+    def read_log(self, app_name, stream="stdout", tail=100, follow=False):
+        """Yield lines of an app's stdout or stderr log
+
+        Args:
+            tail: Number of lines from the end of the log to start with
+            follow: Keep yielding lines as they are written, and None every
+                config.STREAM_KEEPALIVE seconds without new lines so callers
+                can check their client is still there
+
+        Returns:
+            generator: Log lines without line endings, or None if the app does
+                not exist
+        """
+        if not self.state_manager.get_app_metadata(app_name):
+            return None
+        app_dir = os.path.join(self.storage_path, app_name)
+        stdout_log, stderr_log = self.setup_app_logging(app_dir, app_name)
+        return self._read_lines(
+            stderr_log if stream == "stderr" else stdout_log, tail, follow
+        )
+
+    @staticmethod
+    def _read_lines(path, tail, follow):
+        # Logs are opened in append mode by the apps; a file smaller than our
+        # position was rotated or truncated, so reading restarts at its head
+        position = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                position = f.seek(0, os.SEEK_END)
+                # Read backwards in blocks until enough lines are buffered
+                data, start = b"", position
+                while start > 0 and data.count(b"\n") <= tail:
+                    start = max(0, start - 65536)
+                    f.seek(start)
+                    data = f.read(position - start)
+            lines = data.splitlines()[-tail:] if tail else []
+            for line in lines:
+                yield line.decode(errors="replace")
+        if not follow:
+            return
+
+        partial = b""
+        idle_since = time.time()
+        while True:
+            time.sleep(config.LOG_FOLLOW_INTERVAL)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            if size < position:
+                position, partial = 0, b""
+            if size > position:
+                with open(path, "rb") as f:
+                    f.seek(position)
+                    data = partial + f.read()
+                    position = f.tell()
+                *lines, partial = data.split(b"\n")
+                for line in lines:
+                    yield line.rstrip(b"\r").decode(errors="replace")
+                idle_since = time.time()
+            elif time.time() - idle_since >= config.STREAM_KEEPALIVE:
+                yield None
+                idle_since = time.time()
+
+    def _app_lock(self, app_name):
+        with self._app_locks_lock:
+            return self._app_locks.setdefault(app_name, threading.RLock())
+
+    @_lifecycle
     def stop_app(self, app_name):
         """Stop a running application"""
+        import psutil  # slow to import, load it on first use
+
         app_meta = self.state_manager.get_app_metadata(app_name)
         if not app_meta:
-            logger.error(f"App '{app_name}' not found in metadata")
+            logger.error("App '%s' not found in metadata", app_name)
             return False
 
         if not self.state_manager.is_app_running(app_name):
-            logger.error(f"App '{app_name}' is not running")
+            logger.error("App '%s' is not running", app_name)
             return False
 
-        process = self.state_manager.get_app_process(app_name)
+        stopped = True
+        for replica in self.state_manager.get_app_replicas(app_name):
+            try:
+                self._terminate_process(app_name, replica["process"])
+            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+                logger.error("Error stopping app '%s': %s", app_name, e, exc_info=True)
+                stopped = False
+
+        # Clean up state even if a process is already gone
+        self.state_manager.remove_running_app(app_name)
+        return stopped
+
+    def _terminate_process(self, app_name, process):
+        """Terminate an app process, killing it if it does not exit in time"""
+        import psutil
+
+        logger.info(
+            "Sending terminate signal to app '%s' (PID: %s)", app_name, process.pid
+        )
+        process.terminate()
+
         try:
-            logger.info(
-                f"Sending terminate signal to app '{app_name}' (PID: {process.pid})"
+            # Wait for process to terminate using psutil
+            process.wait(timeout=config.STOP_TIMEOUT)
+            logger.info("App '%s' terminated gracefully", app_name)
+        except psutil.TimeoutExpired:
+            logger.warning(
+                "App '%s' did not terminate gracefully, forcing kill", app_name
             )
-            process.terminate()
+            process.kill()
+            logger.info("App '%s' killed", app_name)
 
-            try:
-                # Wait for process to terminate using psutil
-                process.wait(timeout=5)
-                logger.info(f"App '{app_name}' terminated gracefully")
-            except psutil.TimeoutExpired:
-                logger.warning(
-                    f"App '{app_name}' did not terminate gracefully, forcing kill"
-                )
-                process.kill()
-                logger.info(f"App '{app_name}' killed")
+    @_lifecycle
+    def delete_app(self, app_name):
+        """Stop an app and move its directory to the backup directory
 
-            self.state_manager.remove_running_app(app_name)
-            return True
+        The directory is renamed into <storage>/.backup at once and
+        compressed in the background.
 
-        except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
-            logger.error(f"Error stopping app '{app_name}': {str(e)}", exc_info=True)
-            # Clean up state even if process is already gone
-            self.state_manager.remove_running_app(app_name)
+        Returns:
+            bool: False if app not found or its directory could not be moved
+        """
+        if not self.state_manager.get_app_metadata(app_name):
+            logger.error("App '%s' not found in metadata", app_name)
             return False
+        if self.state_manager.is_app_running(app_name):
+            self.stop_app(app_name)
 
-    def restart_app(self, app_name):
-        """Restart application with code update"""
+        app_dir = os.path.join(self.storage_path, app_name)
+        if os.path.exists(app_dir):
+            try:
+                self.archiver.move_to_backup(app_dir, app_name)
+            except OSError as e:
+                logger.error("Failed to move app '%s' to backup: %s", app_name, e)
+                return False
+        self.state_manager.remove_app_metadata(app_name)
+        self.proxy_stats.remove(app_name)
+        self.events.publish("deleted", app_name)
+        self.archiver.archive_pending()
+        return True
+
+    @_lifecycle
+    def restart_app(self, app_name, full=False):
+        """Restart application with code update
+
+        Args:
+            full: Always restart, even if the pulled changes do not need it
+        """
         # First update the code
-        if not self.app_launcher.update_repository(app_name):
-            logger.error(f"Failed to update repository for app '{app_name}'")
+        changed = self._pull(app_name)
+        if changed is None:
+            logger.error("Failed to update repository for app '%s'", app_name)
             return None
+        if not full and self._update_in_place(app_name, changed):
+            return self.state_manager.get_app_port(app_name)
 
         # Stop the app if it's running
         if self.state_manager.is_app_running(app_name):
             if not self.stop_app(app_name):
-                logger.error(f"Failed to stop app '{app_name}' during restart")
+                logger.error("Failed to stop app '%s' during restart", app_name)
                 return None
 
         # Start the app with updated code
         return self.start_app(app_name)
 
+    @_lifecycle
+    def rolling_restart_app(self, app_name, full=False):
+        """Restart application with code update without downtime
+
+        The new version is started on a second port while the old one keeps
+        serving. Once the new instance passes readiness the upstream is
+        switched over, then the old instance is drained and stopped.
+
+        Args:
+            full: Always restart, even if the pulled changes do not need it
+
+        Returns:
+            dict: port plus timings in seconds: ready_time (launch until
+                readiness), switch_latency (readiness until the routes point
+                at the new instance), drain_time and total_time; or port and
+                the in-place "action" when no restart was needed; None on
+                failure
+        """
+        changed = self._pull(app_name)
+        if changed is None:
+            logger.error("Failed to update repository for app '%s'", app_name)
+            return None
+        if not full:
+            action = self._update_in_place(app_name, changed)
+            if action:
+                return {
+                    "port": self.state_manager.get_app_port(app_name),
+                    "action": action,
+                }
+        result = self._rolling_relaunch(app_name)
+        return {**result, "action": "restart"} if result else None
+
+    def _pull(self, app_name):
+        """Pull app code, keeping the code watcher from acting on the pull itself"""
+        self._watch_suppressed[app_name] = float("inf")
+        try:
+            return self.app_launcher.update_repository(app_name)
+        finally:
+            self._watch_suppressed[app_name] = time.time() + 2 * config.WATCH_DEBOUNCE
+
+    def _update_in_place(self, app_name, changed):
+        """Apply pulled changes to a running app without restarting it
+
+        Returns:
+            str: "none" or "reload" if handled in place, None if the app
+                needs a (re)start
+        """
+        if not config.INCREMENTAL_UPDATES or not self.state_manager.is_app_running(
+            app_name
+        ):
+            return None
+        app_meta = self.state_manager.get_app_metadata(app_name)
+        action = classify_changes(app_meta["type"], changed, app_meta.get("workers"))
+        logger.info(
+            "%d files of app '%s' changed, action: %s", len(changed), app_name, action
+        )
+        if action == "restart":
+            return None
+        if action == "reload":
+            self._signal_reload(app_name, app_meta, "code")
+        self.events.publish("updated", app_name, action=action, files=len(changed))
+        return action
+
+    def _reload_signal(self, app_meta):
+        """Get the signal reloading the app's workers in place, or None"""
+        type_handler = get_app_type(app_meta["type"])
+        workers = app_meta.get("workers") or type_handler.default_workers
+        return type_handler.reload_signal(workers)
+
+    def _signal_reload(self, app_name, app_meta, what):
+        """Ask the servers of all replicas to reload their code or env"""
+        import psutil
+
+        sig = getattr(signal, self._reload_signal(app_meta))
+        for replica in self.state_manager.get_app_replicas(app_name):
+            logger.info(
+                "Sending %s to app '%s' (PID: %s) to reload %s",
+                sig.name,
+                app_name,
+                replica["process"].pid,
+                what,
+            )
+            try:
+                replica["process"].send_signal(sig)
+            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+                logger.error("Failed to signal app '%s': %s", app_name, e)
+
+    @_lifecycle
+    def apply_watched_changes(self, app_name, changed):
+        """Handle in-place edits reported by the CodeWatcher"""
+        if time.time() < self._watch_suppressed.get(app_name, 0):
+            return
+        if not self.state_manager.get_app_metadata(app_name):
+            return
+        if self._update_in_place(app_name, changed) is None:
+            if self.state_manager.is_app_running(app_name):
+                logger.info("Restarting app '%s' for changed files", app_name)
+                self._relaunch(app_name)
+
+    def _relaunch(self, app_name):
+        """Restart an app without pulling code, e.g. for new env or local edits"""
+        if config.RESTART_MODE == "rolling":
+            self._rolling_relaunch(app_name)
+        elif self.stop_app(app_name):
+            self.start_app(app_name)
+
+    def _rolling_relaunch(self, app_name):
+        """Replace the running replicas of an app one by one, see rolling_restart_app"""
+        import psutil
+
+        if not self.state_manager.is_app_running(app_name):
+            port = self.start_app(app_name)
+            return {"port": port, "switch_latency": 0} if port else None
+
+        app_meta = self.state_manager.get_app_metadata(app_name)
+        env = self.env_store.resolve(app_name, app_meta["type"])
+        begin = time.time()
+        ready_time = switch_latency = drain_time = 0
+        for old_replica in self.state_manager.get_app_replicas(app_name):
+            replica_begin = time.time()
+            # No preferred port: the old instance still holds the current one
+            result = self.app_launcher.launch(
+                app_name,
+                app_meta["type"],
+                app_meta["path"],
+                env,
+                exclude=self.state_manager.get_app_ports(app_name),
+                options=self._launch_options(app_meta),
+            )
+            if not result:
+                logger.error("Failed to launch new instance of app '%s'", app_name)
+                return None
+
+            port, process = result
+            if not wait_until_ready(
+                port, process, path=readiness_path(app_meta["type"])
+            ):
+                logger.error(
+                    "New instance of app '%s' on port %s did not become ready, "
+                    "keeping the old instance",
+                    app_name,
+                    port,
+                )
+                try:
+                    self._terminate_process(app_name, process)
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    pass
+                return None
+            ready = time.time()
+            ready_time = max(ready_time, ready - replica_begin)
+
+            # Listeners (the gateway's routing table) are updated before this
+            # returns, out-of-process proxies follow on their next heartbeat
+            if not self.state_manager.replace_replica(
+                app_name, old_replica["port"], process, port
+            ):
+                logger.error(
+                    "Replica of app '%s' on port %s is gone, "
+                    "stopping its replacement on port %s",
+                    app_name,
+                    old_replica["port"],
+                    port,
+                )
+                try:
+                    self._terminate_process(app_name, process)
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    pass
+                return None
+            switched = time.time()
+            switch_latency = max(switch_latency, switched - ready)
+            logger.info(
+                "App '%s' switched from port %s to %s "
+                "(ready after %.2fs, switch-over %.3fs)",
+                app_name,
+                old_replica["port"],
+                port,
+                ready - replica_begin,
+                switched - ready,
+            )
+
+            # Let in-flight requests on the old instance finish
+            time.sleep(config.RESTART_DRAIN_TIME)
+            try:
+                self._terminate_process(app_name, old_replica["process"])
+            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+                logger.warning("Old instance of app '%s' already gone: %s", app_name, e)
+            drain_time += time.time() - switched
+
+        return {
+            "port": self.state_manager.get_app_port(app_name),
+            "ports": self.state_manager.get_app_ports(app_name),
+            "ready_time": round(ready_time, 3),
+            "switch_latency": round(switch_latency, 3),
+            "drain_time": round(drain_time, 3),
+            "total_time": round(time.time() - begin, 3),
+        }
+
     def update_access_time(self, app_name):
         """Update last access time for an app"""
         return self.state_manager.update_access_time(app_name)
@@ -97,9 +461,19 @@ class AppService:
                 "repo": am["repo"],
                 "path": am["path"],
                 "email": am["email"],
-                "running": self.state_manager.is_app_running(am["name"]),
+                # Served before startup reconciliation finishes, see "stale"
+                "running": self.state_manager.is_app_running(am["name"], wait=False),
+                "stale": self.state_manager.is_stale(am["name"]),
                 "port": am.get("port"),
                 "uptime": 0,
+                "ports": self.state_manager.get_app_ports(am["name"]),
+                "replicas": am.get("replicas", 1),
+                "workers": am.get("workers"),
+                "threads": am.get("threads"),
+                "autoscale": am.get("autoscale", False),
+                "pinned": am.get("pinned", False),
+                "priority": am.get("priority", 0),
+                "stats": self.proxy_stats.summary(am["name"]),
             }
 
             if app_info["running"]:
@@ -108,14 +482,64 @@ class AppService:
                 )  # New method needed
                 if uptime:
                     app_info["uptime"] = int(uptime)
+                app_info["last_access_time"] = self.state_manager.get_last_access_time(
+                    am["name"]
+                )
 
             all_info[am["name"]] = app_info
 
         return all_info
 
-    def create_app(self, app_name, app_type, repo, path, email, env_vars=None):
-        """Create a new application"""
+    def set_app_pin(self, app_name, pinned=None, priority=None):
+        """Protect an app from memory-pressure eviction
+
+        Args:
+            pinned: Pinned apps are never evicted
+            priority: Apps with higher priority are evicted later
+
+        Returns:
+            bool: False if app not found
+        """
+        if not self.state_manager.get_app_metadata(app_name):
+            logger.error("App '%s' not found in metadata", app_name)
+            return False
+        updates = {}
+        if pinned is not None:
+            updates["pinned"] = bool(pinned)
+        if priority is not None:
+            updates["priority"] = int(priority)
+        self.state_manager.update_app_metadata(app_name, updates)
+        return True
+
+    def create_app(
+        self,
+        app_name,
+        app_type,
+        repo,
+        path,
+        email,
+        env_vars=None,
+        replicas=1,
+        workers=None,
+        threads=None,
+        entrypoint=None,
+    ):
+        """Create a new application
+
+        Args:
+            workers: Worker processes, for app types supporting them
+            threads: Threads per worker (flask) or concurrent events (gradio)
+            entrypoint: "module:attr" of the WSGI/ASGI app, defaults to
+                <script>:app
+        """
         env_vars = env_vars or {}
+        if not get_app_type(app_type):
+            logger.error("Unsupported app type '%s' for app '%s'", app_type, app_name)
+            return False
+        if not self._valid_replica_count(app_name, replicas):
+            return False
+        if not self._valid_worker_counts(app_name, workers, threads):
+            return False
 
         # Clone repository
         app_dir = self.app_launcher.clone_repository(app_name, repo)
@@ -129,41 +553,388 @@ class AppService:
             "repo": repo,
             "path": path,
             "email": email,
-            "env": env_vars,
+            "env_version": 1 if env_vars else 0,
+            "replicas": int(replicas),
+            **self._launch_options(
+                {"workers": workers, "threads": threads, "entrypoint": entrypoint}
+            ),
             "is_active": False,
             "last_start_time": 0,
         }
 
+        self.env_store.replace(app_name, env_vars)
         self.state_manager.add_app_metadata(app_data)
+        self.events.publish("created", app_name)
         return True
 
+    @_lifecycle
     def start_app(self, app_name):
-        """Start an existing application"""
+        """Start an existing application
+
+        Returns:
+            int: Port of the app, also if it was already running, or None on
+                failure
+        """
         app_meta = self.state_manager.get_app_metadata(app_name)
         if not app_meta:
-            logger.error(f"App '{app_name}' not found in metadata")
+            logger.error("App '%s' not found in metadata", app_name)
             return None
+        # A second launch would replace the running state and orphan its processes
+        if self.state_manager.is_app_running(app_name):
+            logger.warning("App '%s' is already running, not starting it", app_name)
+            return self.state_manager.get_app_port(app_name)
 
         # Launch app with current configuration
+        env = self.env_store.resolve(app_name, app_meta["type"])
         result = self.app_launcher.launch(
             app_name,
             app_meta["type"],
             app_meta["path"],
-            app_meta.get("env", {}),
+            env,
             app_meta.get("port"),
+            options=self._launch_options(app_meta),
         )
         if not result:
             return None
 
         port, process = result
         self.state_manager.add_running_app(app_name, process, port)
+
+        replica_ports = app_meta.get("replica_ports") or []
+        for i in range(1, app_meta.get("replicas", 1)):
+            preferred = replica_ports[i] if i < len(replica_ports) else None
+            self._add_replica(app_name, app_meta, env, preferred)
+        return port
+
+    @staticmethod
+    def _launch_options(app_meta):
+        """Get the per-app launch settings kept in metadata"""
+        return {
+            key: app_meta[key]
+            for key in ("workers", "threads", "entrypoint")
+            if app_meta.get(key)
+        }
+
+    def _add_replica(self, app_name, app_meta, env, preferred_port=None):
+        """Launch one more replica of a running app on its own port"""
+        result = self.app_launcher.launch(
+            app_name,
+            app_meta["type"],
+            app_meta["path"],
+            env,
+            preferred_port,
+            exclude=self.state_manager.get_app_ports(app_name),
+            options=self._launch_options(app_meta),
+        )
+        if not result:
+            logger.error("Failed to launch replica of app '%s'", app_name)
+            return None
+        port, process = result
+        self.state_manager.add_replica(app_name, process, port)
+        logger.info("Added replica of app '%s' on port %s", app_name, port)
         return port
 
-    def update_app_env(self, app_name, env_vars):
-        """Update app environment variables"""
+    def _remove_replica(self, app_name):
+        """Drain and stop the most recently added replica of a running app"""
+        import psutil
+
+        replica = self.state_manager.get_app_replicas(app_name)[-1]
+        # Route new requests away first, then let in-flight ones finish
+        self.state_manager.remove_replica(app_name, replica["port"])
+        time.sleep(config.RESTART_DRAIN_TIME)
         try:
-            self.state_manager.save_app_env(app_name, env_vars)
-            return True
-        except Exception as e:
-            logger.error(f"Failed to update env vars for app '{app_name}': {str(e)}")
+            self._terminate_process(app_name, replica["process"])
+        except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+            logger.warning("Replica of app '%s' already gone: %s", app_name, e)
+        logger.info("Removed replica of app '%s' on port %s", app_name, replica["port"])
+
+    def _scale_running(self, app_name, count):
+        """Start or stop replicas of a running app until it has count of them"""
+        app_meta = self.state_manager.get_app_metadata(app_name)
+        env = self.env_store.resolve(app_name, app_meta["type"])
+        while len(self.state_manager.get_app_replicas(app_name)) < count:
+            if not self._add_replica(app_name, app_meta, env):
+                return False
+        while len(self.state_manager.get_app_replicas(app_name)) > count:
+            self._remove_replica(app_name)
+        return True
+
+    @staticmethod
+    def _valid_replica_count(app_name, replicas):
+        if not 1 <= int(replicas) <= config.MAX_REPLICAS:
+            logger.error("Invalid replica count %s for app '%s'", replicas, app_name)
+            return False
+        return True
+
+    @staticmethod
+    def _valid_worker_counts(app_name, workers, threads):
+        for name, value in (("workers", workers), ("threads", threads)):
+            if value is not None and not 1 <= int(value) <= config.MAX_WORKERS:
+                logger.error("Invalid %s count %s for app '%s'", name, value, app_name)
+                return False
+        return True
+
+    @_lifecycle
+    def scale_app(
+        self,
+        app_name,
+        replicas=None,
+        autoscale=None,
+        max_replicas=None,
+        workers=None,
+        threads=None,
+        max_inflight=None,
+        max_queue=None,
+    ):
+        """Set the replica count, worker model and proxy limits of an app
+
+        Args:
+            replicas: Number of replicas, also the floor for autoscaling
+            autoscale: Let autoscale() add replicas under CPU load
+            max_replicas: Ceiling for autoscaling
+            workers: Worker processes per replica, applied on next (rolling)
+                restart
+            threads: Threads per worker, applied on next (rolling) restart
+            max_inflight: Upstream requests per replica the gateway lets
+                through at once, 0 for no limit
+            max_queue: Requests the gateway queues beyond max_inflight before
+                it answers 503
+
+        Returns:
+            bool: False if app not found, the count is invalid or scaling failed
+        """
+        app_meta = self.state_manager.get_app_metadata(app_name)
+        if not app_meta:
+            logger.error("App '%s' not found in metadata", app_name)
             return False
+
+        updates = {}
+        if replicas is not None:
+            if not self._valid_replica_count(app_name, replicas):
+                return False
+            updates["replicas"] = int(replicas)
+        if not self._valid_worker_counts(app_name, workers, threads):
+            return False
+        if workers is not None:
+            updates["workers"] = int(workers)
+        if threads is not None:
+            updates["threads"] = int(threads)
+        if autoscale is not None:
+            updates["autoscale"] = bool(autoscale)
+        if max_replicas is not None:
+            updates["max_replicas"] = min(int(max_replicas), config.MAX_REPLICAS)
+        for name, value in (("max_inflight", max_inflight), ("max_queue", max_queue)):
+            if value is None:
+                continue
+            if int(value) < 0:
+                logger.error("Invalid %s %s for app '%s'", name, value, app_name)
+                return False
+            updates[name] = int(value)
+        self.state_manager.update_app_metadata(app_name, updates)
+
+        if replicas is not None and self.state_manager.is_app_running(app_name):
+            return self._scale_running(app_name, int(replicas))
+        return True
+
+    def autoscale(self):
+        """Adjust replicas of autoscaled apps by their average CPU usage
+
+        Adds a replica when the replicas average above SCALE_UP_CPU percent
+        and removes one below SCALE_DOWN_CPU, within [replicas, max_replicas].
+
+        Returns:
+            dict: app name -> new replica count for the apps that changed
+        """
+        import psutil
+
+        changes = {}
+        for am in self.state_manager.get_all_metadata():
+            app_name = am["name"]
+            replicas = self.state_manager.get_app_replicas(app_name)
+            if not am.get("autoscale") or not replicas:
+                continue
+            try:
+                # CPU usage since the previous autoscale() call
+                cpu = sum(r["process"].cpu_percent(interval=None) for r in replicas)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            cpu /= len(replicas)
+
+            count = len(replicas)
+            if cpu > config.SCALE_UP_CPU and count < am.get(
+                "max_replicas", config.MAX_REPLICAS
+            ):
+                count += 1
+            elif cpu < config.SCALE_DOWN_CPU and count > am.get("replicas", 1):
+                count -= 1
+            else:
+                continue
+
+            logger.info(
+                "Autoscaling app '%s' to %d replicas (CPU %.1f%%)",
+                app_name,
+                count,
+                cpu,
+            )
+            with self._app_lock(app_name):
+                # Stopped since the replicas were read
+                if not self.state_manager.is_app_running(app_name):
+                    continue
+                if self._scale_running(app_name, count):
+                    changes[app_name] = count
+        return changes
+
+    def update_app_env(self, app_name, env_vars, apply=None, scope="app"):
+        """Replace app environment variables
+
+        Returns:
+            dict: Diff of the change (see EnvStore.replace), or None on failure
+        """
+        return self.patch_app_env(app_name, replace=env_vars, apply=apply, scope=scope)
+
+    @_lifecycle
+    def patch_app_env(
+        self,
+        app_name,
+        set_vars=None,
+        unset=None,
+        replace=None,
+        apply=None,
+        scope="app",
+    ):
+        """Change app environment variables and apply them to the running app
+
+        Args:
+            app_name: Name of the app
+            set_vars: Variables to add or change
+            unset: Names of variables to remove
+            replace: Full set of variables replacing the current ones
+            apply: How a running app picks up the change: "none", "reload"
+                or "restart". "reload" restarts the workers in place for types
+                with a reload signal, apps re-reading $APPNANNY_ENV_FILE then
+                see the change; other types are restarted. Defaults to the
+                app's "env_apply" metadata or config.ENV_APPLY_MODE. Nothing
+                is applied if the env is unchanged.
+            scope: "app" or "secret", see patch_shared_env() for the others
+
+        Returns:
+            dict: Diff of the change, values of secrets masked, or None on
+                failure
+        """
+        app_meta = self.state_manager.get_app_metadata(app_name)
+        if not app_meta:
+            logger.error("App '%s' not found in metadata", app_name)
+            return None
+        if scope not in ("app", "secret"):
+            logger.error("Env scope '%s' is not per app", scope)
+            return None
+
+        try:
+            if replace is not None:
+                diff = self.env_store.replace(app_name, replace, scope)
+            else:
+                diff = self.env_store.update(app_name, set_vars, unset, scope)
+        except Exception as e:
+            logger.error("Failed to update env vars for app '%s': %s", app_name, e)
+            return None
+
+        if not any(diff.values()):
+            logger.info("Env of app '%s' unchanged, nothing to apply", app_name)
+        else:
+            self._env_changed(app_name, diff, apply)
+        if scope == "secret":
+            for section in ("added", "changed"):
+                diff[section] = {k: "***" for k in diff[section]}
+        return diff
+
+    def patch_shared_env(
+        self, scope, app_type=None, set_vars=None, unset=None, replace=None, apply=None
+    ):
+        """Change global or per-type variables and apply them to affected apps
+
+        Only apps whose merged env changes are touched, a variable the app
+        or secret scope overrides makes no difference to them.
+
+        Args:
+            scope: "global" or "type"
+            app_type: Type whose variables change, for the "type" scope
+            apply: See patch_app_env(), the "env_apply" of each app applies
+                when not given
+
+        Returns:
+            dict: "diff" of the scope and "apps" whose env changed, or None
+                on failure
+        """
+        if scope not in ("global", "type"):
+            logger.error("Env scope '%s' is not shared", scope)
+            return None
+        if scope == "type" and not get_app_type(app_type):
+            logger.error("Unsupported app type '%s'", app_type)
+            return None
+
+        affected = [
+            am
+            for am in self.state_manager.get_all_metadata()
+            if scope == "global" or am["type"] == app_type
+        ]
+        before = {
+            am["name"]: self.env_store.merged(am["name"], am["type"]) for am in affected
+        }
+        try:
+            if replace is not None:
+                diff = self.env_store.replace(None, replace, scope, app_type)
+            else:
+                diff = self.env_store.update(None, set_vars, unset, scope, app_type)
+        except Exception as e:
+            logger.error("Failed to update %s env vars: %s", scope, e)
+            return None
+
+        apps = []
+        for am in affected:
+            app_diff = self.env_store.diff(
+                before[am["name"]], self.env_store.merged(am["name"], am["type"])
+            )
+            if any(app_diff.values()):
+                with self._app_lock(am["name"]):
+                    self._env_changed(am["name"], app_diff, apply)
+                apps.append(am["name"])
+        return {"diff": diff, "apps": apps}
+
+    def _env_changed(self, app_name, diff, apply):
+        """Record an env change of an app and apply it if the app runs"""
+        app_meta = self.state_manager.get_app_metadata(app_name)
+        if not app_meta:
+            return  # deleted meanwhile
+        self.state_manager.update_app_metadata(
+            app_name, {"env_version": app_meta.get("env_version", 0) + 1}
+        )
+        logger.info(
+            "Env of app '%s' changed: %d added, %d changed, %d removed",
+            app_name,
+            len(diff["added"]),
+            len(diff["changed"]),
+            len(diff["removed"]),
+        )
+
+        if self.state_manager.is_app_running(app_name):
+            apply = apply or app_meta.get("env_apply", config.ENV_APPLY_MODE)
+            self._apply_env_change(app_name, apply)
+
+    def _apply_env_change(self, app_name, apply):
+        """Make a running app pick up changed env vars"""
+        if apply == "reload":
+            app_meta = self.state_manager.get_app_metadata(app_name)
+            if self._reload_signal(app_meta):
+                self.env_store.export(app_name, app_meta["type"])
+                self._signal_reload(app_name, app_meta, "env")
+                return
+            # Streamlit, voila and single-process servers exit on the signal
+            logger.info(
+                "App type '%s' cannot reload env in place, restarting app '%s'",
+                app_meta["type"],
+                app_name,
+            )
+            apply = "restart"
+        if apply == "restart":
+            # No code update here, only a new process with the new env
+            self._relaunch(app_name)
@@ -1,53 +1,190 @@
 import os
-import json
+import threading
 import time
 
-import psutil
-from dotenv import dotenv_values
-
 from logging_config import logger
+from config import active_config as config
 from pid_manager import PIDManager
+from app_store import AppStore
+from state_snapshot import SNAPSHOT_FILE, load_snapshot, save_snapshot
 
 
 class AppStateManager:
-    def __init__(self, metadata_file, storage_path):
+    def __init__(self, storage_path):
         """Initialize AppStateManager
 
         Args:
-            metadata_file: Path to metadata JSON file
-            storage_path: Base path for app storage
+            storage_path: Base path for app storage, metadata is kept per app
+                in <storage_path>/<app>/.appnanny/
         """
-        self.metadata_file = metadata_file
-        self.storage_path = storage_path  # Add this line
+        self.storage_path = storage_path
+        self._store = AppStore(storage_path)
         self._pid_manager = PIDManager(storage_path)  # Internal dependency
         self.running_apps = {}
         self.apps_metadata = []
-
-        self.load_metadata()
-        self._recover_running_state()
+        self._listeners = []
+        self._metadata_listeners = []
+        self._access_scores = {}  # app_name -> (score, timestamp)
+        self._access_scores_saved = {}  # app_name -> last save timestamp
+        self.snapshot_file = os.path.join(storage_path, SNAPSHOT_FILE)
+        # Apps whose running state is not verified yet, see _reconcile()
+        self._stale = set()
+        self._reconciled = threading.Event()
+
+        # Answer from the snapshot of the last clean shutdown if there is one,
+        # checking PIDs and changed metadata files in the background
+        snapshot = load_snapshot(self.snapshot_file)
+        if snapshot:
+            self._load_snapshot(snapshot)
+        else:
+            self.load_metadata()
+            self._stale = {am["name"] for am in self.apps_metadata}
+        threading.Thread(
+            target=self._reconcile, args=(snapshot,), name="reconcile", daemon=True
+        ).start()
 
     def load_metadata(self):
-        """Load apps metadata from file"""
-        if os.path.exists(self.metadata_file):
+        """Load apps metadata, migrating the central file of older versions"""
+        self._store.migrate_legacy(
+            os.path.join(self.storage_path, config.METADATA_FILE)
+        )
+        self.apps_metadata = self._store.load_all()
+
+    def _load_snapshot(self, snapshot):
+        """Take metadata and unverified running state from a snapshot"""
+        self.apps_metadata = snapshot["apps_metadata"]
+        for app_name, entry in snapshot["running"].items():
+            replicas = [
+                {"process": None, "port": port} for _, port, _ in entry["replicas"]
+            ]
+            self.running_apps[app_name] = {
+                "process": None,
+                "port": replicas[0]["port"],
+                "start_time": entry["start_time"],
+                "last_access_time": entry["last_access_time"],
+                "replicas": replicas,
+            }
+        self._stale = set(self.running_apps)
+        logger.info(
+            "Loaded state snapshot with %d apps, %d running",
+            len(self.apps_metadata),
+            len(self.running_apps),
+        )
+
+    def save_snapshot(self):
+        """Write metadata and running state for a fast next startup
+
+        Meant for clean shutdown, the snapshot is consumed on the next start.
+        """
+        import psutil  # slow to import, load it on first use
+
+        for app_name in list(self._access_scores):
+            self._save_access_score(app_name)
+        # Metadata files are current afterwards, matching the snapshot
+        if not self._store.checkpoint() or not self._reconciled.is_set():
+            return
+
+        running = {}
+        for app_name, entry in list(self.running_apps.items()):
             try:
-                with open(self.metadata_file, "r") as f:
-                    self.apps_metadata = json.load(f)
-            except json.JSONDecodeError:
-                logger.error("Failed to load metadata file")
-                self.apps_metadata = []
-
-    def save_metadata(self):
-        """Save apps metadata to file"""
+                running[app_name] = {
+                    "start_time": entry["start_time"],
+                    "last_access_time": entry["last_access_time"],
+                    # create_time tells a live process from a reused PID
+                    "replicas": [
+                        [r["process"].pid, r["port"], r["process"].create_time()]
+                        for r in entry["replicas"]
+                    ],
+                }
+            except psutil.Error:
+                continue
+        save_snapshot(
+            self.snapshot_file,
+            {
+                "apps_metadata": self.apps_metadata,
+                "metadata_mtimes": {
+                    am["name"]: self._store.metadata_mtime(am["name"])
+                    for am in self.apps_metadata
+                },
+                "running": running,
+            },
+        )
+        logger.info("Saved state snapshot with %d running apps", len(running))
+
+    def _reconcile(self, snapshot):
+        """Verify the state loaded at startup against disk and process table"""
         try:
-            with open(self.metadata_file, "w") as f:
-                json.dump(self.apps_metadata, f, indent=2)
-        except Exception as e:
-            logger.error(f"Failed to save metadata: {str(e)}")
+            if snapshot:
+                self._refresh_metadata(snapshot["metadata_mtimes"])
+                self._verify_processes(snapshot["running"])
+            else:
+                self._recover_running_state()
+        except Exception:
+            logger.exception("Failed to reconcile app state")
+        finally:
+            self._stale.clear()
+            self._reconciled.set()
+
+    def _refresh_metadata(self, mtimes):
+        """Reload metadata if app files changed after the snapshot was taken"""
+        names = [am["name"] for am in self.apps_metadata]
+        if self._store.app_names() != names or any(
+            self._store.metadata_mtime(name) != mtimes.get(name) for name in names
+        ):
+            logger.info("App metadata changed since the snapshot, reloading")
+            self.load_metadata()
+
+    def _verify_processes(self, running):
+        """Check that the processes in a snapshot still run"""
+        import psutil
+
+        for app_name, entry in running.items():
+            replicas = []
+            for pid, port, create_time in entry["replicas"]:
+                try:
+                    process = psutil.Process(pid)
+                    if (
+                        abs(process.create_time() - create_time) < 1
+                        and process.status() != psutil.STATUS_ZOMBIE
+                    ):
+                        replicas.append({"process": process, "port": port})
+                except psutil.Error:
+                    pass
+
+            if not replicas or not self.get_app_metadata(app_name):
+                logger.info("App '%s' from the snapshot is no longer running", app_name)
+                del self.running_apps[app_name]
+                self._pid_manager.remove_pid(app_name)
+                self._notify(app_name)
+                continue
+            running_entry = self.running_apps[app_name]
+            running_entry["replicas"] = replicas
+            if len(replicas) < len(entry["replicas"]):
+                self._replicas_changed(app_name)
+            else:
+                running_entry["process"] = replicas[0]["process"]
+            self._stale.discard(app_name)
+
+    def wait_until_reconciled(self):
+        """Block until the startup state has been verified"""
+        self._reconciled.wait()
+
+    def is_stale(self, app_name):
+        """Check whether the running state of an app is not verified yet"""
+        return app_name in self._stale
 
     def add_app_metadata(self, app_data):
         """Add new app to metadata"""
         self.apps_metadata.append(app_data)
-        self.save_metadata()
+        self._store.add(app_data)
+
+    def remove_app_metadata(self, app_name):
+        """Forget an app, its directory is left to the caller"""
+        self.apps_metadata = [am for am in self.apps_metadata if am["name"] != app_name]
+        self._access_scores.pop(app_name, None)
+        self._access_scores_saved.pop(app_name, None)
+        self._store.remove(app_name)
+        self._notify_metadata(app_name, None)
 
     def update_app_status(self, app_name, is_active, port=None):
         """Update app status in metadata"""
@@ -59,15 +196,29 @@ class AppStateManager:
                 am["last_start_time"] = (
                     time.time() if is_active else am.get("last_start_time", 0)
                 )
-                self.save_metadata()
+                self._store.save(am)
                 break
 
-    def update_app_metadata(self, app_name, updates):
-        """Update metadata for an app"""
+    def update_app_metadata(self, app_name, updates, durable=True):
+        """Update metadata for an app
+
+        Args:
+            durable: Wait until the change is on disk, see AppStore.save()
+        """
         for am in self.apps_metadata:
             if am["name"] == app_name:
                 am.update(updates)
-                self.save_metadata()
+                self._store.save(am, durable)
+                self._notify_metadata(app_name, am)
+                break
+
+    def remove_app_metadata_keys(self, app_name, keys):
+        """Remove fields from the metadata of an app"""
+        for am in self.apps_metadata:
+            if am["name"] == app_name:
+                for key in keys:
+                    am.pop(key, None)
+                self._store.save(am)
                 break
 
     def get_all_metadata(self):
@@ -78,27 +229,132 @@ class AppStateManager:
         """
         return self.apps_metadata.copy()  # Return a copy to prevent direct modification
 
+    def add_listener(self, callback):
+        """Register a callback for upstream changes
+
+        Args:
+            callback: Called as callback(app_name, ports) whenever an app starts,
+                stops, gains or loses a replica or moves to new ports (ports is
+                an empty list when stopped)
+        """
+        self._listeners.append(callback)
+
+    def add_metadata_listener(self, callback):
+        """Register a callback for metadata changes
+
+        Args:
+            callback: Called as callback(app_name, app_meta) after
+                update_app_metadata(), with app_meta None once the app is
+                removed
+        """
+        self._metadata_listeners.append(callback)
+
+    def _notify_metadata(self, app_name, app_meta):
+        for callback in self._metadata_listeners:
+            try:
+                callback(app_name, app_meta)
+            except Exception as e:
+                logger.error("Metadata listener failed for app '%s': %s", app_name, e)
+
+    def _notify(self, app_name):
+        """Notify listeners about an upstream change"""
+        ports = self.get_app_ports(app_name)
+        for callback in self._listeners:
+            try:
+                callback(app_name, ports)
+            except Exception as e:
+                logger.error("State listener failed for app '%s': %s", app_name, e)
+
     # Runtime state operations (no save needed)
     def add_running_app(self, app_name, process, port):
-        """Add a running app to runtime state"""
+        """Add a running app to runtime state with its first replica"""
         self.running_apps[app_name] = {
             "process": process,
             "port": port,
             "start_time": time.time(),
             "last_access_time": time.time(),
+            "replicas": [{"process": process, "port": port}],
+        }
+        self._replicas_changed(app_name, started=True)
+
+    def add_replica(self, app_name, process, port):
+        """Add another replica to a running app"""
+        entry = self.running_apps[app_name]
+        entry["replicas"] = entry["replicas"] + [{"process": process, "port": port}]
+        self._replicas_changed(app_name)
+
+    def replace_replica(self, app_name, old_port, process, port):
+        """Atomically point one replica of a running app at a new process and port
+
+        Used by rolling restarts: the replica list is swapped as a whole, so
+        readers see either the old or the new set, never a partial update.
+
+        Returns:
+            dict: The previous replica entry, or None if it was not found
+        """
+        entry = self.running_apps.get(app_name)
+        if not entry:
+            return None
+        replicas = list(entry["replicas"])
+        for i, replica in enumerate(replicas):
+            if replica["port"] == old_port:
+                replicas[i] = {"process": process, "port": port}
+                entry["replicas"] = replicas
+                if i == 0:
+                    entry["start_time"] = time.time()
+                self._replicas_changed(app_name)
+                return replica
+        return None
+
+    def remove_replica(self, app_name, port):
+        """Remove one replica of a running app, the last one stops the app
+
+        Returns:
+            dict: The removed replica entry, or None if it was not found
+        """
+        entry = self.running_apps.get(app_name)
+        if not entry:
+            return None
+        removed = next((r for r in entry["replicas"] if r["port"] == port), None)
+        if removed is None:
+            return None
+        replicas = [r for r in entry["replicas"] if r is not removed]
+        if not replicas:
+            self.remove_running_app(app_name)
+            return removed
+        entry["replicas"] = replicas
+        self._replicas_changed(app_name)
+        return removed
+
+    def _replicas_changed(self, app_name, started=False):
+        """Sync primary fields, PID file and persistent state with the replicas"""
+        entry = self.running_apps[app_name]
+        primary = entry["replicas"][0]
+        entry["process"] = primary["process"]
+        entry["port"] = primary["port"]
+        self._pid_manager.save_pids(
+            app_name, [r["process"].pid for r in entry["replicas"]]
+        )
+        updates = {
+            "is_active": True,
+            "port": primary["port"],
+            "replica_ports": [r["port"] for r in entry["replicas"]],
         }
-        # Save PID and update persistent state
-        self._pid_manager.save_pid(app_name, process.pid)
-        self.update_app_status(app_name, True, port)
+        if started:
+            updates["last_start_time"] = time.time()
+        self.update_app_metadata(app_name, updates)
+        self._notify(app_name)
 
     def remove_running_app(self, app_name):
         """Remove a running app from runtime state"""
         if app_name in self.running_apps:
             # Clean up PID file first
             self._pid_manager.remove_pid(app_name)
+            self._save_access_score(app_name)
             del self.running_apps[app_name]
             # Update persistent state
             self.update_app_status(app_name, False)
+            self._notify(app_name)
 
     def get_app_metadata(self, app_name):
         """Get metadata for an app"""
@@ -107,10 +363,55 @@ class AppStateManager:
     def update_access_time(self, app_name):
         """Update last access time for an app"""
         if app_name in self.running_apps:
-            self.running_apps[app_name]["last_access_time"] = time.time()
+            now = time.time()
+            self.running_apps[app_name]["last_access_time"] = now
+            self._access_scores[app_name] = (self.get_access_score(app_name) + 1, now)
+            if (
+                now - self._access_scores_saved.get(app_name, 0)
+                > config.ACCESS_SCORE_FLUSH_INTERVAL
+            ):
+                self._save_access_score(app_name)
             return True
         return False
 
+    def get_access_score(self, app_name):
+        """Get recent access frequency of an app
+
+        Every access adds 1, and the score halves every ACCESS_SCORE_HALF_LIFE
+        seconds. It is persisted in metadata so it survives restarts.
+
+        Returns:
+            float: Decayed access count
+        """
+        if app_name in self._access_scores:
+            score, since = self._access_scores[app_name]
+        else:
+            am = self.get_app_metadata(app_name) or {}
+            score, since = am.get("access_score", 0), am.get("access_score_time", 0)
+        return score * 0.5 ** ((time.time() - since) / config.ACCESS_SCORE_HALF_LIFE)
+
+    def _save_access_score(self, app_name):
+        """Persist the access score of an app to metadata"""
+        if app_name not in self._access_scores:
+            return
+        score, since = self._access_scores[app_name]
+        self._access_scores_saved[app_name] = time.time()
+        self.update_app_metadata(
+            app_name,
+            {"access_score": round(score, 3), "access_score_time": since},
+            durable=False,
+        )
+
+    def get_last_access_time(self, app_name):
+        """Get last access time of a running app
+
+        Returns:
+            float: Timestamp of the last access, or None if app not running
+        """
+        if app_name in self.running_apps:
+            return self.running_apps[app_name]["last_access_time"]
+        return None
+
     def get_app_uptime(self, app_name):
         """Get uptime for a running app
 
@@ -124,15 +425,19 @@ class AppStateManager:
             return time.time() - self.running_apps[app_name]["start_time"]
         return None
 
-    def is_app_running(self, app_name):
+    def is_app_running(self, app_name, wait=True):
         """Check if an app is currently running
 
         Args:
             app_name: Name of the app
+            wait: Wait for startup reconciliation; without waiting the answer
+                may come from an unverified snapshot, see is_stale()
 
         Returns:
             bool: True if app is running, False otherwise
         """
+        if wait:
+            self._reconciled.wait()
         return app_name in self.running_apps
 
     def get_app_port(self, app_name):
@@ -148,6 +453,27 @@ class AppStateManager:
             return self.running_apps[app_name]["port"]
         return None
 
+    def get_app_ports(self, app_name):
+        """Get the ports of all replicas of a running app
+
+        Returns:
+            list: Port numbers, empty if app not running
+        """
+        if app_name in self.running_apps:
+            return [r["port"] for r in self.running_apps[app_name]["replicas"]]
+        return []
+
+    def get_app_replicas(self, app_name):
+        """Get the replicas of a running app
+
+        Returns:
+            list: Dicts with "process" and "port", empty if app not running
+        """
+        self._reconciled.wait()
+        if app_name in self.running_apps:
+            return list(self.running_apps[app_name]["replicas"])
+        return []
+
     def get_app_process(self, app_name):
         """Get the process object for a running app
 
@@ -157,60 +483,49 @@ class AppStateManager:
         Returns:
             subprocess.Popen: Process object, or None if app not running
         """
+        self._reconciled.wait()
         if app_name in self.running_apps:
             return self.running_apps[app_name]["process"]
         return None
 
     def _recover_running_state(self):
         """Recover running state from disk during initialization"""
+        import psutil
+
         logger.info("Recovering running apps state from disk")
         for am in self.apps_metadata:
             app_name = am["name"]
-            pid = self._pid_manager.get_pid(app_name)
-            if pid and self._pid_manager.is_process_running(pid):
+            ports = am.get("replica_ports") or [am.get("port")]
+            replicas = []
+            for pid, port in zip(self._pid_manager.get_pids(app_name), ports):
+                if not self._pid_manager.is_process_running(pid):
+                    continue
                 try:
                     # Create psutil.Process object for the existing process
                     process = psutil.Process(pid)
-                    logger.info(f"Found running app '{app_name}' with PID {pid}")
-                    self.running_apps[app_name] = {
-                        "process": process,  # Use psutil.Process instead of subprocess.Popen
-                        "port": am["port"],
-                        "start_time": process.create_time(),  # Get actual process start time
-                        "last_access_time": time.time(),
-                    }
+                    logger.info(
+                        "Found running app '%s' with PID %s on port %s",
+                        app_name,
+                        pid,
+                        port,
+                    )
+                    replicas.append({"process": process, "port": port})
                 except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
                     logger.warning(
-                        f"Could not recover process for app '{app_name}': {str(e)}"
+                        "Could not recover process for app '%s': %s", app_name, e
                     )
-                    self._pid_manager.remove_pid(app_name)
-                    self.update_app_status(app_name, False)
-
-    def _get_env_file_path(self, app_name):
-        """Get path to env file for an app"""
-        return os.path.join(self.storage_path, app_name, ".env")
-
-    def load_app_env(self, app_name):
-        """Load environment variables from .env file"""
-        env_file = self._get_env_file_path(app_name)
-        if os.path.exists(env_file):
-            return dotenv_values(env_file)
-        return {}
-
-    def save_app_env(self, app_name, env_vars):
-        """Save environment variables to .env file"""
-        env_file = self._get_env_file_path(app_name)
-        app_dir = os.path.dirname(env_file)
-        if not os.path.exists(app_dir):
-            os.makedirs(app_dir)
-
-        # Clear existing file
-        with open(env_file, "w") as f:
-            for key, value in env_vars.items():
-                f.write(f"{key}={value}\n")
-
-        # Update metadata
-        for am in self.apps_metadata:
-            if am["name"] == app_name:
-                am["env"] = env_vars
-                self.save_metadata()
-                break
+
+            if replicas:
+                self.running_apps[app_name] = {
+                    "process": replicas[0]["process"],
+                    "port": replicas[0]["port"],
+                    # Get actual process start time
+                    "start_time": replicas[0]["process"].create_time(),
+                    "last_access_time": time.time(),
+                    "replicas": replicas,
+                }
+                self._stale.discard(app_name)
+                self._notify(app_name)
+            elif self._pid_manager.get_pids(app_name):
+                # Stale PID file; is_active stays set so the app can be restored
+                self._pid_manager.remove_pid(app_name)
@@ -0,0 +1,398 @@
+import copy
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+
+from logging_config import logger
+from state_journal import JOURNAL_FILE, StateJournal
+
+# Per-app state lives next to the code, ignored by the app's git checkout
+STATE_DIR = ".appnanny"
+METADATA_FILE = "metadata.json"
+INDEX_FILE = ".appnanny_index.json"
+BACKUP_DIR = ".backup"
+
+
+def state_dir(storage_path, app_name):
+    """Get the directory holding AppNanny's state of one app"""
+    return os.path.join(storage_path, app_name, STATE_DIR)
+
+
+def exclude_from_git(app_dir):
+    """Keep the state directory out of `git status` of an app checkout"""
+    exclude_file = os.path.join(app_dir, ".git", "info", "exclude")
+    if not os.path.exists(os.path.join(app_dir, ".git")):
+        return
+    try:
+        os.makedirs(os.path.dirname(exclude_file), exist_ok=True)
+        existing = ""
+        if os.path.exists(exclude_file):
+            with open(exclude_file) as f:
+                existing = f.read()
+        if f"{STATE_DIR}/" not in existing.splitlines():
+            with open(exclude_file, "a") as f:
+                f.write(f"\n{STATE_DIR}/\n")
+    except OSError as e:
+        logger.warning("Failed to update git excludes in %s: %s", app_dir, e)
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over the target
+
+    Both the file and the rename are synced, so after a crash the target
+    holds either the old or the new content, never a truncated file.
+    """
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+    dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class AppStore:
+    """Per-app metadata files plus a rebuildable index of app names
+
+        <storage>/<app>/.appnanny/metadata.json   metadata of one app
+        <storage>/.appnanny_index.json            names of all apps
+
+        <storage>/.appnanny_journal               changes since the last
+                                                  checkpoint
+
+    Changes go to the write-ahead journal first, the per-app files are
+    rewritten at checkpoints only, so frequent updates cost an append
+    instead of a file rewrite and fsync each. The journal is replayed on
+    startup. The index only changes when apps are added or removed, and is
+    rebuilt by scanning the storage directory when it is missing or out of
+    date.
+    """
+
+    def __init__(self, storage_path):
+        self.storage_path = storage_path
+        self.index_file = os.path.join(storage_path, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._dirty = {}  # app_name -> metadata not checkpointed yet
+        os.makedirs(storage_path, exist_ok=True)
+        self._journal = StateJournal(os.path.join(storage_path, JOURNAL_FILE))
+        self._replay(self._journal.replay())
+        self._journal.start(self.checkpoint)
+
+    def metadata_path(self, app_name):
+        return os.path.join(state_dir(self.storage_path, app_name), METADATA_FILE)
+
+    def load_all(self):
+        """Load metadata of all apps, including changes not checkpointed yet
+
+        Returns:
+            list: Metadata dicts in index order
+        """
+        names = self._read_index()
+        if names is None:
+            names = self.rebuild_index()
+
+        apps_metadata = []
+        for app_name in names:
+            app_meta = self._load(app_name)
+            if app_meta is None:
+                # Index points at a removed app, scan again
+                return self._load_scanned()
+            apps_metadata.append(app_meta)
+        return apps_metadata
+
+    def app_names(self):
+        """Get app names from the index, None if it is missing or unreadable"""
+        return self._read_index()
+
+    def metadata_mtime(self, app_name):
+        """Get the modification time of an app's metadata file, or None"""
+        try:
+            return os.stat(self.metadata_path(app_name)).st_mtime_ns
+        except OSError:
+            return None
+
+    def save(self, app_meta, durable=True):
+        """Persist the metadata of one app
+
+        Args:
+            durable: Return only once the change is on disk; frequent, cheap
+                to lose updates pass False and are synced in the background
+
+        Returns:
+            bool: False if the journal could not be written, the change is
+                kept in memory and retried in the background
+        """
+        with self._lock:
+            self._dirty[app_meta["name"]] = copy.deepcopy(app_meta)
+            seq = self._journal.append({"op": "save", "meta": app_meta})
+        if durable:
+            # Waiting outside the lock lets concurrent saves share an fsync,
+            # and a checkpoint due meanwhile needs the lock
+            return self._wait(seq, app_meta["name"])
+        return True
+
+    def checkpoint(self):
+        """Write changed metadata files and empty the journal
+
+        The journal is only emptied once every file is written, files that
+        failed stay pending for the next checkpoint.
+
+        Returns:
+            bool: True if all changes are in the metadata files
+        """
+        with self._lock:
+            self._dirty = {
+                app_name: app_meta
+                for app_name, app_meta in self._dirty.items()
+                if not self._write_metadata(app_meta)
+            }
+            if self._dirty:
+                logger.warning(
+                    "Checkpoint incomplete, keeping the journal for %d apps",
+                    len(self._dirty),
+                )
+                return False
+            self._journal.reset()
+            return True
+
+    def _wait(self, seq, app_name):
+        try:
+            self._journal.wait(seq)
+            return True
+        except OSError as e:
+            logger.error("Failed to journal metadata of app '%s': %s", app_name, e)
+            return False
+
+    def _write_metadata(self, app_meta):
+        """Write the metadata file of an app
+
+        Returns:
+            bool: False if it could not be written; True also when the app
+                directory is gone, e.g. moved to the backup by a delete
+        """
+        try:
+            try:
+                # Not makedirs, which would bring back a deleted app directory
+                os.mkdir(state_dir(self.storage_path, app_meta["name"]))
+            except FileExistsError:
+                pass
+            write_json_atomic(self.metadata_path(app_meta["name"]), app_meta)
+            return True
+        except FileNotFoundError:
+            logger.info("App '%s' was removed, not saving it", app_meta["name"])
+            return True
+        except OSError as e:
+            logger.error("Failed to save metadata of app '%s': %s", app_meta["name"], e)
+            return False
+
+    def _replay(self, records):
+        """Apply journal records left by a crash to the metadata files"""
+        if not records:
+            return
+        latest = {}  # app_name -> metadata, None once removed
+        for record in records:
+            if record["op"] == "save":
+                latest[record["meta"]["name"]] = record["meta"]
+            elif record["op"] == "remove":
+                latest[record["app"]] = None
+        for app_name, app_meta in latest.items():
+            # Deleted apps have their directory moved away already
+            if app_meta and os.path.isdir(os.path.join(self.storage_path, app_name)):
+                self._dirty[app_name] = app_meta
+        self.checkpoint()
+        self.rebuild_index()
+
+    def add(self, app_meta):
+        """Persist a new app and add it to the index"""
+        self.save(app_meta)
+        with self._lock:
+            names = self._read_index() or []
+            if app_meta["name"] not in names:
+                self._write_index(names + [app_meta["name"]])
+
+    def remove(self, app_name):
+        """Drop an app from the index, its directory is handled by the caller"""
+        with self._lock:
+            self._dirty.pop(app_name, None)
+            seq = self._journal.append({"op": "remove", "app": app_name})
+            names = self._read_index() or []
+            self._write_index([n for n in names if n != app_name])
+        self._wait(seq, app_name)
+
+    def rebuild_index(self):
+        """Recreate the index from the app directories on disk
+
+        Returns:
+            list: App names found
+        """
+        names = []
+        if os.path.isdir(self.storage_path):
+            for entry in sorted(os.listdir(self.storage_path)):
+                if not entry.startswith(".") and os.path.exists(
+                    self.metadata_path(entry)
+                ):
+                    names.append(entry)
+        with self._lock:
+            # New apps have no metadata file before the next checkpoint
+            names += sorted(set(self._dirty) - set(names))
+            self._write_index(names)
+        logger.info("Rebuilt app index with %d apps", len(names))
+        return names
+
+    def _load_scanned(self):
+        return [
+            app_meta
+            for app_meta in map(self._load, self.rebuild_index())
+            if app_meta is not None
+        ]
+
+    def _load(self, app_name):
+        """Get the pending metadata of an app, else that of its file"""
+        with self._lock:
+            app_meta = self._dirty.get(app_name)
+            if app_meta is not None:
+                return copy.deepcopy(app_meta)
+        return self._read_metadata(app_name)
+
+    def _read_metadata(self, app_name):
+        try:
+            with open(self.metadata_path(app_name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error("Failed to load metadata of app '%s': %s", app_name, e)
+            return None
+
+    def _read_index(self):
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)["apps"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("App index unreadable, rebuilding: %s", e)
+            return None
+
+    def _write_index(self, names):
+        try:
+            os.makedirs(self.storage_path, exist_ok=True)
+            write_json_atomic(self.index_file, {"apps": names})
+        except OSError as e:
+            logger.error("Failed to write app index: %s", e)
+
+    def migrate_legacy(self, legacy_file):
+        """Split a central apps_metadata.json of older versions into app dirs
+
+        PID files, env files and logs kept directly in the app directory are
+        moved into its state directory as well. The legacy file is renamed,
+        not deleted.
+        """
+        if not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file) as f:
+                apps_metadata = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to read legacy metadata file %s: %s", legacy_file, e)
+            return
+
+        logger.info("Migrating %d apps to per-app state dirs", len(apps_metadata))
+        for app_meta in apps_metadata:
+            app_name = app_meta["name"]
+            app_dir = os.path.join(self.storage_path, app_name)
+            target_dir = state_dir(self.storage_path, app_name)
+            os.makedirs(target_dir, exist_ok=True)
+            for name in ("app.pid", ".env", ".env.secret", "logs"):
+                old_path = os.path.join(app_dir, name)
+                new_path = os.path.join(target_dir, name)
+                if os.path.exists(old_path) and not os.path.exists(new_path):
+                    os.replace(old_path, new_path)
+            if not os.path.exists(self.metadata_path(app_name)):
+                self._write_metadata(app_meta)
+            exclude_from_git(app_dir)
+
+        self.rebuild_index()
+        os.replace(legacy_file, f"{legacy_file}.migrated")
+
+
+class Archiver:
+    """Compress deleted app directories in the background
+
+    Deleting an app renames its directory into <storage>/.backup, which is
+    atomic and instant. This worker then packs each directory there into a
+    .tar.zst (zstd CLI) or .tar.gz and removes it. Directories left over by
+    an interrupted run are picked up on the next one.
+    """
+
+    def __init__(self, storage_path):
+        self.backup_dir = os.path.join(storage_path, BACKUP_DIR)
+        self._lock = threading.Lock()
+
+    def move_to_backup(self, app_dir, app_name):
+        """Atomically move an app directory into the backup directory
+
+        Returns:
+            str: New path of the directory
+        """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        target = os.path.join(
+            self.backup_dir, f"{app_name}-{time.strftime('%Y%m%d%H%M%S')}"
+        )
+        os.rename(app_dir, target)
+        logger.info("Moved app '%s' to %s", app_name, target)
+        return target
+
+    def archive_pending(self):
+        """Archive all uncompressed directories in a background thread"""
+        if not os.path.isdir(self.backup_dir):
+            return
+        threading.Thread(target=self._archive_all, name="archiver", daemon=True).start()
+
+    def _archive_all(self):
+        # One archiver at a time, a concurrent call finds the work done
+        with self._lock:
+            for entry in sorted(os.listdir(self.backup_dir)):
+                path = os.path.join(self.backup_dir, entry)
+                if os.path.isdir(path):
+                    self._archive(path)
+
+    def _archive(self, path):
+        name = os.path.basename(path)
+        begin = time.time()
+        try:
+            if shutil.which("zstd"):
+                archive = f"{path}.tar.zst"
+                subprocess.run(
+                    [
+                        "tar",
+                        "--use-compress-program",
+                        "zstd -T0",
+                        "-cf",
+                        f"{archive}.tmp",
+                        "-C",
+                        self.backup_dir,
+                        name,
+                    ],
+                    check=True,
+                    capture_output=True,
+                )
+            else:
+                archive = f"{path}.tar.gz"
+                with tarfile.open(f"{archive}.tmp", "w:gz") as tar:
+                    tar.add(path, arcname=name)
+            os.replace(f"{archive}.tmp", archive)
+            shutil.rmtree(path)
+        except (OSError, subprocess.CalledProcessError, tarfile.TarError) as e:
+            # The uncompressed directory stays as the backup
+            logger.error("Failed to archive %s: %s", path, e)
+            return
+        logger.info("Archived %s in %.1fs", archive, time.time() - begin)
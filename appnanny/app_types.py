@@ -0,0 +1,177 @@
+import importlib
+import os
+import shutil
+from abc import ABC, abstractmethod
+
+from config import active_config as config
+from logging_config import logger
+
+
+class AppType(ABC):
+    """Launch settings of one app framework
+
+    A type builds the command line and extra environment for an app script,
+    names the path probed for readiness and its worker model. workers and
+    threads come from the app metadata, None means the type's default.
+    Types without multi-process support scale through replicas instead.
+    """
+
+    name = None
+    readiness_path = "/"
+    default_workers = 1
+    default_threads = 1
+    supports_workers = False
+    # Glob patterns of files the running framework picks up by itself
+    self_reloading = ()
+
+    @abstractmethod
+    def command(self, script, port, workers, threads, entrypoint=None):
+        """Build the command list, run in the script's directory"""
+        pass
+
+    def env(self, port, workers, threads):
+        """Extra environment variables for the app process"""
+        return {}
+
+    def reload_signal(self, workers):
+        """Signal making the running server reload its code, or None"""
+        return None
+
+    @staticmethod
+    def module_of(script, entrypoint, default_attr):
+        """Get "module:attr" for ASGI/WSGI servers, e.g. main.py -> main:app"""
+        if entrypoint:
+            return entrypoint
+        return f"{os.path.splitext(script)[0]}:{default_attr}"
+
+
+class StreamlitType(AppType):
+    name = "streamlit"
+    readiness_path = "/_stcore/health"
+    # Streamlit watches the script and its local modules and reruns on change
+    self_reloading = ("*.py",)
+
+    def command(self, script, port, workers, threads, entrypoint=None):
+        return ["streamlit", "run", script, "--server.port", str(port)]
+
+
+class VoilaType(AppType):
+    name = "voila"
+    # Notebooks are executed afresh for every session
+    self_reloading = ("*.ipynb",)
+
+    def command(self, script, port, workers, threads, entrypoint=None):
+        return ["voila", script, "--port", str(port)]
+
+
+class FlaskType(AppType):
+    """Flask under gunicorn with worker processes and threads
+
+    Falls back to running the script itself (``python app.py --port N``)
+    when gunicorn is not installed.
+    """
+
+    name = "flask"
+    default_workers = 2
+    default_threads = 4
+    supports_workers = True
+
+    def command(self, script, port, workers, threads, entrypoint=None):
+        if not shutil.which("gunicorn"):
+            logger.warning("gunicorn not found, running flask app '%s' as is", script)
+            return ["python", script, "--port", str(port)]
+        return [
+            "gunicorn",
+            "--bind",
+            f"0.0.0.0:{port}",
+            "--workers",
+            str(workers),
+            "--threads",
+            str(threads),
+            self.module_of(script, entrypoint, "app"),
+        ]
+
+    def reload_signal(self, workers):
+        # The gunicorn master restarts its workers gracefully on SIGHUP
+        return "SIGHUP" if shutil.which("gunicorn") else None
+
+
+class FastAPIType(AppType):
+    """FastAPI under uvicorn with worker processes"""
+
+    name = "fastapi"
+    default_workers = 2
+    supports_workers = True
+
+    def command(self, script, port, workers, threads, entrypoint=None):
+        return [
+            "uvicorn",
+            self.module_of(script, entrypoint, "app"),
+            "--host",
+            "0.0.0.0",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+        ]
+
+    def reload_signal(self, workers):
+        # Only uvicorn's multi-worker supervisor restarts workers on SIGHUP,
+        # a single uvicorn process would just exit
+        return "SIGHUP" if workers > 1 else None
+
+
+class GradioType(AppType):
+    """Gradio script, configured through its GRADIO_* variables
+
+    Gradio runs a single process; threads sets how many events of each
+    handler run concurrently.
+    """
+
+    name = "gradio"
+    default_threads = 4
+
+    def command(self, script, port, workers, threads, entrypoint=None):
+        return ["python", script]
+
+    def env(self, port, workers, threads):
+        return {
+            "GRADIO_SERVER_NAME": "0.0.0.0",
+            "GRADIO_SERVER_PORT": str(port),
+            "GRADIO_DEFAULT_CONCURRENCY_LIMIT": str(threads),
+        }
+
+
+_registry = {}
+
+
+def register(app_type):
+    """Register an AppType instance under its name, replacing any existing one"""
+    _registry[app_type.name] = app_type
+    return app_type
+
+
+def get_app_type(name):
+    """Get the registered AppType for a name, or None"""
+    return _registry.get(name)
+
+
+def app_type_names():
+    return sorted(_registry)
+
+
+def readiness_path(name):
+    """Get the path probed to tell whether an app of a type is up"""
+    app_type = get_app_type(name)
+    return app_type.readiness_path if app_type else "/"
+
+
+for _builtin in (StreamlitType, VoilaType, FlaskType, FastAPIType, GradioType):
+    register(_builtin())
+
+# Plugin modules add their own types by calling register() on import
+for _plugin in config.APP_TYPE_PLUGINS:
+    try:
+        importlib.import_module(_plugin)
+    except ImportError as e:
+        logger.error("Failed to load app type plugin '%s': %s", _plugin, e)
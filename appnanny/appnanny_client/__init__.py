@@ -0,0 +1,8 @@
+"""Client and command line tool of the AppNanny control API
+
+Installed on its own by setup.py, it only depends on requests.
+"""
+
+from .client import AppNannyClient, AppNannyError
+
+__all__ = ["AppNannyClient", "AppNannyError"]
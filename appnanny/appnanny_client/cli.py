@@ -0,0 +1,216 @@
+import argparse
+import json
+import sys
+import time
+
+from .client import AppNannyClient, AppNannyError
+
+
+def _print_json(data):
+    print(json.dumps(data, indent=2))
+
+
+def _report(results):
+    """Print per-app results of a bulk operation, return the exit code"""
+    failed = 0
+    for app_name, result in results.items():
+        if isinstance(result, AppNannyError):
+            failed += 1
+            print(f"{app_name}: error: {result}", file=sys.stderr)
+        elif isinstance(result, dict):
+            print(f"{app_name}: {result.get('message', 'ok')}")
+        else:
+            print(f"{app_name}: {result}")
+    return 1 if failed else 0
+
+
+def cmd_list(client, args):
+    apps = client.list_apps()
+    if args.json:
+        _print_json(apps)
+        return 0
+    print(f"{'NAME':24} {'TYPE':10} {'STATUS':8} {'PORTS':16} {'REQUESTS':>8} P90(ms)")
+    for app_name, info in sorted(apps.items()):
+        stats = info.get("stats") or {}
+        p90 = (stats.get("latency_ms") or {}).get("p90")
+        print(
+            f"{app_name:24} {info['type']:10} "
+            f"{'running' if info['running'] else 'stopped':8} "
+            f"{','.join(map(str, info.get('ports') or [])):16} "
+            f"{stats.get('requests', 0):>8} {p90 if p90 is not None else '-'}"
+        )
+    return 0
+
+
+def cmd_create(client, args):
+    options = {
+        key: getattr(args, key)
+        for key in ("replicas", "workers", "threads", "entrypoint")
+        if getattr(args, key) is not None
+    }
+    env = dict(args.env)
+    print(
+        client.create_app(
+            args.name, args.type, args.repo, args.path, args.email, env, **options
+        )["message"]
+    )
+    return 0
+
+
+def cmd_start(client, args):
+    return _report(client.start_apps(args.apps))
+
+
+def cmd_stop(client, args):
+    return _report(client.stop_apps(args.apps))
+
+
+def cmd_restart(client, args):
+    return _report(client.restart_apps(args.apps, args.mode, args.full))
+
+
+def cmd_delete(client, args):
+    return _report(client.delete_apps(args.apps))
+
+
+def cmd_scale(client, args):
+    settings = {
+        key: getattr(args, key)
+        for key in (
+            "replicas",
+            "max_replicas",
+            "workers",
+            "threads",
+            "autoscale",
+            "max_inflight",
+            "max_queue",
+        )
+        if getattr(args, key) is not None
+    }
+    return _report(client.bulk("scale_app", args.apps, **settings))
+
+
+def cmd_stats(client, args):
+    _print_json(client.stats(args.app))
+    return 0
+
+
+def cmd_logs(client, args):
+    stream = "stderr" if args.stderr else "stdout"
+    for line in client.logs(args.app, stream, args.tail, args.follow):
+        print(line, flush=True)
+    return 0
+
+
+def cmd_events(client, args):
+    for event in client.events(args.app):
+        if args.json:
+            print(json.dumps(event), flush=True)
+            continue
+        stamp = time.strftime("%H:%M:%S", time.localtime(event["time"]))
+        details = {k: v for k, v in event.items() if k not in ("type", "app", "time")}
+        print(
+            f"{stamp} {event['type']:8} {event['app'] or '-'} {details or ''}",
+            flush=True,
+        )
+    return 0
+
+
+def _env_var(item):
+    """Parse a KEY=VALUE argument, argparse reports the error as usage error"""
+    key, sep, value = item.partition("=")
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, got '{item}'")
+    return key, value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="appnanny", description="Manage apps of an AppNanny service"
+    )
+    parser.add_argument("--url", help="service URL, defaults to $APPNANNY_URL")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds")
+    parser.add_argument("--parallel", type=int, default=8, help="concurrent requests")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("list", help="list apps")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_list)
+
+    p = commands.add_parser("create", help="create an app")
+    p.add_argument("name")
+    p.add_argument("--type", required=True)
+    p.add_argument("--repo", required=True)
+    p.add_argument("--path", required=True, help="script in the repository")
+    p.add_argument("--email", required=True)
+    p.add_argument(
+        "--env", action="append", default=[], type=_env_var, metavar="KEY=VALUE"
+    )
+    p.add_argument("--replicas", type=int)
+    p.add_argument("--workers", type=int)
+    p.add_argument("--threads", type=int)
+    p.add_argument("--entrypoint")
+    p.set_defaults(func=cmd_create)
+
+    for name, func in (
+        ("start", cmd_start),
+        ("stop", cmd_stop),
+        ("delete", cmd_delete),
+    ):
+        p = commands.add_parser(name, help=f"{name} apps")
+        p.add_argument("apps", nargs="+")
+        p.set_defaults(func=func)
+
+    p = commands.add_parser("restart", help="pull and restart apps")
+    p.add_argument("apps", nargs="+")
+    p.add_argument("--mode", choices=("stop_start", "rolling"))
+    p.add_argument("--full", action="store_true", help="never update in place")
+    p.set_defaults(func=cmd_restart)
+
+    p = commands.add_parser("scale", help="change replicas or workers of apps")
+    p.add_argument("apps", nargs="+")
+    p.add_argument("--replicas", type=int)
+    p.add_argument("--max-replicas", type=int)
+    p.add_argument("--workers", type=int)
+    p.add_argument("--threads", type=int)
+    p.add_argument("--max-inflight", type=int, help="requests per replica")
+    p.add_argument("--max-queue", type=int)
+    p.add_argument("--autoscale", action=argparse.BooleanOptionalAction, default=None)
+    p.set_defaults(func=cmd_scale)
+
+    p = commands.add_parser("stats", help="show request stats")
+    p.add_argument("app", nargs="?")
+    p.set_defaults(func=cmd_stats)
+
+    p = commands.add_parser("logs", help="show the log of an app")
+    p.add_argument("app")
+    p.add_argument("-f", "--follow", action="store_true")
+    p.add_argument("-n", "--tail", type=int, default=100, help="lines to show")
+    p.add_argument("--stderr", action="store_true")
+    p.set_defaults(func=cmd_logs)
+
+    p = commands.add_parser("events", help="follow app events")
+    p.add_argument("app", nargs="?")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_events)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    client = AppNannyClient(
+        args.url, timeout=(3.05, args.timeout), max_workers=args.parallel
+    )
+    try:
+        return args.func(client, args)
+    except AppNannyError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""Python client of the AppNanny control API
+
+    from appnanny_client import AppNannyClient
+
+    client = AppNannyClient("http://localhost:5000")
+    client.start_apps(["app1", "app2"])
+    for event in client.events():
+        print(event)
+
+Only depends on requests, so it can be used outside the service.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_URL = os.getenv("APPNANNY_URL", "http://localhost:5000")
+
+
+class AppNannyError(Exception):
+    """A request to the service failed"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class AppNannyClient:
+    """Client of one AppNanny service
+
+    Requests share a pooled session, so repeated and concurrent calls reuse
+    connections. Connection errors are retried with exponential backoff, and
+    so are 502/503/504 responses to GET requests; POSTs are only retried when
+    the request was never sent, since creating or restarting twice is not
+    harmless. Thread-safe.
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        timeout=(3.05, 30),
+        start_timeout=300,
+        retries=3,
+        backoff=0.5,
+        max_workers=8,
+    ):
+        """
+        Args:
+            base_url: Service URL, defaults to $APPNANNY_URL or localhost:5000
+            timeout: Seconds to connect and to wait for a response
+            start_timeout: Seconds to wait for starts and restarts, which
+                block until the app is ready
+            retries: Attempts after the first on retriable failures
+            backoff: Base of the exponential backoff between attempts
+            max_workers: Concurrent requests of bulk operations
+        """
+        self.base_url = (base_url or DEFAULT_URL).rstrip("/")
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.max_workers = max_workers
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_connections=1, pool_maxsize=max_workers
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, method, path, timeout=None, **kwargs):
+        try:
+            response = self.session.request(
+                method,
+                f"{self.base_url}{path}",
+                timeout=timeout or self.timeout,
+                **kwargs,
+            )
+        except requests.RequestException as e:
+            raise AppNannyError(f"{method} {path} failed: {e}") from e
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        if response.status_code >= 400:
+            message = data.get("error") if isinstance(data, dict) else None
+            raise AppNannyError(
+                message or f"{method} {path}: HTTP {response.status_code}",
+                response.status_code,
+            )
+        return data
+
+    def _long_timeout(self):
+        return (self.timeout[0], self.start_timeout)
+
+    # Apps
+    def list_apps(self):
+        """Get the status of all apps, keyed by app name"""
+        return self._request("GET", "/apps")
+
+    def get_app(self, app_name):
+        apps = self.list_apps()
+        if app_name not in apps:
+            raise AppNannyError(f"App '{app_name}' not found", 404)
+        return apps[app_name]
+
+    def create_app(self, app_name, app_type, repo, path, email, env=None, **options):
+        """Create an app
+
+        Args:
+            options: replicas, workers, threads and entrypoint
+        """
+        data = {
+            "name": app_name,
+            "type": app_type,
+            "repo": repo,
+            "path": path,
+            "email": email,
+            "env": env or {},
+            **options,
+        }
+        # Cloning the repository may take a while
+        return self._request("POST", "/create", json=data, timeout=self._long_timeout())
+
+    def start_app(self, app_name):
+        """Start an app and wait until it is ready
+
+        Returns:
+            int: Port of the app
+        """
+        return self._request(
+            "POST", f"/start/{app_name}", timeout=self._long_timeout()
+        )["port"]
+
+    def stop_app(self, app_name):
+        return self._request("POST", f"/stop/{app_name}")
+
+    def restart_app(self, app_name, mode=None, full=False):
+        """Pull and restart an app
+
+        Args:
+            mode: "stop_start" or "rolling", defaults to the service's
+            full: Restart even if the changes could be applied in place
+        """
+        params = {"full": "1"} if full else {}
+        if mode:
+            params["mode"] = mode
+        return self._request(
+            "POST",
+            f"/restart/{app_name}",
+            params=params,
+            timeout=self._long_timeout(),
+        )
+
+    def delete_app(self, app_name):
+        return self._request("POST", f"/delete/{app_name}")
+
+    def scale_app(self, app_name, **settings):
+        """Change replicas, autoscale, max_replicas, workers, threads,
+        max_inflight or max_queue
+        """
+        return self._request(
+            "POST", f"/scale/{app_name}", json=settings, timeout=self._long_timeout()
+        )
+
+    def pin_app(self, app_name, pinned=None, priority=None):
+        return self._request(
+            "POST",
+            f"/pin/{app_name}",
+            json={"pinned": pinned, "priority": priority},
+        )
+
+    def patch_env(
+        self, app_name, set_vars=None, unset_vars=None, apply=None, scope="app"
+    ):
+        """Set and unset environment variables of an app
+
+        Args:
+            apply: "restart" to relaunch the running app with them, "reload"
+                to restart its workers in place where the app type allows it,
+                for apps re-reading $APPNANNY_ENV_FILE
+            scope: "app" or "secret"
+        """
+        return self._request(
+            "PATCH",
+            f"/env/{app_name}",
+            params={"scope": scope},
+            json={"set": set_vars or {}, "unset": unset_vars or [], "apply": apply},
+            timeout=self._long_timeout(),
+        )
+
+    def patch_shared_env(
+        self, scope="global", app_type=None, set_vars=None, unset_vars=None, apply=None
+    ):
+        """Set and unset variables of all apps or of all apps of a type
+
+        Running apps whose env changes pick it up as with patch_env().
+
+        Returns:
+            dict: "diff" of the scope and the "apps" whose env changed
+        """
+        params = {"scope": scope}
+        if app_type:
+            params["type"] = app_type
+        return self._request(
+            "PATCH",
+            "/env",
+            params=params,
+            json={"set": set_vars or {}, "unset": unset_vars or [], "apply": apply},
+            timeout=self._long_timeout(),
+        )
+
+    def start_all(self, app_names=None, restore=False):
+        """Queue starts on the service, see /start-all
+
+        Returns:
+            list: App names in the order they will be started
+        """
+        data = {"restore": True} if restore else {"apps": app_names}
+        return self._request("POST", "/start-all", json=data)["order"]
+
+    def autoscale(self):
+        """Let the service adjust replica counts of autoscaled apps"""
+        return self._request("POST", "/autoscale")["changes"]
+
+    def stats(self, app_name=None):
+        """Get request stats of one app, or of all apps slowest first"""
+        return self._request("GET", f"/stats/{app_name}" if app_name else "/stats")
+
+    # Bulk operations
+    def bulk(self, operation, app_names, *args, **kwargs):
+        """Run an operation on many apps concurrently
+
+        Args:
+            operation: Method name, e.g. "stop_app"
+            app_names: Apps to run it on
+            args, kwargs: Passed on after the app name
+
+        Returns:
+            dict: App name -> result, or the AppNannyError it raised
+        """
+        method = getattr(self, operation)
+
+        def run(app_name):
+            try:
+                return method(app_name, *args, **kwargs)
+            except AppNannyError as e:
+                return e
+
+        app_names = list(app_names)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(app_names, executor.map(run, app_names)))
+
+    def start_apps(self, app_names):
+        return self.bulk("start_app", app_names)
+
+    def stop_apps(self, app_names):
+        return self.bulk("stop_app", app_names)
+
+    def restart_apps(self, app_names, mode=None, full=False):
+        return self.bulk("restart_app", app_names, mode, full)
+
+    def delete_apps(self, app_names):
+        return self.bulk("delete_app", app_names)
+
+    # Streams
+    def _stream(self, path, params=None):
+        # The service sends an empty line on idle streams, so a read timeout
+        # well above its keepalive interval means the connection is gone
+        try:
+            response = self.session.get(
+                f"{self.base_url}{path}",
+                params=params,
+                stream=True,
+                timeout=(self.timeout[0], 60),
+            )
+        except requests.RequestException as e:
+            raise AppNannyError(f"GET {path} failed: {e}") from e
+        with response:
+            if response.status_code >= 400:
+                raise AppNannyError(
+                    f"GET {path}: HTTP {response.status_code}", response.status_code
+                )
+            try:
+                for line in response.iter_lines():
+                    if line:
+                        yield json.loads(line)
+            except requests.RequestException as e:
+                raise AppNannyError(f"GET {path} interrupted: {e}") from e
+
+    def logs(self, app_name, stream="stdout", tail=100, follow=False):
+        """Yield log lines of an app
+
+        Args:
+            stream: "stdout" or "stderr"
+            tail: Number of existing lines to start with
+            follow: Keep yielding new lines until the caller stops iterating
+        """
+        params = {"stream": stream, "tail": tail, "follow": "1" if follow else "0"}
+        for item in self._stream(f"/logs/{app_name}", params):
+            yield item["line"]
+
+    def events(self, app_name=None):
+        """Yield app events as they happen, of one app or of all apps
+
+        Events are dicts with "type" (state, created, deleted, updated or
+        dropped), "app" and "time"; state events carry "running" and "ports".
+        """
+        params = {"app": app_name} if app_name else None
+        yield from self._stream("/events", params)
@@ -0,0 +1,337 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from importlib import metadata
+
+from flask import Response
+
+from config import active_config as config
+from logging_config import logger
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "image/svg",
+)
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Each process spills into its own subdirectory of the cache dir
+PROCESS_DIR_PREFIX = "pid-"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # owned by another user
+    return True
+
+
+@lru_cache(maxsize=None)
+def framework_version(app_type):
+    """Get installed version of an app framework, or None if unknown"""
+    try:
+        return metadata.version(app_type)
+    except (metadata.PackageNotFoundError, ValueError):
+        return None
+
+
+def cache_namespace(app_type, app_name):
+    """Namespace for cached assets
+
+    Apps of the same framework version share a namespace. When the version
+    cannot be determined assets are only shared within the app itself.
+    """
+    version = framework_version(app_type) if app_type else None
+    if version:
+        return f"{app_type}-{version}"
+    return f"app-{app_name}"
+
+
+class AssetCache:
+    """Size-bounded LRU cache for immutable static assets
+
+    Entries are keyed by content hash so identical bundles served by several
+    apps are stored once. Entries evicted from memory spill to disk and are
+    dropped from disk in LRU order as well.
+
+    The disk index is kept in memory only, so every process (gateway,
+    proxies) spills into a subdirectory of its own, and subdirectories of
+    processes that are gone are removed on startup. The disk limit thus holds
+    per process.
+    """
+
+    def __init__(self, memory_bytes=None, disk_bytes=None, cache_dir=None):
+        self.memory_bytes = memory_bytes or config.ASSET_CACHE_MEMORY_BYTES
+        self.disk_bytes = disk_bytes or config.ASSET_CACHE_DISK_BYTES
+        root = cache_dir or config.ASSET_CACHE_DIR
+        self.cache_dir = os.path.join(root, f"{PROCESS_DIR_PREFIX}{os.getpid()}")
+        self._patterns = {
+            app_type: [re.compile(p) for p in patterns]
+            for app_type, patterns in config.ASSET_CACHE_PATTERNS.items()
+        }
+        self._index = {}  # (namespace, path) -> digest
+        self._memory = OrderedDict()  # digest -> entry
+        self._memory_size = 0
+        self._disk = OrderedDict()  # digest -> size on disk
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.isdir(root):
+            self._remove_stale_dirs(root)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _remove_stale_dirs(self, root):
+        """Remove spilled assets not tracked by any running process
+
+        This covers the directory of a previous run with our own pid and
+        files of older versions that spilled straight into the cache dir.
+        """
+        for entry in os.listdir(root):
+            path = os.path.join(root, entry)
+            pid = entry.removeprefix(PROCESS_DIR_PREFIX)
+            if (
+                pid == entry
+                or not pid.isdigit()
+                or int(pid) == os.getpid()
+                or not _pid_alive(int(pid))
+            ):
+                logger.info("Removing stale asset cache %s", path)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        logger.warning("Failed to remove %s: %s", path, e)
+
+    def is_cacheable(self, app_type, path):
+        """Check whether a request path is an immutable asset of the app type"""
+        return any(p.search(path) for p in self._patterns.get(app_type, ()))
+
+    def get(self, namespace, path):
+        """Get a cached entry, or None on miss"""
+        with self._lock:
+            digest = self._index.get((namespace, path))
+            entry = self._load(digest) if digest else None
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def put(self, namespace, path, body, content_type):
+        """Store an asset and return its entry"""
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            self._index[(namespace, path)] = digest
+            entry = self._load(digest)
+            if entry:
+                return entry
+
+        entry = {
+            "digest": digest,
+            "content_type": content_type,
+            "variants": self._compress(body, content_type),
+        }
+        with self._lock:
+            self._store(entry)
+        return entry
+
+    def stats(self):
+        """Get cache counters"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_bytes": self._memory_size,
+            "disk_bytes": self._disk_size,
+            "entries": len(self._memory) + len(self._disk),
+        }
+
+    def _compress(self, body, content_type):
+        """Precompress compressible assets, keeping only variants that pay off"""
+        variants = {"identity": body}
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return variants
+        compressed = gzip.compress(body, compresslevel=9)
+        if len(compressed) < len(body):
+            variants["gzip"] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(body)
+            if len(compressed) < len(body):
+                variants["br"] = compressed
+        return variants
+
+    @staticmethod
+    def _entry_size(entry):
+        return sum(len(v) for v in entry["variants"].values())
+
+    def _load(self, digest):
+        """Get entry from memory or disk, promoting it to most recently used"""
+        if digest in self._memory:
+            self._memory.move_to_end(digest)
+            return self._memory[digest]
+        if digest in self._disk:
+            entry = self._read_from_disk(digest)
+            if entry:
+                self._store(entry)
+                return entry
+        return None
+
+    def _store(self, entry):
+        """Put entry in memory, spilling least recently used entries to disk"""
+        digest = entry["digest"]
+        if digest in self._memory:
+            return
+        self._memory[digest] = entry
+        self._memory_size += self._entry_size(entry)
+        while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+            old_digest, old_entry = self._memory.popitem(last=False)
+            self._memory_size -= self._entry_size(old_entry)
+            self._spill(old_entry)
+
+    def _entry_dir(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def _spill(self, entry):
+        """Write an entry evicted from memory to disk"""
+        digest = entry["digest"]
+        if digest in self._disk:
+            self._disk.move_to_end(digest)
+            return
+        size = self._entry_size(entry)
+        if size > self.disk_bytes:
+            return
+        entry_dir = self._entry_dir(digest)
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            for encoding, data in entry["variants"].items():
+                with open(os.path.join(entry_dir, encoding), "wb") as f:
+                    f.write(data)
+            with open(os.path.join(entry_dir, "meta.json"), "w") as f:
+                json.dump(
+                    {
+                        "content_type": entry["content_type"],
+                        "encodings": list(entry["variants"]),
+                    },
+                    f,
+                )
+        except OSError as e:
+            logger.warning("Failed to spill asset %s to disk: %s", digest, e)
+            return
+
+        self._disk[digest] = size
+        self._disk_size += size
+        while self._disk_size > self.disk_bytes:
+            old_digest, old_size = self._disk.popitem(last=False)
+            self._disk_size -= old_size
+            self._remove_from_disk(old_digest)
+
+    def _read_from_disk(self, digest):
+        entry_dir = self._entry_dir(digest)
+        try:
+            with open(os.path.join(entry_dir, "meta.json")) as f:
+                meta = json.load(f)
+            variants = {}
+            for encoding in meta["encodings"]:
+                with open(os.path.join(entry_dir, encoding), "rb") as f:
+                    variants[encoding] = f.read()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Failed to read cached asset %s: %s", digest, e)
+            self._disk_size -= self._disk.pop(digest, 0)
+            return None
+        return {
+            "digest": digest,
+            "content_type": meta["content_type"],
+            "variants": variants,
+        }
+
+    def _remove_from_disk(self, digest):
+        entry_dir = self._entry_dir(digest)
+        try:
+            for name in os.listdir(entry_dir):
+                os.remove(os.path.join(entry_dir, name))
+            os.rmdir(entry_dir)
+        except OSError as e:
+            logger.warning("Failed to remove cached asset %s: %s", digest, e)
+
+
+def make_asset_response(entry, request):
+    """Build a response for a cached asset honoring conditional and encoding headers"""
+    etag = f'"{entry["digest"]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+
+    if_none_match = request.headers.get("If-None-Match", "")
+    if if_none_match.strip() == "*" or etag in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]:
+        return Response(status=304, headers=headers)
+
+    accepted = {
+        token.split(";")[0].strip()
+        for token in request.headers.get("Accept-Encoding", "").split(",")
+    }
+    for encoding in ("br", "gzip"):
+        if encoding in entry["variants"] and encoding in accepted:
+            headers["Content-Encoding"] = encoding
+            break
+    else:
+        encoding = "identity"
+
+    return Response(
+        entry["variants"][encoding],
+        status=200,
+        headers=headers,
+        content_type=entry["content_type"],
+    )
+
+
+def serve_asset(cache, namespace, path, request, fetch):
+    """Serve an immutable asset from cache, fetching it from upstream on miss
+
+    Args:
+        cache: AssetCache instance
+        namespace: Namespace from cache_namespace()
+        path: Request path without leading slash
+        request: Incoming flask request
+        fetch: Callable returning the upstream requests.Response
+
+    Returns:
+        flask.Response
+    """
+    entry = cache.get(namespace, path)
+    if not entry:
+        resp = fetch()
+        if resp.status_code != 200:
+            # Errors and redirects are relayed, never cached
+            return Response(
+                resp.content,
+                status=resp.status_code,
+                content_type=resp.headers.get("Content-Type"),
+            )
+        entry = cache.put(
+            namespace,
+            path,
+            resp.content,
+            resp.headers.get("Content-Type", "application/octet-stream"),
+        )
+    return make_asset_response(entry, request)
@@ -1,6 +1,127 @@
 from abc import ABC, abstractmethod
 import logging
+import threading
+import time
+import uuid
+
 import requests
+from flask import Response, request
+
+from config import active_config as config
+from load_balancer import STICKY_COOKIE, LoadBalancer
+from proxy_stats import BodyMeter, ProxyStats
+
+# Headers that must not be relayed as-is: connection-level ones (RFC 7230),
+# plus those requests recomputes for the decoded body and the upstream host
+HOP_BY_HOP_HEADERS = {
+    "host",
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+    "content-length",
+    "content-encoding",
+}
+
+
+def forward_headers(headers) -> dict:
+    """Filter hop-by-hop headers before relaying a request or response"""
+    return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+
+def relay_upstream(
+    app_name,
+    send,
+    get_ports,
+    data,
+    admission,
+    balancer,
+    stats,
+    log,
+    on_success=None,
+    refresh_ports=None,
+    cookie_path="/",
+):
+    """Relay the current Flask request to one replica of an app
+
+    The request waits for an admission slot, then goes to the replica the
+    load balancer picks, the sticky one while it is still up. Both are held
+    until the streamed response body is sent, then the request is recorded
+    in stats.
+
+    Args:
+        app_name: Name of the app, for messages
+        send: Called with a replica port, sends the request there and
+            returns the streamed requests.Response
+        get_ports: Returns the current replica ports; called after queueing,
+            since ports and loads may have changed meanwhile
+        data: Request body, counted in stats
+        admission: AdmissionLimiter of the app
+        balancer: LoadBalancer of the app
+        stats: ProxyStats of the proxy
+        log: Logger for upstream errors
+        on_success: Called when the upstream answers below 400
+        refresh_ports: Called when a replica refuses the connection, returns
+            True if the ports changed; the request is then retried once
+        cookie_path: Path of the sticky replica cookie
+
+    Returns:
+        flask.Response
+    """
+    if not admission.acquire():
+        stats.record_request(503, len(data))
+        return Response(
+            f"App '{app_name}' is overloaded, retry later",
+            status=503,
+            headers={"Retry-After": str(admission.retry_after())},
+        )
+
+    sticky = request.cookies.get(STICKY_COOKIE)
+    sticky = int(sticky) if sticky and sticky.isdigit() else None
+    port = balancer.choose(get_ports(), sticky)
+    balancer.acquire(port)
+    begin = time.time()
+    try:
+        try:
+            resp = send(port)
+        except requests.ConnectionError:
+            # The upstream may have moved during a rolling restart
+            if not refresh_ports or not refresh_ports():
+                raise
+            balancer.release(port)
+            port = balancer.choose(get_ports())
+            balancer.acquire(port)
+            resp = send(port)
+    except requests.RequestException as e:
+        balancer.release(port)
+        admission.release()
+        log.error("Proxy error for app '%s': %s", app_name, e)
+        stats.record_request(502, len(data), 0, time.time() - begin)
+        return Response(f"Proxy error: {str(e)}", status=502)
+    latency = time.time() - begin
+
+    if resp.status_code < 400 and on_success:
+        on_success()
+
+    body = BodyMeter(resp.iter_content(chunk_size=10 * 1024))
+    response = Response(
+        body, status=resp.status_code, headers=forward_headers(resp.headers)
+    )
+    if port != sticky:
+        response.set_cookie(STICKY_COOKIE, str(port), path=cookie_path, httponly=True)
+
+    # The body is streamed, the request is in flight until it is sent
+    def finish():
+        balancer.release(port)
+        admission.release()
+        stats.record_request(resp.status_code, len(data), body.bytes, latency)
+
+    response.call_on_close(finish)
+    return response
 
 
 class BaseProxy(ABC):
@@ -8,10 +129,22 @@ class BaseProxy(ABC):
         self, target_port: int, app_name: str, nanny_url: str = "http://localhost:5000"
     ):
         self.target_port = target_port
+        # All replica ports, kept in sync through the heartbeat response
+        self.target_ports = [target_port]
+        self.balancer = LoadBalancer()
         self.app_name = app_name
         self.nanny_url = nanny_url
         self.heartbeat_url = f"{nanny_url}/heartbeat/{app_name}"
-        self.logger = logging.getLogger(f"proxy_{app_name}")
+        self.stats_url = f"{nanny_url}/stats/{app_name}"
+        # Reports are cumulative, the source id lets the service replace them
+        self.stats_source = uuid.uuid4().hex[:12]
+        self.stats = ProxyStats()
+        self._stats_stopped = threading.Event()
+        threading.Thread(
+            target=self._flush_stats_loop, name=f"stats-{app_name}", daemon=True
+        ).start()
+        # Child of the "appnanny" logger so records go through its queue
+        self.logger = logging.getLogger(f"appnanny.proxy.{app_name}")
 
     @abstractmethod
     def start(self, host: str = "0.0.0.0", port: int = None) -> None:
@@ -23,9 +156,44 @@ class BaseProxy(ABC):
         """Stop the proxy server"""
         pass
 
+    def _forward_headers(self, headers) -> dict:
+        return forward_headers(headers)
+
+    def set_target_ports(self, ports: list, limits: dict = None) -> None:
+        """Switch the upstream replica ports, e.g. after scaling or a rolling restart
+
+        Args:
+            ports: Replica ports of the app
+            limits: max_inflight and max_queue set on the app, if any
+        """
+        if ports and ports != self.target_ports:
+            self.logger.info(
+                "Switching upstream from %s to %s", self.target_ports, ports
+            )
+            self.target_ports = ports
+            self.target_port = ports[0]
+
     def _send_heartbeat(self) -> None:
-        """Send heartbeat to nanny service"""
+        """Send heartbeat to nanny service and follow upstream port changes"""
         try:
-            requests.post(self.heartbeat_url, timeout=1)
+            resp = requests.post(self.heartbeat_url, timeout=1)
+            if resp.status_code == 200:
+                data = resp.json()
+                self.set_target_ports(data.get("ports"), data.get("limits"))
         except Exception as e:
-            self.logger.warning(f"Failed to send heartbeat: {e}")
+            self.logger.warning("Failed to send heartbeat: %s", e)
+
+    def _flush_stats(self) -> None:
+        """Report request stats to nanny service"""
+        try:
+            requests.post(
+                self.stats_url,
+                json={"source": self.stats_source, "stats": self.stats.snapshot()},
+                timeout=1,
+            )
+        except Exception as e:
+            self.logger.warning("Failed to report stats: %s", e)
+
+    def _flush_stats_loop(self) -> None:
+        while not self._stats_stopped.wait(config.PROXY_STATS_FLUSH_INTERVAL):
+            self._flush_stats()
@@ -4,11 +4,13 @@ import os
 class Config:
     # Base configuration
     HOST = "0.0.0.0"
-    PORT = 5000
+    PORT = int(os.getenv("APPNANNY_PORT", 5000))
 
     # App storage and metadata
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    STORAGE_PATH = os.path.join(BASE_DIR, "apps")
+    STORAGE_PATH = os.getenv("APPNANNY_STORAGE_PATH", os.path.join(BASE_DIR, "apps"))
+    # Central metadata file of older versions, migrated on startup into
+    # per-app <app>/.appnanny/ state directories
     METADATA_FILE = "apps_metadata.json"
 
     # Logging
@@ -17,6 +19,8 @@ class Config:
     LOG_LEVEL = "INFO"
     LOG_MAX_BYTES = 2_000_000  # 2MB
     LOG_BACKUP_COUNT = 2
+    LOG_JSON = False  # one JSON object per line with app/request context fields
+    SCHEDULER_LOG_FILE = os.path.join(STORAGE_PATH, "scheduler.log")
 
     # Port allocation
     PORT_RANGES = [
@@ -24,18 +28,136 @@ class Config:
         range(4040, 4050),  # For additional services
     ]
 
-    # Supported app types and commands
-    APP_TYPES = {
-        "streamlit": ["streamlit", "run"],
-        "voila": ["voila"],
-        "flask": ["python"],
-        "fastapi": ["python"],
-        "gradio": ["python"],
-    }
+    # App types are registered in app_types.py; plugin modules listed here
+    # register additional ones on import
+    APP_TYPE_PLUGINS = [
+        m for m in os.getenv("APPNANNY_APP_TYPE_PLUGINS", "").split(",") if m
+    ]
+    MAX_WORKERS = 16  # upper bound for per-app workers and threads
 
     # port range for app
     PORT_RANGE = list(range(8080, 8090)) + list(range(4040, 4050))
 
+    # Restart behaviour: "stop_start" stops the old process before starting the
+    # new one, "rolling" starts the new version on a second port first
+    RESTART_MODE = "stop_start"
+    READINESS_TIMEOUT = 60  # seconds to wait for a new instance to accept requests
+    READINESS_INTERVAL = 0.5
+    RESTART_DRAIN_TIME = 5  # seconds the old instance keeps serving after switch
+    STOP_TIMEOUT = 5  # seconds to wait for terminate before kill
+
+    # How running apps pick up env changes: "none", "reload" or "restart"
+    ENV_APPLY_MODE = "none"
+
+    # Code updates: after a pull only restart when the changed files need it,
+    # data files are served as is and code is reloaded by signal if possible
+    INCREMENTAL_UPDATES = True
+    UPDATE_RESTART_PATTERNS = [
+        "requirements*.txt",
+        "pyproject.toml",
+        "setup.py",
+        "setup.cfg",
+        "Pipfile*",
+        "poetry.lock",
+        "environment.yml",
+        ".streamlit/*",
+    ]
+    UPDATE_CODE_PATTERNS = ["*.py", "*.pyx", "*.so", "*.ipynb", "templates/*"]
+    # Watch app directories for in-place edits (needs watchdog)
+    WATCH_APP_DIRS = False
+    WATCH_DEBOUNCE = 2.0  # seconds of quiet before changes are applied
+    WATCH_IGNORE = [
+        ".git/*",
+        ".appnanny/*",
+        "__pycache__/*",
+        "*.pyc",
+        ".env*",
+        "*.log",
+        "*.tmp",
+        "*.swp",
+    ]
+
+    # How often proxies report their request stats to the service (seconds)
+    PROXY_STATS_FLUSH_INTERVAL = 10
+
+    # Admission control per app in the proxies and the gateway, overridable
+    # through max_inflight/max_queue of POST /scale/<app>
+    PROXY_MAX_INFLIGHT = 16  # upstream requests per replica, 0 for no limit
+    PROXY_MAX_QUEUE = 64  # requests waiting for a slot, more get 503 at once
+    PROXY_QUEUE_TIMEOUT = 10.0  # seconds a request waits before it gets 503
+
+    # Streaming endpoints (/logs, /events)
+    LOG_FOLLOW_INTERVAL = 0.5  # seconds between checks for new log lines
+    STREAM_KEEPALIVE = 15  # seconds between empty lines on idle streams
+
+    # Replicas per app behind the proxies
+    MAX_REPLICAS = 4
+    SCALE_UP_CPU = 80.0  # average % CPU per replica to add one
+    SCALE_DOWN_CPU = 20.0  # average % CPU per replica to remove one
+    AUTOSCALE_INTERVAL = 60  # seconds between autoscale checks by the scheduler
+
+    # Admission control for app starts: at most MAX_CONCURRENT_STARTS apps
+    # booting at once, paced by a token bucket that slows down on a busy host
+    MAX_CONCURRENT_STARTS = 2
+    START_RATE = 0.5  # starts per second on an idle host
+    START_BURST = 2
+    START_CPU_BUSY = 50.0  # % CPU above which the start rate is reduced
+    START_IOWAIT_MAX = 30.0  # % iowait at which the start rate bottoms out
+    START_MIN_RATE_FACTOR = 0.1
+    RESTORE_ON_BOOT = False  # restart apps that were running before shutdown
+    ACCESS_SCORE_HALF_LIFE = 24 * 3600  # seconds, for start priority
+    ACCESS_SCORE_FLUSH_INTERVAL = 30  # seconds between metadata saves
+
+    # Write-ahead journal of metadata changes, folded into the per-app files
+    # at checkpoints. The size limit bounds replay time after a crash
+    JOURNAL_CHECKPOINT_BYTES = 4 * 1024 * 1024
+    JOURNAL_CHECKPOINT_INTERVAL = 300  # seconds
+
+    # Memory-pressure eviction of idle apps (run by the scheduler). Eviction
+    # starts above the high watermarks and goes on until both clear levels hold
+    MEMORY_PSI_PATH = "/proc/pressure/memory"
+    MEMORY_PSI_HIGH = 10.0  # % of time stalled on memory ("some avg10")
+    MEMORY_PSI_CLEAR = 2.0
+    MEMORY_AVAILABLE_LOW = 10.0  # % of total memory available
+    MEMORY_AVAILABLE_CLEAR = 20.0
+    EVICTION_CHECK_INTERVAL = 30  # seconds
+    EVICTION_SETTLE_TIME = 5  # seconds to let memory settle after each stop
+
+    # Cluster mode: every AppNanny service is an agent for its host, the
+    # coordinator places apps on agents and aggregates them
+    CLUSTER_NODES = [
+        url for url in os.getenv("APPNANNY_CLUSTER_NODES", "").split(",") if url
+    ]
+    COORDINATOR_PORT = int(os.getenv("APPNANNY_COORDINATOR_PORT", 5050))
+    CLUSTER_STATE_FILE = os.path.join(STORAGE_PATH, "cluster_placements.json")
+    COORDINATOR_LOG_FILE = os.path.join(STORAGE_PATH, "coordinator.log")
+    CLUSTER_REQUEST_TIMEOUT = 10
+    # Agents answer starts, restarts and scaling once the app is ready, which
+    # can take READINESS_TIMEOUT plus queueing for admission
+    CLUSTER_CONTROL_TIMEOUT = 300
+
+    # Single-port gateway serving all apps
+    GATEWAY_ENABLED = False
+    GATEWAY_PORT = 9000
+    GATEWAY_ROUTING = "path"  # "path": /app/<name>/, "subdomain": <name>.<domain>
+    GATEWAY_DOMAIN = ""  # e.g. "apps.example.com", required for subdomain routing
+    GATEWAY_POOL_MAXSIZE = 32  # pooled upstream connections per app port
+
+    # Proxy cache for immutable framework assets, shared by apps running the
+    # same framework version
+    ASSET_CACHE_ENABLED = False
+    ASSET_CACHE_MEMORY_BYTES = 64 * 1024 * 1024
+    ASSET_CACHE_DISK_BYTES = 512 * 1024 * 1024
+    ASSET_CACHE_DIR = os.path.join(STORAGE_PATH, ".asset_cache")
+    # Request paths (without leading slash) that are safe to cache forever:
+    # only file names carrying a content hash, anything else may change with
+    # the next deploy
+    ASSET_CACHE_PATTERNS = {
+        "streamlit": [r"^static/(js|css|media)/.+\.[0-9a-f]{8,}\.\w+$"],
+        # Webpack chunks of voila and its lab extensions, e.g. 568.4c1b0f9e.js
+        "voila": [r"^voila/(static|labextensions)/.+\.[0-9a-f]{8,}\.\w+$"],
+    }
+
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -45,7 +167,7 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     DEBUG = False
     LOG_LEVEL = "INFO"
-    PORT = 8000
+    PORT = int(os.getenv("APPNANNY_PORT", 8000))
 
 
 class TestingConfig(Config):
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+AppNanny coordinator: places apps on agent hosts and aggregates their state.
+
+Every AppNanny service (app.py) acts as the agent for its host. Start the
+coordinator with the agent URLs in APPNANNY_CLUSTER_NODES, e.g.
+
+    APPNANNY_CLUSTER_NODES=http://localhost:5001,http://localhost:5002 \\
+        python coordinator.py
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from flask import Flask, Response, jsonify, render_template, request
+
+from config import active_config as config
+from logging_config import setup_logging
+
+# Own log file: an agent may run on the same host and storage path
+logger = setup_logging("appnanny_coordinator", config.COORDINATOR_LOG_FILE)
+
+# Control calls the agent answers only after launching or stopping processes
+SLOW_ACTIONS = {"start", "stop", "restart", "scale", "delete"}
+
+
+class Coordinator:
+    def __init__(self, nodes, state_file):
+        """Initialize Coordinator
+
+        Args:
+            nodes: Base URLs of the agents
+            state_file: Path of the JSON file recording app -> node placements
+        """
+        self.nodes = nodes
+        self.state_file = state_file
+        self.placements = {}
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(len(nodes), 1))
+        self.load_placements()
+
+    def load_placements(self):
+        """Load app placements from file"""
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, "r") as f:
+                    self.placements = json.load(f)
+            except json.JSONDecodeError:
+                logger.error("Failed to load cluster placements file")
+
+    def save_placements(self):
+        """Save app placements to file"""
+        tmp_file = f"{self.state_file}.tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(self.placements, f, indent=2)
+            os.replace(tmp_file, self.state_file)
+        except Exception as e:
+            logger.error("Failed to save cluster placements: %s", e)
+
+    def _call(self, node, method, path, slow=False, **kwargs):
+        """Send a request to an agent
+
+        Args:
+            slow: The agent answers once processes are started or stopped,
+                wait up to CLUSTER_CONTROL_TIMEOUT for the response
+        """
+        timeout = config.CLUSTER_REQUEST_TIMEOUT
+        if slow:
+            timeout = (timeout, config.CLUSTER_CONTROL_TIMEOUT)
+        return self.session.request(method, f"{node}{path}", timeout=timeout, **kwargs)
+
+    def _get_all(self, path):
+        """GET a path on all agents concurrently
+
+        Returns:
+            dict: node -> decoded JSON, or None for unreachable agents
+        """
+
+        def fetch(node):
+            try:
+                resp = self._call(node, "GET", path)
+                resp.raise_for_status()
+                return resp.json()
+            except (requests.RequestException, ValueError) as e:
+                logger.warning("Agent %s unreachable: %s", node, e)
+                return None
+
+        return dict(zip(self.nodes, self._executor.map(fetch, self.nodes)))
+
+    def nodes_info(self):
+        """Get capacity and metrics reported by every agent"""
+        return self._get_all("/node")
+
+    @staticmethod
+    def _load_score(info):
+        """Lower is better: memory use, CPU load and app count combined"""
+        memory_used = 1 - info["memory_available"] / info["memory_total"]
+        cpu_load = info["load_avg"][0] / max(info["cpu_count"], 1)
+        return memory_used + cpu_load + 0.01 * info["running_count"]
+
+    def place(self):
+        """Pick the least-loaded reachable agent, or None if all are down"""
+        candidates = [
+            (self._load_score(info), node)
+            for node, info in self.nodes_info().items()
+            if info
+        ]
+        if not candidates:
+            return None
+        return min(candidates)[1]
+
+    def node_for(self, app_name):
+        """Get the agent hosting an app"""
+        return self.placements.get(app_name)
+
+    def create_app(self, data):
+        """Create an app on the least-loaded agent
+
+        Returns:
+            tuple: (node, requests.Response), node is None if no agent is up
+        """
+        node = data.get("node") or self.place()
+        if not node:
+            return None, None
+        # Cloning the repo can take a while too
+        resp = self._call(node, "POST", "/create", slow=True, json=data)
+        if resp.status_code == 200:
+            with self._lock:
+                self.placements[data["name"]] = node
+                self.save_placements()
+            logger.info("Placed app '%s' on %s", data["name"], node)
+        return node, resp
+
+    def forget(self, app_name):
+        """Drop the placement of a deleted app"""
+        with self._lock:
+            if self.placements.pop(app_name, None):
+                self.save_placements()
+
+    def forward(self, app_name, method, path, **kwargs):
+        """Forward a control call to the agent hosting an app
+
+        Returns:
+            requests.Response, or None if the app is unknown
+        """
+        node = self.node_for(app_name)
+        if not node:
+            return None
+        return self._call(node, method, path, **kwargs)
+
+    def list_apps(self):
+        """Aggregate /apps of all agents, tagging each app with its node"""
+        all_apps = {}
+        for node, apps in self._get_all("/apps").items():
+            for app_name, info in (apps or {}).items():
+                info["node"] = node
+                info["host"] = urlparse(node).hostname
+                all_apps[app_name] = info
+                if self.placements.get(app_name) != node:
+                    # Apps created directly on an agent are adopted here
+                    with self._lock:
+                        self.placements[app_name] = node
+                        self.save_placements()
+        return all_apps
+
+
+def _relay(resp):
+    """Turn an agent response into a coordinator response"""
+    return Response(
+        resp.content,
+        status=resp.status_code,
+        content_type=resp.headers.get("Content-Type", "application/json"),
+    )
+
+
+def create_coordinator_app(coordinator=None):
+    app = Flask(__name__)
+    coordinator = coordinator or Coordinator(
+        config.CLUSTER_NODES, config.CLUSTER_STATE_FILE
+    )
+    app.coordinator = coordinator
+
+    def forward(app_name, method, path, **kwargs):
+        try:
+            resp = coordinator.forward(app_name, method, path, **kwargs)
+        except requests.RequestException as e:
+            logger.error("Failed to reach agent of app '%s': %s", app_name, e)
+            return jsonify({"error": "Agent unreachable"}), 502
+        if resp is None:
+            return jsonify({"error": "App not found"}), 404
+        return _relay(resp)
+
+    @app.route("/")
+    def index():
+        return render_template("main.html", gateway=None)
+
+    @app.route("/create")
+    def create():
+        return render_template("create.html")
+
+    @app.route("/create", methods=["POST"])
+    def create_app():
+        try:
+            node, resp = coordinator.create_app(request.json)
+        except requests.RequestException as e:
+            logger.error("Failed to reach agent for new app: %s", e)
+            return jsonify({"error": "Agent unreachable"}), 502
+        if not node:
+            return jsonify({"error": "No agent available"}), 503
+        return _relay(resp)
+
+    @app.route("/apps", methods=["GET"])
+    def list_apps():
+        return jsonify(coordinator.list_apps())
+
+    @app.route("/nodes", methods=["GET"])
+    def list_nodes():
+        return jsonify(coordinator.nodes_info())
+
+    @app.route("/<action>/<app_name>", methods=["POST"])
+    def control(action, app_name):
+        if action not in ("start", "stop", "restart", "heartbeat", "scale", "pin"):
+            return jsonify({"error": f"Unknown action '{action}'"}), 404
+        return forward(
+            app_name,
+            "POST",
+            f"/{action}/{app_name}",
+            slow=action in SLOW_ACTIONS,
+            params=request.args,
+            json=request.get_json(silent=True),
+        )
+
+    @app.route("/delete/<app_name>", methods=["POST"])
+    def delete(app_name):
+        result = forward(app_name, "POST", f"/delete/{app_name}", slow=True)
+        if isinstance(result, Response) and result.status_code == 200:
+            coordinator.forget(app_name)
+        return result
+
+    @app.route("/env/<app_name>", methods=["GET", "POST", "PATCH"])
+    def env(app_name):
+        if request.method == "GET":
+            return forward(app_name, "GET", f"/env/{app_name}")
+        # Applying the change may restart the app
+        return forward(
+            app_name,
+            request.method,
+            f"/env/{app_name}",
+            slow=True,
+            params=request.args,
+            json=request.json,
+        )
+
+    return app
+
+
+if __name__ == "__main__":
+    app = create_coordinator_app()
+    logger.info(
+        "Starting coordinator on %s:%s for nodes %s",
+        config.HOST,
+        config.COORDINATOR_PORT,
+        config.CLUSTER_NODES,
+    )
+    app.run(host=config.HOST, port=config.COORDINATOR_PORT, debug=config.DEBUG)
@@ -0,0 +1,149 @@
+import os
+import threading
+
+from app_store import state_dir
+from logging_config import logger
+
+# Later scopes override earlier ones
+SCOPES = ("global", "type", "app", "secret")
+# Launched apps find the merged scopes in this file, see EnvStore.export()
+ENV_FILE_VAR = "APPNANNY_ENV_FILE"
+
+
+class EnvStore:
+    """Layered environment variables for app launches
+
+    Values come from dotenv files, one per scope:
+
+        global  <storage>/.env
+        type    <storage>/.env.<app_type>
+        app     <storage>/<app>/.appnanny/.env
+        secret  <storage>/<app>/.appnanny/.env.secret  (mode 0600, never listed in the UI)
+
+    The merged scopes of an app are exported to <app>/.appnanny/.env.resolved
+    (mode 0600) and its path passed as $APPNANNY_ENV_FILE, so an app reloaded
+    in place can pick up changes with load_dotenv(path, override=True).
+
+    Parsed files are cached and only re-read when their mtime changes.
+    """
+
+    def __init__(self, storage_path):
+        self.storage_path = storage_path
+        # Environment of the service itself, inherited by every app
+        self._base_env = dict(os.environ)
+        self._cache = {}  # path -> (mtime_ns, size, values)
+        self._lock = threading.Lock()
+
+    def scope_path(self, scope, app_name=None, app_type=None):
+        """Get the dotenv file backing a scope"""
+        if scope == "global":
+            return os.path.join(self.storage_path, ".env")
+        if scope == "type":
+            return os.path.join(self.storage_path, f".env.{app_type}")
+        if scope == "app":
+            return os.path.join(state_dir(self.storage_path, app_name), ".env")
+        if scope == "secret":
+            return os.path.join(state_dir(self.storage_path, app_name), ".env.secret")
+        raise ValueError(f"Unknown env scope '{scope}'")
+
+    def get(self, app_name=None, scope="app", app_type=None):
+        """Get the variables of a single scope"""
+        return dict(self._read(self.scope_path(scope, app_name, app_type)))
+
+    def resolve(self, app_name, app_type):
+        """Get the full process environment for launching an app"""
+        env = dict(self._base_env)
+        env.update(self.merged(app_name, app_type))
+        env[ENV_FILE_VAR] = self.export(app_name, app_type)
+        return env
+
+    def export(self, app_name, app_type):
+        """Write the merged scopes of an app to its resolved env file
+
+        Returns:
+            str: Path of the file
+        """
+        path = os.path.join(state_dir(self.storage_path, app_name), ".env.resolved")
+        merged = self.merged(app_name, app_type)
+        if self._read(path) != merged:
+            self._write(path, merged, secret=True)
+        return path
+
+    def merged(self, app_name, app_type):
+        """Get the variables of all scopes of an app, without the service env"""
+        env = {}
+        for scope in SCOPES:
+            env.update(self._read(self.scope_path(scope, app_name, app_type)))
+        return env
+
+    def replace(self, app_name, env_vars, scope="app", app_type=None):
+        """Replace all variables of a scope
+
+        Returns:
+            dict: Diff with "added", "changed" and "removed" keys, empty
+                sections mean nothing changed and the file was not rewritten
+        """
+        path = self.scope_path(scope, app_name, app_type)
+        old = self._read(path)
+        new = {k: str(v) for k, v in env_vars.items()}
+        diff = self.diff(old, new)
+        if any(diff.values()):
+            self._write(path, new, secret=scope == "secret")
+        return diff
+
+    def update(self, app_name, set_vars=None, unset=None, scope="app", app_type=None):
+        """Set and unset individual variables of a scope
+
+        Returns:
+            dict: Diff, see replace()
+        """
+        new = self.get(app_name, scope, app_type)
+        new.update(set_vars or {})
+        for key in unset or ():
+            new.pop(key, None)
+        return self.replace(app_name, new, scope, app_type)
+
+    @staticmethod
+    def diff(old, new):
+        """Compare two sets of variables, see replace()"""
+        return {
+            "added": {k: v for k, v in new.items() if k not in old},
+            "changed": {k: v for k, v in new.items() if k in old and old[k] != v},
+            "removed": [k for k in old if k not in new],
+        }
+
+    def _read(self, path):
+        """Parse a dotenv file, served from cache while its mtime is unchanged"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return {}
+        cached = self._cache.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+
+        from dotenv import dotenv_values  # loaded on the first cache miss
+
+        values = {k: v for k, v in dotenv_values(path).items() if v is not None}
+        with self._lock:
+            self._cache[path] = (st.st_mtime_ns, st.st_size, values)
+        return values
+
+    def _write(self, path, env_vars, secret=False):
+        """Atomically rewrite a dotenv file"""
+        env_dir = os.path.dirname(path)
+        if not os.path.exists(env_dir):
+            os.makedirs(env_dir)
+
+        tmp_file = f"{path}.tmp"
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            for key, value in env_vars.items():
+                f.write(f"{key}={value}\n")
+        if not secret:
+            os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, path)
+
+        with self._lock:
+            self._cache.pop(path, None)
+        logger.debug("Wrote %d env vars to %s", len(env_vars), path)
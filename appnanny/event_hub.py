@@ -0,0 +1,62 @@
+import queue
+import threading
+import time
+
+from logging_config import logger
+
+
+class EventHub:
+    """Fan out app events to streaming subscribers
+
+    Every subscriber gets its own bounded queue. A subscriber that falls
+    behind loses events instead of blocking the publisher, and gets a
+    "dropped" event telling how many once it catches up.
+    """
+
+    def __init__(self, max_pending=1000):
+        self.max_pending = max_pending
+        self._subscribers = {}  # queue -> app name filter or None
+        self._dropped = {}  # queue -> events lost since the last read
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, app_name, **fields):
+        event = {"type": event_type, "app": app_name, "time": time.time(), **fields}
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for subscriber, app_filter in subscribers:
+            if app_filter and app_filter != app_name:
+                continue
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                with self._lock:
+                    self._dropped[subscriber] = self._dropped.get(subscriber, 0) + 1
+
+    def subscribe(self, app_name=None):
+        """Start collecting events, of one app or of all apps"""
+        subscriber = queue.Queue(self.max_pending)
+        with self._lock:
+            self._subscribers[subscriber] = app_name
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.pop(subscriber, None)
+            self._dropped.pop(subscriber, None)
+
+    def next_event(self, subscriber, timeout):
+        """Get the next event of a subscriber, None if none came in time"""
+        with self._lock:
+            dropped = self._dropped.pop(subscriber, 0)
+        if dropped:
+            logger.warning("Event subscriber fell behind, dropped %d events", dropped)
+            return {
+                "type": "dropped",
+                "app": None,
+                "time": time.time(),
+                "count": dropped,
+            }
+        try:
+            return subscriber.get(timeout=timeout)
+        except queue.Empty:
+            return None
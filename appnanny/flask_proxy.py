@@ -2,12 +2,41 @@ from flask import Flask, Response, request
 import requests
 from werkzeug.wsgi import get_input_stream
 
-from base_proxy import BaseProxy
+from admission import AdmissionLimiter, limits_for
+from asset_cache import cache_namespace, serve_asset
+from base_proxy import BaseProxy, relay_upstream
 
 
 class FlaskProxy(BaseProxy):
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        app_type=None,
+        asset_cache=None,
+        max_inflight=None,
+        max_queue=None,
+        **kwargs,
+    ):
+        """
+        Args:
+            max_inflight: Upstream requests per replica, defaults to
+                config.PROXY_MAX_INFLIGHT
+            max_queue: Requests waiting for a slot, defaults to
+                config.PROXY_MAX_QUEUE
+        """
         super().__init__(*args, **kwargs)
+        self.app_type = app_type
+        self.asset_cache = asset_cache
+        self.cache_namespace = cache_namespace(app_type, self.app_name)
+        self.limits = {
+            k: v
+            for k, v in (("max_inflight", max_inflight), ("max_queue", max_queue))
+            if v is not None
+        }
+        self.admission = AdmissionLimiter(
+            *limits_for(self.limits, len(self.target_ports))
+        )
+        self.stats.admission = self.admission
         self.app = Flask(f"proxy_{self.app_name}")
         self.setup_routes()
 
@@ -24,31 +53,69 @@ class FlaskProxy(BaseProxy):
             return self._handle_request(path)
 
     def _handle_request(self, path):
-        target_url = f"http://localhost:{self.target_port}/{path}"
-
-        try:
-            resp = requests.request(
-                method=request.method,
-                url=target_url,
-                headers=self._forward_headers(request.headers),
-                data=get_input_stream(request.environ).read(),
-                params=request.args,
-                cookies=request.cookies,
-                stream=True,
+        if (
+            self.asset_cache
+            and request.method == "GET"
+            and self.asset_cache.is_cacheable(self.app_type, path)
+        ):
+            # Static hits are not user activity, so no heartbeat here
+            try:
+                response = serve_asset(
+                    self.asset_cache,
+                    self.cache_namespace,
+                    path,
+                    request,
+                    lambda: self._send_upstream(
+                        path, b"", self.balancer.choose(self.target_ports)
+                    ),
+                )
+            except Exception as e:
+                self.logger.error("Proxy error: %s", e)
+                self.stats.record_request(502)
+                return Response(f"Proxy error: {str(e)}", status=502)
+            self.stats.record_request(
+                response.status_code, bytes_out=response.content_length or 0
             )
+            return response
 
-            if resp.status_code < 400:
-                self._send_heartbeat()
+        data = get_input_stream(request.environ).read()
 
-            return Response(
-                resp.iter_content(chunk_size=10 * 1024),
-                status=resp.status_code,
-                headers=self._forward_headers(resp.headers),
-            )
+        def refresh_ports():
+            old_ports = self.target_ports
+            self._send_heartbeat()
+            return self.target_ports != old_ports
+
+        return relay_upstream(
+            self.app_name,
+            lambda port: self._send_upstream(path, data, port),
+            lambda: self.target_ports,
+            data,
+            self.admission,
+            self.balancer,
+            self.stats,
+            self.logger,
+            on_success=self._send_heartbeat,
+            refresh_ports=refresh_ports,
+        )
+
+    def set_target_ports(self, ports, limits=None):
+        super().set_target_ports(ports, limits)
+        self.limits.update(limits or {})
+        limits = limits_for(self.limits, len(self.target_ports))
+        if limits != (self.admission.max_inflight, self.admission.max_queue):
+            self.logger.info("Admission limits changed to %s", limits)
+            self.admission.set_limits(*limits)
 
-        except Exception as e:
-            self.logger.error(f"Proxy error: {e}")
-            return Response(f"Proxy error: {str(e)}", status=502)
+    def _send_upstream(self, path, data, port):
+        return requests.request(
+            method=request.method,
+            url=f"http://localhost:{port}/{path}",
+            headers=self._forward_headers(request.headers),
+            data=data,
+            params=request.args,
+            cookies=request.cookies,
+            stream=True,
+        )
 
     def start(self, host="0.0.0.0", port=None):
         if port is None:
@@ -0,0 +1,420 @@
+import selectors
+import socket
+import threading
+import time
+
+import requests
+from flask import Flask, Response, redirect, request
+from requests.adapters import HTTPAdapter
+from werkzeug.serving import WSGIRequestHandler, make_server
+from werkzeug.wsgi import get_input_stream
+
+from admission import AdmissionLimiter, limits_for
+from asset_cache import AssetCache, cache_namespace, serve_asset
+from base_proxy import forward_headers, relay_upstream
+from config import active_config as config
+from load_balancer import STICKY_COOKIE, LoadBalancer, sticky_port_from_cookie_header
+from logging_config import logger
+from proxy_stats import ProxyStats
+
+PATH_PREFIX = "/app/"
+METHODS = ["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH", "HEAD"]
+
+
+class Route:
+    """Upstreams of a running app plus the metadata proxying to it needs"""
+
+    def __init__(self, ports, app_meta):
+        self.ports = list(ports)
+        self.meta = {
+            k: app_meta[k]
+            for k in ("type", "max_inflight", "max_queue")
+            if k in app_meta
+        }
+        self.app_type = self.meta.get("type")
+        self.limits = limits_for(self.meta, len(self.ports))
+
+
+class RoutingTable:
+    """In-memory app name -> Route mapping
+
+    Routes carry the app type and admission limits next to the replica
+    ports, so requests never read app metadata. Lookups are plain dict
+    reads, so they stay O(1) however many apps are registered. Routes are
+    replaced as a whole; writes are serialized and kept in sync with
+    AppStateManager through its listener hooks.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def update(self, app_name, ports, app_meta=None):
+        """Set or clear (empty ports) the upstreams of an app
+
+        Args:
+            app_meta: Metadata of the app, None keeps that of the current route
+        """
+        with self._lock:
+            if ports:
+                if app_meta is None:
+                    route = self._routes.get(app_name)
+                    app_meta = route.meta if route else {}
+                self._routes[app_name] = Route(ports, app_meta)
+            else:
+                self._routes.pop(app_name, None)
+        logger.info("Gateway route for app '%s' -> %s", app_name, ports)
+
+    def update_metadata(self, app_name, app_meta):
+        """Refresh the type and limits of an app's route, if it is running
+
+        Args:
+            app_meta: New metadata, None drops the route of a removed app
+        """
+        with self._lock:
+            route = self._routes.get(app_name)
+            if app_meta is None:
+                self._routes.pop(app_name, None)
+            elif route:
+                self._routes[app_name] = Route(route.ports, app_meta)
+
+    def route(self, app_name):
+        """Get the Route of an app, None if it is not running"""
+        return self._routes.get(app_name)
+
+    def lookup(self, app_name):
+        """Get upstream ports of an app, empty if it is not running"""
+        route = self._routes.get(app_name)
+        return route.ports if route else []
+
+    def __len__(self):
+        return len(self._routes)
+
+
+class Gateway:
+    """Single-port reverse proxy in front of all running apps
+
+    Apps are addressed either by path prefix (/app/<name>/...) or by
+    subdomain (<name>.<GATEWAY_DOMAIN>), depending on GATEWAY_ROUTING.
+    """
+
+    def __init__(
+        self,
+        routing_table,
+        on_access,
+        routing=None,
+        domain=None,
+        asset_cache=None,
+        stats_registry=None,
+    ):
+        """
+        Args:
+            routing_table: RoutingTable with the live upstreams
+            on_access: Called with the app name for every successful request,
+                same semantics as the proxy heartbeat
+            routing: "path" or "subdomain", defaults to config.GATEWAY_ROUTING
+            domain: Base domain for subdomain routing
+            asset_cache: Optional AssetCache for immutable framework assets,
+                used for apps whose route has a type
+            stats_registry: Optional StatsRegistry to publish request stats to
+        """
+        self.routing_table = routing_table
+        self.on_access = on_access
+        self.asset_cache = asset_cache
+        self._balancers = {}  # app_name -> LoadBalancer
+        self.stats_registry = stats_registry
+        self._stats = {}  # app_name -> ProxyStats
+        self._stats_lock = threading.Lock()
+        self.routing = routing or config.GATEWAY_ROUTING
+        self.domain = domain if domain is not None else config.GATEWAY_DOMAIN
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=config.GATEWAY_POOL_MAXSIZE,
+            pool_maxsize=config.GATEWAY_POOL_MAXSIZE,
+        )
+        self.session.mount("http://", adapter)
+
+        self.app = Flask("appnanny_gateway")
+        self.setup_routes()
+
+    def setup_routes(self):
+        @self.app.route("/", defaults={"path": ""}, methods=METHODS)
+        @self.app.route("/<path:path>", methods=METHODS)
+        def gateway(path):
+            return self._handle_request()
+
+    def _stats_for(self, app_name):
+        stats = self._stats.get(app_name)
+        if stats is None:
+            with self._stats_lock:
+                stats = self._stats.get(app_name)
+                if stats is None:
+                    stats = self._stats[app_name] = ProxyStats()
+                    # Limits are set from the route on every request
+                    stats.admission = AdmissionLimiter()
+                    if self.stats_registry:
+                        self.stats_registry.track(app_name, "gateway", stats)
+        return stats
+
+    def _resolve(self, host, path):
+        """Extract (app_name, upstream_path) from a request's host and path"""
+        if self.routing == "subdomain":
+            host = host.split(":")[0]
+            suffix = f".{self.domain}"
+            if not self.domain or not host.endswith(suffix):
+                return None, None
+            return host[: -len(suffix)], path
+
+        if not path.startswith(PATH_PREFIX):
+            return None, None
+        app_name, _, rest = path.removeprefix(PATH_PREFIX).partition("/")
+        return app_name, f"/{rest}"
+
+    def _handle_request(self):
+        app_name, path = self._resolve(request.host, request.path)
+        if not app_name:
+            return Response("Unknown app", status=404)
+
+        route = self.routing_table.route(app_name)
+        if not route:
+            return Response(f"App '{app_name}' is not running", status=503)
+        ports = route.ports
+
+        if self.routing == "path" and request.path == f"{PATH_PREFIX}{app_name}":
+            # Relative asset URLs only resolve below the trailing slash
+            return redirect(f"{PATH_PREFIX}{app_name}/")
+
+        headers = forward_headers(request.headers)
+        headers["X-Forwarded-Host"] = request.host
+        if self.routing == "path":
+            headers["X-Forwarded-Prefix"] = f"{PATH_PREFIX}{app_name}"
+
+        stats = self._stats_for(app_name)
+        balancer = self._balancers.setdefault(app_name, LoadBalancer())
+        app_type = route.app_type if self.asset_cache else None
+        if (
+            app_type
+            and request.method == "GET"
+            and self.asset_cache.is_cacheable(app_type, path.lstrip("/"))
+        ):
+            # Static hits are not user activity, so on_access is skipped
+            url = f"http://127.0.0.1:{balancer.choose(ports)}{path}"
+            try:
+                response = serve_asset(
+                    self.asset_cache,
+                    cache_namespace(app_type, app_name),
+                    path.lstrip("/"),
+                    request,
+                    lambda: self.session.get(url, headers=headers, params=request.args),
+                )
+            except requests.RequestException as e:
+                logger.error("Gateway error for app '%s': %s", app_name, e)
+                stats.record_request(502)
+                return Response(f"Proxy error: {str(e)}", status=502)
+            stats.record_request(
+                response.status_code, bytes_out=response.content_length or 0
+            )
+            return response
+
+        data = get_input_stream(request.environ).read()
+        # Limits follow metadata changes and the current replica count
+        admission = stats.admission
+        if route.limits != (admission.max_inflight, admission.max_queue):
+            admission.set_limits(*route.limits)
+
+        def send(port):
+            return self.session.request(
+                method=request.method,
+                url=f"http://127.0.0.1:{port}{path}",
+                headers=headers,
+                data=data,
+                params=request.args,
+                stream=True,
+                allow_redirects=False,
+            )
+
+        return relay_upstream(
+            app_name,
+            send,
+            lambda: self.routing_table.lookup(app_name) or ports,
+            data,
+            admission,
+            balancer,
+            stats,
+            logger,
+            on_success=lambda: self.on_access(app_name),
+            cookie_path=f"{PATH_PREFIX}{app_name}/" if self.routing == "path" else "/",
+        )
+
+    def relay_websocket(self, handler):
+        """Tunnel a WebSocket upgrade request to the app, e.g. /_stcore/stream
+
+        The handshake goes to the upstream as is and its answer back to the
+        client, after which bytes are relayed both ways until either side
+        closes. Frames are not parsed, so any message counts as activity.
+
+        Args:
+            handler: WSGIRequestHandler holding the client connection, its
+                request line and headers already read
+        """
+        client = handler.connection
+        target, _, query = handler.path.partition("?")
+        app_name, path = self._resolve(handler.headers.get("Host", ""), target)
+        if not app_name:
+            client.sendall(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            return
+        ports = self.routing_table.lookup(app_name)
+        if not ports:
+            client.sendall(
+                b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n"
+            )
+            return
+
+        stats = self._stats_for(app_name)
+        balancer = self._balancers.setdefault(app_name, LoadBalancer())
+        sticky = sticky_port_from_cookie_header(handler.headers.get("Cookie"))
+        port = balancer.choose(ports, sticky)
+        try:
+            upstream = socket.create_connection(("127.0.0.1", port), timeout=5)
+        except OSError as e:
+            logger.error("Gateway websocket error for app '%s': %s", app_name, e)
+            stats.record_request(502)
+            client.sendall(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n")
+            return
+
+        # Host stays the client's, frameworks check it against Origin
+        lines = [f"{handler.command} {path}{'?' + query if query else ''} HTTP/1.1"]
+        lines += [f"{k}: {v}" for k, v in handler.headers.items()]
+        lines.append(f"X-Forwarded-Host: {handler.headers.get('Host', '')}")
+        if self.routing == "path":
+            lines.append(f"X-Forwarded-Prefix: {PATH_PREFIX}{app_name}")
+        balancer.acquire(port)
+        stats.websocket_opened()
+        status = 502  # unless the upstream answers the handshake
+        bytes_in = bytes_out = 0
+        try:
+            upstream.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            head = b""
+            while b"\r\n\r\n" not in head:
+                chunk = upstream.recv(65536)
+                if not chunk:
+                    raise ConnectionError("upstream closed during handshake")
+                head += chunk
+            head, _, rest = head.partition(b"\r\n\r\n")
+            status = _status_code(head)
+            if status == 101 and port != sticky:
+                cookie_path = (
+                    f"{PATH_PREFIX}{app_name}/" if self.routing == "path" else "/"
+                )
+                head += (
+                    f"\r\nSet-Cookie: {STICKY_COOKIE}={port}; "
+                    f"Path={cookie_path}; HttpOnly"
+                ).encode()
+            client.sendall(head + b"\r\n\r\n" + rest)
+            bytes_out += len(rest)
+            if status == 101:
+                self.on_access(app_name)
+                bytes_in, relayed = self._pipe(app_name, client, upstream)
+                bytes_out += relayed
+        except OSError as e:
+            logger.warning("Gateway websocket of app '%s' closed: %s", app_name, e)
+        finally:
+            upstream.close()
+            stats.websocket_closed()
+            balancer.release(port)
+            stats.record_request(status, bytes_in, bytes_out)
+
+    def forget(self, app_name):
+        """Drop the balancer and request stats of a deleted app"""
+        with self._stats_lock:
+            self._stats.pop(app_name, None)
+        self._balancers.pop(app_name, None)
+
+    def _pipe(self, app_name, client, upstream):
+        """Relay bytes both ways until one side closes
+
+        Returns:
+            tuple: Bytes sent from client to upstream and back
+        """
+        sent = {client: 0, upstream: 0}
+        peer = {client: upstream, upstream: client}
+        last_access = time.time()
+        with selectors.DefaultSelector() as selector:
+            selector.register(client, selectors.EVENT_READ)
+            selector.register(upstream, selectors.EVENT_READ)
+            while True:
+                for key, _ in selector.select():
+                    data = key.fileobj.recv(65536)
+                    if not data:
+                        return sent[client], sent[upstream]
+                    peer[key.fileobj].sendall(data)
+                    sent[key.fileobj] += len(data)
+                    # Same semantics as the proxy heartbeat, throttled
+                    if key.fileobj is client and time.time() - last_access > 10:
+                        self.on_access(app_name)
+                        last_access = time.time()
+
+    def start(self, host="0.0.0.0", port=None):
+        """Serve the gateway (blocking)"""
+        port = port or config.GATEWAY_PORT
+        logger.info("Starting gateway on %s:%s (%s routing)", host, port, self.routing)
+        handler = type("GatewayRequestHandler", (_RequestHandler,), {"gateway": self})
+        make_server(
+            host, port, self.app, threaded=True, request_handler=handler
+        ).serve_forever()
+
+
+def _status_code(head):
+    """Get the status code of a raw HTTP response head, 502 if malformed"""
+    try:
+        return int(head.split(b" ", 2)[1])
+    except (IndexError, ValueError):
+        return 502
+
+
+class _RequestHandler(WSGIRequestHandler):
+    """Hands WebSocket upgrades to the gateway before WSGI gets them
+
+    WSGI cannot answer with 101 and keep the connection, werkzeug closes it
+    after every response.
+    """
+
+    gateway = None
+
+    def run_wsgi(self):
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            self.connection.settimeout(None)
+            self.gateway.relay_websocket(self)
+            self.close_connection = True
+        else:
+            super().run_wsgi()
+
+
+def create_gateway(app_service):
+    """Build a gateway wired to the live state of an AppService"""
+    routing_table = RoutingTable()
+    state_manager = app_service.state_manager
+
+    def update_route(app_name, ports):
+        # Only on starts, stops and replica changes, not per request
+        routing_table.update(app_name, ports, state_manager.get_app_metadata(app_name))
+
+    asset_cache = AssetCache() if config.ASSET_CACHE_ENABLED else None
+    gateway = Gateway(
+        routing_table,
+        app_service.update_access_time,
+        asset_cache=asset_cache,
+        stats_registry=app_service.proxy_stats,
+    )
+
+    def update_metadata(app_name, app_meta):
+        routing_table.update_metadata(app_name, app_meta)
+        if app_meta is None:
+            gateway.forget(app_name)
+
+    for app_name in list(state_manager.running_apps):
+        update_route(app_name, state_manager.get_app_ports(app_name))
+    state_manager.add_listener(update_route)
+    state_manager.add_metadata_listener(update_metadata)
+    return gateway
@@ -0,0 +1,138 @@
+import fnmatch
+import os
+import threading
+import time
+
+from app_types import get_app_type
+from config import active_config as config
+from logging_config import logger
+
+# File events that change content, watchdog also reports opens and reads
+CHANGE_EVENTS = ("created", "modified", "deleted", "moved")
+
+
+def _matches(path, patterns):
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+def classify_changes(app_type, changed_files, workers=None):
+    """Pick the cheapest action making a running app serve changed files
+
+    Args:
+        app_type: Type name of the app
+        changed_files: Paths relative to the app directory
+        workers: Worker count the app runs with, None for the type default
+
+    Returns:
+        str: "none" for data files and files the framework reloads by itself,
+            "reload" for code the server reloads on a signal, "restart" for
+            dependency or server config changes and code otherwise
+    """
+    type_handler = get_app_type(app_type)
+    action = "none"
+    for path in changed_files:
+        if _matches(path, config.UPDATE_RESTART_PATTERNS):
+            return "restart"
+        if type_handler and _matches(path, type_handler.self_reloading):
+            continue
+        if _matches(path, config.UPDATE_CODE_PATTERNS):
+            if type_handler and type_handler.reload_signal(
+                workers or type_handler.default_workers
+            ):
+                action = "reload"
+            else:
+                return "restart"
+    return action
+
+
+class _EventHandler:
+    """watchdog event handler feeding a CodeWatcher"""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def dispatch(self, event):
+        if event.is_directory or event.event_type not in CHANGE_EVENTS:
+            return
+        self.watcher.record(event.src_path)
+        if getattr(event, "dest_path", None):
+            self.watcher.record(event.dest_path)
+
+
+class CodeWatcher:
+    """Watch app directories (inotify on Linux) for in-place edits
+
+    Changed paths are collected per app and handed to on_change once the app
+    directory has been quiet for WATCH_DEBOUNCE seconds, so an editor save or
+    a checkout touching many files results in a single action.
+    """
+
+    def __init__(self, storage_path, on_change):
+        """
+        Args:
+            storage_path: Directory holding one subdirectory per app
+            on_change: Called with (app_name, changed paths relative to the
+                app directory)
+        """
+        self.storage_path = os.path.abspath(storage_path)
+        self.on_change = on_change
+        self._pending = {}  # app_name -> (changed paths, last event time)
+        self._lock = threading.Lock()
+        self._observer = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start watching in background threads
+
+        Returns:
+            bool: False if watchdog is not installed
+        """
+        try:
+            from watchdog.observers import Observer
+        except ImportError:  # watchdog is optional, only needed for WATCH_APP_DIRS
+            logger.warning("watchdog is not installed, not watching app directories")
+            return False
+        self._observer = Observer()
+        self._observer.schedule(_EventHandler(self), self.storage_path, recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
+        threading.Thread(
+            target=self._flush_loop, name="code-watcher", daemon=True
+        ).start()
+        logger.info("Watching app directories under %s", self.storage_path)
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        if self._observer:
+            self._observer.stop()
+
+    def record(self, abs_path):
+        """Note a changed file, ignoring files outside app code"""
+        rel_path = os.path.relpath(abs_path, self.storage_path)
+        app_name, _, path = rel_path.partition(os.sep)
+        if not path or app_name.startswith(".") or _matches(path, config.WATCH_IGNORE):
+            return
+        with self._lock:
+            paths, _ = self._pending.get(app_name, (set(), 0))
+            paths.add(path)
+            self._pending[app_name] = (paths, time.time())
+
+    def _flush_loop(self):
+        while not self._stopped.wait(config.WATCH_DEBOUNCE / 2):
+            now = time.time()
+            with self._lock:
+                quiet = {
+                    app_name: paths
+                    for app_name, (paths, last) in self._pending.items()
+                    if now - last >= config.WATCH_DEBOUNCE
+                }
+                for app_name in quiet:
+                    del self._pending[app_name]
+
+            for app_name, paths in quiet.items():
+                try:
+                    self.on_change(app_name, sorted(paths))
+                except Exception:
+                    logger.exception("Failed to apply changes of app '%s'", app_name)
@@ -0,0 +1,61 @@
+import threading
+from http.cookies import SimpleCookie
+
+# Cookie pinning a client to one replica, holds the replica port
+STICKY_COOKIE = "appnanny_replica"
+
+
+def sticky_port_from_cookie_header(cookie_header):
+    """Extract the sticky replica port from a raw Cookie header"""
+    if not cookie_header:
+        return None
+    cookie = SimpleCookie()
+    try:
+        cookie.load(cookie_header)
+    except Exception:
+        return None
+    morsel = cookie.get(STICKY_COOKIE)
+    if morsel and morsel.value.isdigit():
+        return int(morsel.value)
+    return None
+
+
+class LoadBalancer:
+    """Sticky least-connections balancing across the replicas of one app
+
+    Clients carrying a sticky cookie for a live replica keep going to it, which
+    Streamlit's per-connection sessions need. New clients, and clients whose
+    replica went away, get the replica with the fewest in-flight requests.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # port -> in-flight request count
+        self._lock = threading.Lock()
+
+    def choose(self, ports, sticky_port=None):
+        """Pick a replica port, or None if there are no replicas"""
+        if not ports:
+            return None
+        if sticky_port in ports:
+            return sticky_port
+        with self._lock:
+            return min(ports, key=lambda port: self._inflight.get(port, 0))
+
+    def acquire(self, port):
+        """Count a request as in flight on a replica"""
+        with self._lock:
+            self._inflight[port] = self._inflight.get(port, 0) + 1
+
+    def release(self, port):
+        """Count a request on a replica as finished"""
+        with self._lock:
+            count = self._inflight.get(port, 0) - 1
+            if count > 0:
+                self._inflight[port] = count
+            else:
+                self._inflight.pop(port, None)
+
+    def inflight(self):
+        """Get in-flight request counts per replica port"""
+        with self._lock:
+            return dict(self._inflight)
@@ -1,13 +1,139 @@
+import atexit
+import contextvars
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
 from config import active_config as config
 
-logging.basicConfig(level=getattr(logging, config.LOG_LEVEL), format=config.LOG_FORMAT)
+# Context fields (app_name, request_id, ...) attached to every record
+_log_context = contextvars.ContextVar("log_context", default={})
+_listeners = {}
+
+
+def bind_log_context(**fields):
+    """Add fields to the logging context of the current thread/task
+
+    Returns:
+        Token to pass to reset_log_context()
+    """
+    return _log_context.set({**_log_context.get(), **fields})
+
+
+def reset_log_context(token):
+    """Restore the logging context saved by bind_log_context()"""
+    _log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the current logging context onto records"""
+
+    def filter(self, record):
+        record.context = _log_context.get()
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread
+
+    The stock QueueHandler formats the message before enqueueing it. Here only
+    the traceback, which cannot be rendered later, is captured on the calling
+    thread; %-style arguments are merged by the listener.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects"""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text format with context fields appended as key=value"""
+
+    def format(self, record):
+        message = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            fields = " ".join(f"{k}={v}" for k, v in context.items())
+            message = f"{message} [{fields}]"
+        return message
+
+
+def setup_logging(name, log_file, json_format=None):
+    """Create a logger whose output is written by a background thread
+
+    Records are put on an in-memory queue by the calling thread; a
+    QueueListener formats them and writes to the console and a rotating
+    log file, so file writes and rotation stay off the request path.
+
+    Args:
+        name: Logger name
+        log_file: Path of the rotating log file
+        json_format: Emit JSON lines, defaults to config.LOG_JSON
+
+    Returns:
+        logging.Logger
+    """
+    logger = logging.getLogger(name)
+    if name in _listeners:
+        return logger
+
+    json_format = config.LOG_JSON if json_format is None else json_format
+    formatter = JsonFormatter() if json_format else TextFormatter(config.LOG_FORMAT)
+
+    log_dir = os.path.dirname(log_file)
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUP_COUNT,
+    )
+    console_handler = logging.StreamHandler()
+    for h in (file_handler, console_handler):
+        h.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    logger.setLevel(getattr(logging, config.LOG_LEVEL))
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    # Flush pending records on interpreter exit
+    atexit.register(listener.stop)
+    _listeners[name] = listener
+    return logger
 
-logger = logging.getLogger("appnanny")
 
-handler = RotatingFileHandler(
-    config.LOG_FILE, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT
-)
-handler.setFormatter(logging.Formatter(config.LOG_FORMAT))
-logger.addHandler(handler)
+def __getattr__(name):
+    # The service logger is created on first import of `logger`, so entry
+    # points such as the scheduler can set up their own without opening
+    # the service log file
+    if name == "logger":
+        return setup_logging("appnanny", config.LOG_FILE)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
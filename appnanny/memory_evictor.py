@@ -0,0 +1,127 @@
+import logging
+import time
+
+import psutil
+
+from config import active_config as config
+
+logger = logging.getLogger("appnanny_scheduler.evictor")
+
+
+def read_memory_psi(path=None):
+    """Read "some" memory pressure stall information
+
+    Returns:
+        tuple: (avg10 percentage, total stall microseconds), or None when the
+            kernel does not provide PSI
+    """
+    try:
+        with open(path or config.MEMORY_PSI_PATH) as f:
+            for line in f:
+                kind, *fields = line.split()
+                if kind == "some":
+                    values = dict(field.split("=") for field in fields)
+                    return float(values["avg10"]), int(values["total"])
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def memory_available_percent():
+    """Get available memory as percentage of total"""
+    memory = psutil.virtual_memory()
+    return memory.available * 100 / memory.total
+
+
+class MemoryPressureEvictor:
+    """Stop least recently accessed apps while the host is short of memory"""
+
+    def __init__(self, list_apps, stop_app):
+        """
+        Args:
+            list_apps: Returns the /apps mapping of app name -> info
+            stop_app: Stops an app by name, returns True on success
+        """
+        self.list_apps = list_apps
+        self.stop_app = stop_app
+
+    def pressure_reason(self):
+        """Check high watermarks
+
+        Returns:
+            str: Why the host is under memory pressure, or None if it is not
+        """
+        available = memory_available_percent()
+        if available < config.MEMORY_AVAILABLE_LOW:
+            return f"available memory {available:.1f}% < {config.MEMORY_AVAILABLE_LOW}%"
+        psi = read_memory_psi()
+        if psi and psi[0] > config.MEMORY_PSI_HIGH:
+            return f"memory PSI avg10 {psi[0]:.1f}% > {config.MEMORY_PSI_HIGH}%"
+        return None
+
+    def pressure_cleared(self, window):
+        """Check clear levels, measuring PSI over the given window in seconds
+
+        avg10 lags behind for several seconds after an app is stopped, so the
+        stall ratio is computed from the cumulative total instead.
+        """
+        before = read_memory_psi()
+        time.sleep(window)
+        after = read_memory_psi()
+
+        if memory_available_percent() < config.MEMORY_AVAILABLE_CLEAR:
+            return False
+        if before and after:
+            stall_percent = (after[1] - before[1]) / (window * 1e6) * 100
+            return stall_percent < config.MEMORY_PSI_CLEAR
+        return True
+
+    @staticmethod
+    def eviction_order(apps):
+        """Running, unpinned apps: lowest priority first, then least recently used"""
+        candidates = [
+            (info.get("priority", 0), info.get("last_access_time") or 0, name)
+            for name, info in apps.items()
+            if info["running"] and not info.get("pinned")
+        ]
+        return [name for _, _, name in sorted(candidates)]
+
+    def check(self):
+        """Evict apps until memory pressure clears
+
+        Returns:
+            list: Names of the evicted apps
+        """
+        reason = self.pressure_reason()
+        if not reason:
+            return []
+
+        apps = self.list_apps()
+        order = self.eviction_order(apps)
+        if not order:
+            logger.warning("Memory pressure (%s) but no evictable apps", reason)
+            return []
+
+        evicted = []
+        for app_name in order:
+            info = apps[app_name]
+            idle = time.time() - (info.get("last_access_time") or time.time())
+            logger.info(
+                "Evicting app %s: %s, idle %.1f min, priority %s",
+                app_name,
+                reason,
+                idle / 60,
+                info.get("priority", 0),
+            )
+            if not self.stop_app(app_name):
+                logger.error("Failed to evict app %s", app_name)
+                continue
+            evicted.append(app_name)
+
+            if self.pressure_cleared(config.EVICTION_SETTLE_TIME):
+                logger.info("Memory pressure cleared after evicting %s", evicted)
+                break
+            reason = self.pressure_reason() or "memory still above clear levels"
+        else:
+            logger.warning("Memory pressure persists after evicting %s", evicted)
+        return evicted
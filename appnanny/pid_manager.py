@@ -1,44 +1,47 @@
 import os
 from logging_config import logger
+from app_store import state_dir
 
 
 class PIDManager:
     def __init__(self, storage_path):
         self.storage_path = storage_path
 
-    def save_pid(self, app_name, pid):
-        """Save process ID to file"""
+    def save_pids(self, app_name, pids):
+        """Save process IDs of all replicas to file, one per line"""
         pid_file = self._get_pid_file_path(app_name)
         try:
-            logger.debug(f"Saving PID {pid} for app '{app_name}'")
+            logger.debug("Saving PIDs %s for app '%s'", pids, app_name)
             with open(pid_file, "w") as f:
-                f.write(str(pid))
+                f.write("\n".join(str(pid) for pid in pids))
         except Exception as e:
             logger.error(
-                f"Failed to save PID file for app '{app_name}': {str(e)}", exc_info=True
+                "Failed to save PID file for app '%s': %s", app_name, e, exc_info=True
             )
 
-    def get_pid(self, app_name):
-        """Get process ID from file"""
+    def get_pids(self, app_name):
+        """Get process IDs of all replicas from file"""
         pid_file = self._get_pid_file_path(app_name)
         if os.path.exists(pid_file):
             try:
                 with open(pid_file, "r") as f:
-                    return int(f.read().strip())
+                    return [int(line) for line in f.read().split()]
             except Exception as e:
-                logger.error(f"Failed to read PID file for {app_name}: {str(e)}")
-        return None
+                logger.error("Failed to read PID file for %s: %s", app_name, e)
+        return []
 
     def remove_pid(self, app_name):
         """Remove PID file"""
         pid_file = self._get_pid_file_path(app_name)
         if os.path.exists(pid_file):
             try:
-                logger.debug(f"Removing PID file for app '{app_name}'")
+                logger.debug("Removing PID file for app '%s'", app_name)
                 os.remove(pid_file)
             except Exception as e:
                 logger.error(
-                    f"Failed to remove PID file for app '{app_name}': {str(e)}",
+                    "Failed to remove PID file for app '%s': %s",
+                    app_name,
+                    e,
                     exc_info=True,
                 )
 
@@ -52,4 +55,4 @@ class PIDManager:
 
     def _get_pid_file_path(self, app_name):
         """Get the path to PID file for an app"""
-        return os.path.join(self.storage_path, app_name, "app.pid")
+        return os.path.join(state_dir(self.storage_path, app_name), "app.pid")
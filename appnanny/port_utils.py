@@ -1,12 +1,59 @@
 import socket
+import time
 
 from config import active_config as config
 
 
-def find_available_port():
-    """Find an available port from the configured range"""
+def find_available_port(exclude=()):
+    """Find an available port from the configured range
+
+    Args:
+        exclude: Ports to skip, e.g. handed out but not yet bound
+    """
     for port in config.PORT_RANGE:
+        if port in exclude:
+            continue
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             if s.connect_ex(("127.0.0.1", port)) != 0:
                 return port
     return None
+
+
+def wait_until_ready(port, process=None, timeout=None, path="/"):
+    """Wait until an app answers HTTP requests on the given port
+
+    Args:
+        port: Port the app listens on
+        process: Optional psutil.Process, polling stops early if it exits
+        timeout: Seconds to wait, defaults to config.READINESS_TIMEOUT
+        path: URL path used for the readiness probe
+
+    Returns:
+        bool: True if the app responded with a non-5xx status in time
+    """
+    import psutil  # slow to import, load it on first use
+    import requests  # only needed once apps are started, keeps startup fast
+
+    timeout = config.READINESS_TIMEOUT if timeout is None else timeout
+    deadline = time.time() + timeout
+    url = f"http://127.0.0.1:{port}{path}"
+    while time.time() < deadline:
+        if process is not None and not _is_alive(process):
+            return False
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(config.READINESS_INTERVAL)
+    return False
+
+
+def _is_alive(process):
+    """Check that a process exists and has not exited into a zombie"""
+    import psutil
+
+    try:
+        return process.is_running() and process.status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
@@ -0,0 +1,285 @@
+import math
+import threading
+import time
+
+from config import active_config as config
+
+# Latency buckets grow by 2^(1/4) (~19% relative error) from 100us up to
+# MIN_LATENCY * 2^(NUM_BUCKETS / BUCKETS_PER_OCTAVE) ~= 200s, slower requests
+# land in the last bucket
+MIN_LATENCY = 1e-4
+BUCKETS_PER_OCTAVE = 4
+NUM_BUCKETS = 84
+# Counter stripes of a ProxyStats, requests of one thread always hit the same
+NUM_SHARDS = 16
+
+
+class LatencyHistogram:
+    """Fixed-memory log-bucketed latency histogram"""
+
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.sum = 0.0
+
+    @staticmethod
+    def bucket_of(seconds):
+        if seconds <= MIN_LATENCY:
+            return 0
+        index = int(math.log2(seconds / MIN_LATENCY) * BUCKETS_PER_OCTAVE)
+        return min(index, NUM_BUCKETS - 1)
+
+    @staticmethod
+    def bucket_upper_bound(index):
+        return MIN_LATENCY * 2 ** ((index + 1) / BUCKETS_PER_OCTAVE)
+
+    def record(self, seconds):
+        self.counts[self.bucket_of(seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other):
+        """Add the counts of another histogram"""
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.sum += other.sum
+
+    def percentile(self, q):
+        """Get the upper bound of the bucket holding the q-th percentile"""
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * q / 100)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.bucket_upper_bound(i)
+        return self.bucket_upper_bound(NUM_BUCKETS - 1)
+
+    def to_dict(self):
+        """Sparse JSON-friendly form, see from_dict()"""
+        return {
+            "buckets": {str(i): n for i, n in enumerate(self.counts) if n},
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        for i, n in data.get("buckets", {}).items():
+            histogram.counts[min(int(i), NUM_BUCKETS - 1)] += n
+        histogram.count = data.get("count", 0)
+        histogram.sum = data.get("sum", 0.0)
+        return histogram
+
+
+class _Shard:
+    """Counters of the request threads mapped to one stripe"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statuses = {}  # status code -> request count
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = LatencyHistogram()
+
+
+class ProxyStats:
+    """Request accounting of one proxy for one app
+
+    Counters are striped over a fixed set of shards picked by thread id, so
+    concurrent request threads rarely wait on the same lock, and memory stays
+    bounded however many threads the server spawns (werkzeug starts one per
+    connection). snapshot() merges the shards into cumulative totals.
+    """
+
+    def __init__(self):
+        self._shards = [_Shard() for _ in range(NUM_SHARDS)]
+        self._lock = threading.Lock()  # guards the websocket count
+        self._websockets = 0  # open websocket connections
+        self.started = time.time()
+        # AdmissionLimiter of the proxy, its queue metrics are reported too
+        self.admission = None
+
+    def _shard(self):
+        # Native ids are small consecutive numbers, unlike get_ident()
+        return self._shards[threading.get_native_id() % NUM_SHARDS]
+
+    def record_request(self, status, bytes_in=0, bytes_out=0, latency=None):
+        """Account for one finished request
+
+        Args:
+            status: Response status code
+            bytes_in: Request body size
+            bytes_out: Response body size
+            latency: Seconds until upstream response headers, None when the
+                request was not sent upstream (e.g. asset cache hits)
+        """
+        shard = self._shard()
+        with shard.lock:
+            shard.statuses[status] = shard.statuses.get(status, 0) + 1
+            shard.bytes_in += bytes_in
+            shard.bytes_out += bytes_out
+            if latency is not None:
+                shard.latency.record(latency)
+
+    def websocket_opened(self):
+        # The gateway relays websockets from many threads
+        with self._lock:
+            self._websockets += 1
+
+    def websocket_closed(self):
+        with self._lock:
+            self._websockets -= 1
+
+    def snapshot(self):
+        """Get cumulative totals since the proxy started"""
+        statuses = {}
+        bytes_in = bytes_out = 0
+        latency = LatencyHistogram()
+        for shard in self._shards:
+            with shard.lock:
+                for status, n in shard.statuses.items():
+                    statuses[str(status)] = statuses.get(str(status), 0) + n
+                bytes_in += shard.bytes_in
+                bytes_out += shard.bytes_out
+                latency.merge(shard.latency)
+        snapshot = {
+            "statuses": statuses,
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+            "websockets": self._websockets,
+            "latency": latency.to_dict(),
+            "started": self.started,
+            "time": time.time(),
+        }
+        if self.admission:
+            snapshot["admission"] = self.admission.snapshot()
+        return snapshot
+
+
+class BodyMeter:
+    """Wraps a streamed response body, counting the bytes sent"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.bytes = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.bytes += len(chunk)
+            yield chunk
+
+
+class StatsRegistry:
+    """Per-app request stats collected from all proxies
+
+    Out-of-process proxies report cumulative snapshots under a source id, so
+    a repeated report replaces rather than double counts. In-process proxies
+    like the gateway register their live ProxyStats instead.
+    """
+
+    def __init__(self, stale_after=None):
+        # Sources silent for longer than this no longer count open websockets
+        self.stale_after = stale_after or 3 * config.PROXY_STATS_FLUSH_INTERVAL
+        self._reports = {}  # app_name -> {source: snapshot}
+        self._live = {}  # app_name -> {source: ProxyStats}
+        self._lock = threading.Lock()
+
+    def report(self, app_name, source, snapshot):
+        """Store the latest snapshot of an out-of-process proxy"""
+        with self._lock:
+            self._reports.setdefault(app_name, {})[source] = snapshot
+
+    def track(self, app_name, source, stats):
+        """Register the live ProxyStats of an in-process proxy"""
+        with self._lock:
+            self._live.setdefault(app_name, {})[source] = stats
+
+    def remove(self, app_name):
+        """Drop all stats of a deleted app, a new app of that name starts at 0"""
+        with self._lock:
+            self._reports.pop(app_name, None)
+            self._live.pop(app_name, None)
+
+    def app_names(self):
+        with self._lock:
+            return set(self._reports) | set(self._live)
+
+    def summary(self, app_name):
+        """Merge the stats of all proxies of an app
+
+        Returns:
+            dict: Request counts, error rate, bytes, open websockets and
+                upstream latency percentiles in milliseconds, or None if no
+                proxy has reported for the app
+        """
+        with self._lock:
+            snapshots = list(self._reports.get(app_name, {}).values())
+            live = list(self._live.get(app_name, {}).values())
+        snapshots += [stats.snapshot() for stats in live]
+        if not snapshots:
+            return None
+
+        now = time.time()
+        statuses = {}
+        bytes_in = bytes_out = websockets = 0
+        latency = LatencyHistogram()
+        admission = {}
+        for snapshot in snapshots:
+            for status, n in snapshot.get("statuses", {}).items():
+                statuses[status] = statuses.get(status, 0) + n
+            bytes_in += snapshot.get("bytes_in", 0)
+            bytes_out += snapshot.get("bytes_out", 0)
+            fresh = now - snapshot.get("time", 0) < self.stale_after
+            if fresh:
+                websockets += snapshot.get("websockets", 0)
+            latency.merge(LatencyHistogram.from_dict(snapshot.get("latency", {})))
+            if "admission" in snapshot:
+                self._merge_admission(admission, snapshot["admission"], fresh)
+
+        requests = sum(statuses.values())
+        errors = sum(n for status, n in statuses.items() if status.startswith("5"))
+
+        def ms(seconds):
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        return {
+            "requests": requests,
+            "statuses": statuses,
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+            "websockets": websockets,
+            "latency_ms": {
+                "mean": ms(latency.sum / latency.count) if latency.count else None,
+                "p50": ms(latency.percentile(50)),
+                "p90": ms(latency.percentile(90)),
+                "p99": ms(latency.percentile(99)),
+            },
+            "admission": self._admission_summary(admission, ms) if admission else None,
+        }
+
+    @staticmethod
+    def _merge_admission(total, admission, fresh):
+        """Add the limiter snapshot of one proxy, current depths only if fresh"""
+        for key in ("admitted", "queued_total", "rejected_full", "rejected_timeout"):
+            total[key] = total.get(key, 0) + admission.get(key, 0)
+        for key in ("inflight", "queued"):
+            total[key] = total.get(key, 0) + (admission.get(key, 0) if fresh else 0)
+        total["max_queue_depth"] = max(
+            total.get("max_queue_depth", 0), admission.get("max_queue_depth", 0)
+        )
+        wait = total.setdefault("wait", LatencyHistogram())
+        wait.merge(LatencyHistogram.from_dict(admission.get("wait", {})))
+
+    @staticmethod
+    def _admission_summary(admission, ms):
+        wait = admission.pop("wait")
+        return {
+            **admission,
+            "rejected": admission["rejected_full"] + admission["rejected_timeout"],
+            "wait_ms": {"p50": ms(wait.percentile(50)), "p90": ms(wait.percentile(90))},
+        }
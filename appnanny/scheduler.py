@@ -1,60 +1,87 @@
-import logging
-from logging.handlers import RotatingFileHandler
 import time
 
-import requests
 from apscheduler.schedulers.background import BackgroundScheduler
 
+from appnanny_client import AppNannyClient, AppNannyError
+from config import active_config as config
+from logging_config import setup_logging
+from memory_evictor import MemoryPressureEvictor
 
-# Configure logging
-LOG_FILE = "scheduler.log"
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
-logger = logging.getLogger("appnanny_scheduler")
-handler = RotatingFileHandler(LOG_FILE, maxBytes=2_000_000, backupCount=2)
-handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
-logger.addHandler(handler)
+logger = setup_logging("appnanny_scheduler", config.SCHEDULER_LOG_FILE)
 
 API_BASE = "http://localhost:5000"
 EXPIRY_TIME = 3 * 24 * 3600  # 3 days in seconds
 
+client = AppNannyClient(API_BASE)
+
 
 def check_expired_apps():
     """Check and stop expired apps via API calls"""
     logger.info("Running check_expired_apps...")
     try:
-        # Get list of all apps
-        response = requests.get(f"{API_BASE}/apps")
-        if response.status_code != 200:
-            logger.error(f"Failed to get apps list: {response.text}")
-            return
+        apps = client.list_apps()
+    except AppNannyError as e:
+        logger.error("Failed to get apps list: %s", e)
+        return
 
-        apps = response.json()
+    try:
         current_time = time.time()
-
+        expired = []
         for app_name, info in apps.items():
             if info["running"]:
                 uptime = current_time - info.get("last_access_time", info["uptime"])
                 if uptime > EXPIRY_TIME:
                     logger.info(
-                        f"Stopping expired app {app_name} (idle for {uptime/3600:.1f} hours)"
+                        "Stopping expired app %s (idle for %.1f hours)",
+                        app_name,
+                        uptime / 3600,
                     )
-                    stop_response = requests.post(f"{API_BASE}/stop/{app_name}")
-                    if stop_response.status_code != 200:
-                        logger.error(
-                            f"Failed to stop app {app_name}: {stop_response.text}"
-                        )
+                    expired.append(app_name)
 
-    except Exception as e:
+        for app_name, result in client.stop_apps(expired).items():
+            if isinstance(result, AppNannyError):
+                logger.error("Failed to stop app %s: %s", app_name, result)
+    except Exception:
         logger.exception("Error in check_expired_apps")
 
 
+def _stop_app(app_name):
+    try:
+        client.stop_app(app_name)
+        return True
+    except AppNannyError as e:
+        logger.error("Failed to stop app %s: %s", app_name, e)
+        return False
+
+
+evictor = MemoryPressureEvictor(client.list_apps, _stop_app)
+
+
+def check_memory_pressure():
+    """Stop least recently accessed apps while the host is short of memory"""
+    try:
+        evictor.check()
+    except Exception:
+        logger.exception("Error in check_memory_pressure")
+
+
+def autoscale_apps():
+    """Let the service adjust replica counts of autoscaled apps"""
+    try:
+        changes = client.autoscale()
+        if changes:
+            logger.info("Autoscaled apps: %s", changes)
+    except Exception:
+        logger.exception("Error in autoscale_apps")
+
+
 def main():
     scheduler = BackgroundScheduler()
     scheduler.add_job(check_expired_apps, "interval", minutes=5)
+    scheduler.add_job(
+        check_memory_pressure, "interval", seconds=config.EVICTION_CHECK_INTERVAL
+    )
+    scheduler.add_job(autoscale_apps, "interval", seconds=config.AUTOSCALE_INTERVAL)
     scheduler.start()
 
     try:
@@ -0,0 +1,166 @@
+import heapq
+import itertools
+import threading
+import time
+
+from app_types import readiness_path
+from config import active_config as config
+from logging_config import logger
+from port_utils import wait_until_ready
+
+
+class TokenBucket:
+    """Token bucket whose refill rate drops while the host is busy"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._last_refill = time.time()
+
+    @staticmethod
+    def load_factor():
+        """Fraction of the nominal rate allowed by current CPU and IO load"""
+        import psutil  # slow to import, load it on first use
+
+        cpu = psutil.cpu_percent(interval=None)
+        iowait = getattr(psutil.cpu_times_percent(interval=None), "iowait", 0.0)
+        cpu_headroom = (100 - cpu) / (100 - config.START_CPU_BUSY)
+        io_headroom = 1 - iowait / config.START_IOWAIT_MAX
+        return max(config.START_MIN_RATE_FACTOR, min(1.0, cpu_headroom, io_headroom))
+
+    def take(self):
+        """Take a token if one is available"""
+        now = time.time()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self._last_refill) * self.rate * self.load_factor(),
+        )
+        self._last_refill = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class StartScheduler:
+    """Admission control in front of AppService.start_app
+
+    Starts wait for a free slot (at most MAX_CONCURRENT_STARTS apps booting
+    at once) and a token from a CPU/IO-aware token bucket. Waiting starts are
+    admitted hottest first, by recent access frequency. A slot is held until
+    the app answers HTTP, so interpreter cold starts are staggered instead of
+    all competing for CPU and disk at once.
+    """
+
+    def __init__(self, app_service, max_concurrent=None):
+        self.app_service = app_service
+        self.state_manager = app_service.state_manager
+        self.max_concurrent = max_concurrent or config.MAX_CONCURRENT_STARTS
+        self.bucket = TokenBucket(config.START_RATE, config.START_BURST)
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (-priority, seq, app_name)
+        self._seq = itertools.count()
+        self._active = 0
+
+    def _acquire(self, app_name, priority):
+        item = (-priority, next(self._seq), app_name)
+        with self._cond:
+            heapq.heappush(self._waiting, item)
+            while not (
+                self._waiting[0] is item
+                and self._active < self.max_concurrent
+                and self.bucket.take()
+            ):
+                # Tokens refill over time, so poll as well as wait for notify
+                self._cond.wait(timeout=0.2)
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self._cond.notify_all()
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def start(self, app_name, priority=None):
+        """Start an app once admitted (blocking)
+
+        Args:
+            app_name: Name of the app
+            priority: Admission priority, defaults to the app's access score
+
+        Returns:
+            int: Port of the started app, or None on failure
+        """
+        # Unknown apps must not take a token and a slot before failing
+        if not self.state_manager.get_app_metadata(app_name):
+            logger.error("App '%s' not found in metadata", app_name)
+            return None
+        if self.state_manager.is_app_running(app_name):
+            return self.state_manager.get_app_port(app_name)
+        if priority is None:
+            priority = self.state_manager.get_access_score(app_name)
+
+        queued = time.time()
+        self._acquire(app_name, priority)
+        admitted = time.time()
+        logger.info(
+            "Start of app '%s' admitted after %.2fs (priority %.2f)",
+            app_name,
+            admitted - queued,
+            priority,
+        )
+        try:
+            # Started by a concurrent call while this one was queued
+            if self.state_manager.is_app_running(app_name):
+                return self.state_manager.get_app_port(app_name)
+            port = self.app_service.start_app(app_name)
+            if port and not wait_until_ready(
+                port,
+                self.state_manager.get_app_process(app_name),
+                path=readiness_path(
+                    self.state_manager.get_app_metadata(app_name)["type"]
+                ),
+            ):
+                logger.warning("App '%s' not ready on port %s in time", app_name, port)
+            return port
+        finally:
+            self._release()
+            logger.info(
+                "Start of app '%s' finished in %.2fs", app_name, time.time() - admitted
+            )
+
+    def queue_depth(self):
+        """Get number of starts waiting for admission"""
+        return len(self._waiting)
+
+    def submit(self, app_names):
+        """Queue starts in the background, hottest apps first
+
+        Returns:
+            list: App names in admission order, unknown apps are left out
+        """
+        known = []
+        for app_name in app_names:
+            if self.state_manager.get_app_metadata(app_name):
+                known.append(app_name)
+            else:
+                logger.warning("App '%s' not found, not starting it", app_name)
+        order = sorted(known, key=self.state_manager.get_access_score, reverse=True)
+        for app_name in order:
+            threading.Thread(
+                target=self.start, args=(app_name,), name=f"start-{app_name}"
+            ).start()
+        return order
+
+    def restore_previous(self):
+        """Start the apps that were running when the service went down"""
+        app_names = [
+            am["name"]
+            for am in self.state_manager.get_all_metadata()
+            if am.get("is_active") and not self.state_manager.is_app_running(am["name"])
+        ]
+        if app_names:
+            logger.info("Restoring %d previously running apps", len(app_names))
+        return self.submit(app_names)
@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+from config import active_config as config
+from logging_config import logger
+
+JOURNAL_FILE = ".appnanny_journal"
+
+# fdatasync skips the inode timestamps, fsync where it is not available
+_datasync = getattr(os, "fdatasync", os.fsync)
+
+
+def _encode(record):
+    payload = json.dumps(record, separators=(",", ":")).encode()
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def _decode(line):
+    """Decode a journal line, None if it is torn or corrupt"""
+    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b" ":
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+class StateJournal:
+    """Append-only write-ahead log of state changes
+
+    Records are JSON lines with a CRC, so a write torn by a crash is detected
+    and dropped on replay. A background thread writes and fsyncs whatever has
+    been appended since its last round, so concurrent changes share one fsync
+    (group commit). Callers needing durability wait() for their record;
+    others go on at once and are synced within one round. A failed write is
+    cut off the file and its records retried in the next round.
+
+    The owner folds the journal into its own files at checkpoints: when the
+    journal grows past JOURNAL_CHECKPOINT_BYTES, which bounds replay time at
+    startup, or every JOURNAL_CHECKPOINT_INTERVAL seconds.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._buffer = []
+        self._seq = 0  # last appended record
+        self._durable_seq = 0  # last record on disk
+        self._error = None  # of the last round, if it failed
+        self._size = 0
+        self._cond = threading.Condition()
+        # Held while writing to the file, so a reset cannot interleave
+        self._io_lock = threading.Lock()
+        self._on_checkpoint = None
+        self._last_checkpoint = time.time()
+
+    def replay(self):
+        """Read the valid records of the journal and open it for appending
+
+        Everything from the first torn or corrupt record on is cut off.
+
+        Returns:
+            list: Records in append order
+        """
+        records = []
+        valid_bytes = 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                for line in f:
+                    record = _decode(line)
+                    if record is None:
+                        break
+                    records.append(record)
+                    valid_bytes += len(line)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size > valid_bytes:
+            logger.warning(
+                "Dropping %d bytes of torn journal records in %s",
+                size - valid_bytes,
+                self.path,
+            )
+            os.ftruncate(self._fd, valid_bytes)
+            _datasync(self._fd)
+        os.lseek(self._fd, valid_bytes, os.SEEK_SET)
+        self._size = valid_bytes
+        if records:
+            logger.info("Replayed %d journal records", len(records))
+        return records
+
+    def start(self, on_checkpoint):
+        """Start the writer thread
+
+        Args:
+            on_checkpoint: Called without arguments from the writer thread
+                when a checkpoint is due; it must persist the state and call
+                reset() once it has
+        """
+        self._on_checkpoint = on_checkpoint
+        threading.Thread(target=self._write_loop, name="journal", daemon=True).start()
+
+    def append(self, record):
+        """Add a record
+
+        Returns:
+            int: Sequence number of the record, see wait()
+        """
+        with self._cond:
+            self._buffer.append(_encode(record))
+            self._seq += 1
+            self._cond.notify_all()
+            return self._seq
+
+    def wait(self, seq):
+        """Block until the record with a sequence number is on disk
+
+        Raises:
+            OSError: The journal could not be written; the record stays
+                queued and is retried
+        """
+        with self._cond:
+            while self._durable_seq < seq:
+                if self._error:
+                    raise self._error
+                self._cond.wait()
+
+    def reset(self):
+        """Empty the journal once its records are persisted elsewhere
+
+        Records still buffered count as persisted too, so the caller must
+        hold back new appends until its state is written.
+        """
+        with self._io_lock:
+            with self._cond:
+                self._buffer = []
+                os.ftruncate(self._fd, 0)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                _datasync(self._fd)
+                self._size = 0
+                self._durable_seq = self._seq
+                self._error = None
+                self._last_checkpoint = time.time()
+                self._cond.notify_all()
+
+    def _checkpoint_due(self):
+        return self._size >= config.JOURNAL_CHECKPOINT_BYTES or (
+            self._size
+            and time.time() - self._last_checkpoint
+            >= config.JOURNAL_CHECKPOINT_INTERVAL
+        )
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                if not self._buffer:
+                    self._cond.wait(config.JOURNAL_CHECKPOINT_INTERVAL)
+            try:
+                self._flush()
+                if self._checkpoint_due():
+                    self._on_checkpoint()
+            except Exception:
+                logger.exception("Failed to write state journal")
+                time.sleep(1)
+
+    def _flush(self):
+        with self._io_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+                seq = self._seq
+            if batch:
+                data = b"".join(batch)
+                try:
+                    self._write(data)
+                except OSError as e:
+                    with self._cond:
+                        # Ahead of records appended meanwhile, order matters
+                        self._buffer[:0] = batch
+                        self._error = e
+                        self._cond.notify_all()
+                    raise
+                self._size += len(data)
+            with self._cond:
+                self._durable_seq = max(self._durable_seq, seq)
+                self._error = None
+                self._cond.notify_all()
+
+    def _write(self, data):
+        """Append and sync data, leaving the file as it was on failure"""
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.write(self._fd, view)
+                view = view[written:]
+            _datasync(self._fd)
+        except OSError:
+            # A partial record would hide everything after it on replay
+            try:
+                os.ftruncate(self._fd, self._size)
+                os.lseek(self._fd, self._size, os.SEEK_SET)
+            except OSError as e:
+                logger.error("Failed to cut off partial journal write: %s", e)
+            raise
@@ -0,0 +1,56 @@
+import marshal
+import mmap
+import os
+import sys
+
+from logging_config import logger
+
+SNAPSHOT_FILE = ".appnanny_snapshot"
+# marshal's format depends on the Python version, so it is part of the header
+MAGIC = b"ANSNAP1" + bytes(sys.version_info[:2])
+HEADER_SIZE = len(MAGIC)
+
+
+def save_snapshot(path, state):
+    """Write state (plain dicts, lists and scalars) as a binary snapshot
+
+    Written on clean shutdown only; load_snapshot() consumes it, so a crash
+    afterwards falls back to the per-app files instead of an outdated snapshot.
+    """
+    tmp_file = f"{path}.tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            f.write(MAGIC)
+            marshal.dump(state, f)
+        os.replace(tmp_file, path)
+    except (OSError, ValueError) as e:
+        logger.error("Failed to write state snapshot: %s", e)
+
+
+def load_snapshot(path):
+    """Map and decode a snapshot, then delete it
+
+    Returns:
+        dict: State passed to save_snapshot(), or None if there is no usable
+            snapshot
+    """
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:HEADER_SIZE] != MAGIC:
+                    logger.info("Ignoring state snapshot of another version")
+                    state = None
+                else:
+                    with memoryview(mm) as view:
+                        state = marshal.loads(view[HEADER_SIZE:])
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, EOFError, TypeError) as e:
+        logger.warning("Ignoring unreadable state snapshot: %s", e)
+        state = None
+
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning("Failed to remove state snapshot: %s", e)
+    return state
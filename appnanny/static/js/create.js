@@ -14,6 +14,11 @@ function createApp() {
         email: document.getElementById('email').value,
         env: JSON.parse(document.getElementById('envVars').value)
     };
+    // Empty fields keep the app type's defaults
+    ['workers', 'threads'].forEach(key => {
+        const value = document.getElementById(key).value;
+        if (value) data[key] = parseInt(value, 10);
+    });
 
     fetch('/create', {
         method: 'POST',
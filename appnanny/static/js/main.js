@@ -19,7 +19,7 @@ function loadApps() {
             
             Object.entries(apps).forEach(([name, app]) => {
                 const row = document.createElement('tr');
-                const appUrl = app.running ? `http://${window.location.hostname}:${app.port}` : '#';
+                const appUrl = app.running ? getAppUrl(name, app) : '#';
                 row.innerHTML = `
                     <td>
                         <a href="${appUrl}" target="_blank" 
@@ -34,6 +34,9 @@ function loadApps() {
                         ${app.running ? 'Running' : 'Stopped'}
                     </span></td>
                     <td><span class="uptime">${formatUptime(app.uptime)}</span></td>
+                    <td>${app.stats ? app.stats.requests : 'N/A'}</td>
+                    <td>${formatLatency(app.stats)}</td>
+                    <td>${app.stats ? (app.stats.error_rate * 100).toFixed(1) + '%' : 'N/A'}</td>
                     <td>
                         ${app.running ? 
                             `<button onclick="stopApp('${name}')" class="btn btn-sm btn-danger">Stop</button>` :
@@ -41,6 +44,7 @@ function loadApps() {
                         }
                         <button onclick="restartApp('${name}')" class="btn btn-sm btn-warning">Restart</button>
                         <button onclick="window.location.href='/env/${name}'" class="btn btn-sm btn-info">Env</button>
+                        <button onclick="deleteApp('${name}')" class="btn btn-sm btn-outline-danger">Delete</button>
                     </td>
                 `;
                 tbody.appendChild(row);
@@ -52,6 +56,18 @@ function loadApps() {
         });
 }
 
+function getAppUrl(name, app) {
+    const gateway = window.APPNANNY_GATEWAY;
+    if (!gateway) {
+        // Apps listed by the cluster coordinator run on their agent's host
+        return `http://${app.host || window.location.hostname}:${app.port}`;
+    }
+    if (gateway.routing === 'subdomain') {
+        return `http://${name}.${gateway.domain}:${gateway.port}/`;
+    }
+    return `http://${window.location.hostname}:${gateway.port}/app/${name}/`;
+}
+
 function stopApp(name) {
     fetch(`/stop/${name}`, { method: 'POST' })
         .then(response => response.json())
@@ -91,6 +107,27 @@ function restartApp(name) {
         });
 }
 
+function deleteApp(name) {
+    if (!confirm(`Delete ${name}? It will be stopped and moved to the backup directory.`)) {
+        return;
+    }
+    fetch(`/delete/${name}`, { method: 'POST' })
+        .then(response => response.json())
+        .then(result => {
+            showNotification(result.message || result.error, result.error ? 'error' : 'success');
+            loadApps();
+        })
+        .catch(error => {
+            showNotification(`Error deleting ${name}`, 'error');
+            console.error('Error deleting app:', error);
+        });
+}
+
+function formatLatency(stats) {
+    if (!stats || stats.latency_ms.p90 === null) return 'N/A';
+    return `${stats.latency_ms.p90} ms`;
+}
+
 function formatUptime(seconds) {
     if (!seconds) return 'N/A';
     const hours = Math.floor(seconds / 3600);
@@ -1,7 +1,10 @@
 import asyncio
+import time
+
 import websockets
 
 from base_proxy import BaseProxy
+from load_balancer import sticky_port_from_cookie_header
 
 
 class WebSocketProxy(BaseProxy):
@@ -11,19 +14,30 @@ class WebSocketProxy(BaseProxy):
         self.loop = None
 
     async def _handle_connection(self, websocket, path):
+        # Sessions live in one replica, reconnects must go back to it
+        sticky = sticky_port_from_cookie_header(websocket.request_headers.get("Cookie"))
+        port = self.balancer.choose(self.target_ports, sticky)
+        self.balancer.acquire(port)
+        self.stats.websocket_opened()
         try:
-            async with websockets.connect(
-                f"ws://localhost:{self.target_port}{path}"
-            ) as ws:
+            async with websockets.connect(f"ws://localhost:{port}{path}") as ws:
                 # Bidirectional relay
                 while True:
                     message = await websocket.recv()
+                    begin = time.time()
                     await ws.send(message)
                     response = await ws.recv()
+                    # Each message round trip counts as one request
+                    self.stats.record_request(
+                        101, len(message), len(response), time.time() - begin
+                    )
                     await websocket.send(response)
                     self._send_heartbeat()
         except Exception as e:
-            self.logger.error(f"WebSocket error: {e}")
+            self.logger.error("WebSocket error: %s", e)
+        finally:
+            self.stats.websocket_closed()
+            self.balancer.release(port)
 
     def start(self, host="0.0.0.0", port=None):
         if port is None:
@@ -38,7 +52,7 @@ class WebSocketProxy(BaseProxy):
             asyncio.set_event_loop(self.loop)
             self.loop.run_until_complete(start_server())
         except Exception as e:
-            self.logger.error(f"Failed to start WebSocket proxy: {e}")
+            self.logger.error("Failed to start WebSocket proxy: %s", e)
         finally:
             if self.loop:
                 self.loop.close()
@@ -1,14 +1,15 @@
-from setuptools import setup, find_packages
+from setuptools import setup
 
 setup(
     name="appnanny",
     version="0.1",
-    packages=find_packages(),
-    install_requires=[
-        "flask",
-        "requests",
-        "apscheduler",
-        "streamlit",
-    ],
+    # Only the client and CLI are installed, the service itself runs from
+    # the appnanny/ directory
+    package_dir={"": "appnanny"},
+    packages=["appnanny_client"],
+    install_requires=["requests"],
+    entry_points={
+        "console_scripts": ["appnanny=appnanny_client.cli:main"],
+    },
     python_requires=">=3.10",
 )
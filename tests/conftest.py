@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Modules of the service import each other by plain name, and config reads
+# the storage path once on import
+APPNANNY_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "appnanny")
+sys.path.insert(0, APPNANNY_DIR)
+os.environ.setdefault("APPNANNY_STORAGE_PATH", tempfile.mkdtemp(prefix="appnanny-"))
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from flask import Flask
+
+from admission import AdmissionLimiter, limits_for
+from base_proxy import relay_upstream
+from load_balancer import LoadBalancer
+from proxy_stats import ProxyStats
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_limits_scale_with_replicas():
+    assert limits_for({"max_inflight": 4, "max_queue": 10}, 3) == (12, 10)
+    assert limits_for({"max_inflight": 4, "max_queue": 10}, 0) == (4, 10)
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    limiter = AdmissionLimiter(max_inflight=1, max_queue=10, queue_timeout=5)
+    assert limiter.acquire()
+    order = []
+
+    def request(i):
+        assert limiter.acquire()
+        order.append(i)
+
+    threads = []
+    for i in range(5):
+        thread = threading.Thread(target=request, args=(i,))
+        thread.start()
+        threads.append(thread)
+        # Queue them one by one, so arrival order is known
+        _wait_for(lambda: limiter.snapshot()["queued"] == i + 1)
+
+    for i in range(5):
+        limiter.release()
+        _wait_for(lambda: len(order) == i + 1)
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3, 4]
+    assert limiter.snapshot()["max_queue_depth"] == 5
+
+
+def test_full_queue_rejects_at_once():
+    limiter = AdmissionLimiter(max_inflight=1, max_queue=0, queue_timeout=5)
+    assert limiter.acquire()
+    begin = time.time()
+    assert not limiter.acquire()
+    assert time.time() - begin < 1
+    assert limiter.snapshot()["rejected_full"] == 1
+
+
+def test_queued_request_times_out():
+    limiter = AdmissionLimiter(max_inflight=1, max_queue=1, queue_timeout=0.05)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    snapshot = limiter.snapshot()
+    assert snapshot["rejected_timeout"] == 1
+    assert snapshot["queued"] == 0
+    assert limiter.retry_after() == 1
+
+
+def test_raised_limit_admits_waiters():
+    limiter = AdmissionLimiter(max_inflight=1, max_queue=1, queue_timeout=5)
+    assert limiter.acquire()
+    admitted = []
+    thread = threading.Thread(target=lambda: admitted.append(limiter.acquire()))
+    thread.start()
+    _wait_for(lambda: limiter.snapshot()["queued"] == 1)
+    limiter.set_limits(2, 1)
+    thread.join()
+    assert admitted == [True]
+
+
+def test_rejected_request_is_503_with_retry_after():
+    limiter = AdmissionLimiter(max_inflight=1, max_queue=0)
+    assert limiter.acquire()
+    stats = ProxyStats()
+
+    def send(port):
+        raise AssertionError("rejected requests must not reach the upstream")
+
+    with Flask(__name__).test_request_context("/"):
+        response = relay_upstream(
+            "app1",
+            send,
+            lambda: [8001],
+            b"",
+            limiter,
+            LoadBalancer(),
+            stats,
+            None,
+        )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert stats.snapshot()["statuses"] == {"503": 1}
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+
+import pytest
+
+import app_store
+import state_journal
+from app_store import AppStore
+from state_journal import StateJournal
+
+
+def _app(name, **fields):
+    return {"name": name, "type": "streamlit", **fields}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    """Opened journal without a writer thread, flushed by the test"""
+    journal = StateJournal(str(tmp_path / "journal"))
+    journal.replay()
+    return journal
+
+
+def test_replay_cuts_off_torn_tail(journal):
+    journal.append({"op": "save", "n": 1})
+    journal.append({"op": "save", "n": 2})
+    journal._flush()
+    size = os.path.getsize(journal.path)
+    with open(journal.path, "ab") as f:
+        f.write(b'1234abcd {"op": "sa')
+
+    reopened = StateJournal(journal.path)
+    assert [r["n"] for r in reopened.replay()] == [1, 2]
+    assert os.path.getsize(journal.path) == size
+
+
+def test_replay_stops_at_corrupt_record(journal):
+    journal.append({"op": "save", "n": 1})
+    journal.append({"op": "save", "n": 2})
+    journal._flush()
+    with open(journal.path, "r+b") as f:
+        data = f.read()
+        # Flip a payload byte of the first record, its CRC no longer matches
+        f.seek(data.index(b'"n":1') + 4)
+        f.write(b"7")
+
+    assert StateJournal(journal.path).replay() == []
+    assert os.path.getsize(journal.path) == 0
+
+
+def test_failed_flush_keeps_records_for_retry(journal, monkeypatch):
+    seq = journal.append({"op": "save", "n": 1})
+
+    def fail(fd):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(state_journal, "_datasync", fail)
+    with pytest.raises(OSError):
+        journal._flush()
+    with pytest.raises(OSError):
+        journal.wait(seq)
+    assert os.path.getsize(journal.path) == 0
+
+    later = journal.append({"op": "save", "n": 2})
+    monkeypatch.undo()
+    journal._flush()
+    journal.wait(later)
+    assert [r["n"] for r in StateJournal(journal.path).replay()] == [1, 2]
+
+
+def test_concurrent_saves_share_fsyncs(tmp_path, monkeypatch):
+    syncs = []
+
+    def slow_sync(fd):
+        syncs.append(fd)
+        time.sleep(0.01)
+
+    monkeypatch.setattr(state_journal, "_datasync", slow_sync)
+    store = AppStore(str(tmp_path))
+    threads = [
+        threading.Thread(target=store.save, args=(_app(f"app{i}"),)) for i in range(50)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 0 < len(syncs) < len(threads)
+
+
+def test_checkpoint_writes_files_and_resets_journal(tmp_path):
+    os.makedirs(tmp_path / "app1")
+    store = AppStore(str(tmp_path))
+    assert store.save(_app("app1", port=8001))
+    assert not os.path.exists(store.metadata_path("app1"))
+    assert os.path.getsize(store._journal.path) > 0
+
+    assert store.checkpoint()
+    assert store._read_metadata("app1")["port"] == 8001
+    assert os.path.getsize(store._journal.path) == 0
+
+
+def test_journal_is_replayed_after_crash(tmp_path):
+    os.makedirs(tmp_path / "app1")
+    store = AppStore(str(tmp_path))
+    store.add(_app("app1", port=8001))
+    store.save(_app("app1", port=8002))
+
+    # A new store on the same directory, as after a restart without checkpoint
+    restarted = AppStore(str(tmp_path))
+    assert restarted._read_metadata("app1")["port"] == 8002
+    assert restarted.load_all() == [_app("app1", port=8002)]
+    assert os.path.getsize(restarted._journal.path) == 0
+
+
+def test_failed_checkpoint_keeps_journal(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / "app1")
+    os.makedirs(tmp_path / "app2")
+    store = AppStore(str(tmp_path))
+    store.save(_app("app1", port=8001))
+    store.save(_app("app2", port=8002))
+    written = app_store.write_json_atomic
+
+    def fail_app1(path, data):
+        if data.get("name") == "app1":
+            raise OSError(28, "No space left on device")
+        written(path, data)
+
+    monkeypatch.setattr(app_store, "write_json_atomic", fail_app1)
+    assert not store.checkpoint()
+    assert set(store._dirty) == {"app1"}
+    assert store._read_metadata("app2")["port"] == 8002
+    assert os.path.getsize(store._journal.path) > 0
+
+    monkeypatch.undo()
+    assert store.checkpoint()
+    assert store._read_metadata("app1")["port"] == 8001
+    assert os.path.getsize(store._journal.path) == 0
+
+
+def test_load_all_includes_apps_not_checkpointed(tmp_path):
+    store = AppStore(str(tmp_path))
+    store.add(_app("app1"))
+    assert store.load_all() == [_app("app1")]
+
+    # Without an index the directory scan finds no metadata file either
+    os.remove(store.index_file)
+    assert store.load_all() == [_app("app1")]
+
+
+def test_checkpoint_during_delete_does_not_restore_app(tmp_path):
+    os.makedirs(tmp_path / "app1")
+    store = AppStore(str(tmp_path))
+    store.add(_app("app1"))
+
+    # The writer thread may checkpoint after the directory moved to the backup
+    os.rename(tmp_path / "app1", tmp_path / "app1-backup")
+    assert store.checkpoint()
+    store.remove("app1")
+
+    assert not os.path.exists(tmp_path / "app1")
+    assert AppStore(str(tmp_path)).load_all() == []
+    assert store.rebuild_index() == []
@@ -0,0 +1,61 @@
+import os
+
+from asset_cache import AssetCache
+
+
+def _cache(tmp_path, **limits):
+    return AssetCache(
+        memory_bytes=limits.get("memory_bytes", 10),
+        disk_bytes=limits.get("disk_bytes", 1000),
+        cache_dir=str(tmp_path),
+    )
+
+
+def _disk_usage(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+        if name != "meta.json"
+    )
+
+
+def test_only_hashed_paths_are_cacheable(tmp_path):
+    cache = _cache(tmp_path)
+    assert cache.is_cacheable("streamlit", "static/js/main.3f2a9c1b.js")
+    assert not cache.is_cacheable("streamlit", "static/js/main.js")
+    assert cache.is_cacheable("voila", "voila/static/568.4c1b0f9e2a.js")
+    assert not cache.is_cacheable("voila", "voila/static/voila.js")
+    assert not cache.is_cacheable("voila", "static/components/require.js")
+
+
+def test_disk_spill_is_bounded(tmp_path):
+    cache = _cache(tmp_path, disk_bytes=100)
+    for i in range(20):
+        cache.put("ns", f"asset{i}", b"%02d" % i * 10, "image/png")
+    assert cache.stats()["disk_bytes"] <= 100
+    assert _disk_usage(tmp_path) <= 100
+    assert cache.get("ns", "asset19") is not None
+
+
+def test_files_of_previous_runs_are_removed(tmp_path):
+    first = _cache(tmp_path)
+    for i in range(5):
+        first.put("ns", f"asset{i}", b"%02d" % i * 10, "image/png")
+    assert _disk_usage(tmp_path) > 0
+    legacy = tmp_path / "ab" / "ab12"
+    legacy.mkdir(parents=True)
+    (legacy / "identity").write_bytes(b"x" * 50)
+
+    # A restarted process has no index of what the last run spilled
+    second = _cache(tmp_path)
+    assert _disk_usage(tmp_path) == 0
+    assert os.listdir(tmp_path) == [os.path.basename(second.cache_dir)]
+
+
+def test_directories_of_running_processes_are_kept(tmp_path):
+    other = tmp_path / "pid-1"
+    other.mkdir()
+    (other / "kept").write_bytes(b"x")
+    _cache(tmp_path)
+    assert (other / "kept").exists()
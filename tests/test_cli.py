@@ -0,0 +1,32 @@
+import pytest
+
+from appnanny_client.cli import build_parser
+
+
+def _create_args(*extra):
+    return [
+        "create",
+        "app1",
+        "--type",
+        "streamlit",
+        "--repo",
+        "https://example.com/app1.git",
+        "--path",
+        "main.py",
+        "--email",
+        "dev@example.com",
+        *extra,
+    ]
+
+
+def test_env_values_are_split_at_first_equals_sign():
+    args = build_parser().parse_args(_create_args("--env", "A=1", "--env", "B=x=y"))
+    assert dict(args.env) == {"A": "1", "B": "x=y"}
+
+
+@pytest.mark.parametrize("item", ["NOVALUE", "=1"])
+def test_env_without_key_is_usage_error(item, capsys):
+    with pytest.raises(SystemExit) as exc:
+        build_parser().parse_args(_create_args("--env", item))
+    assert exc.value.code == 2
+    assert "expected KEY=VALUE" in capsys.readouterr().err
@@ -0,0 +1,228 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import git
+import pytest
+import requests
+
+from config import active_config as config
+from conftest import APPNANNY_DIR
+from coordinator import Coordinator, create_coordinator_app
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Agent at {url} exited with {process.returncode}")
+        try:
+            requests.get(f"{url}/node", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Agent at {url} did not come up")
+
+
+# App type whose script listens only after a delay, like a slow app start
+SLOW_TYPE_PLUGIN = """
+import sys
+
+from app_types import AppType, register
+
+
+class SlowType(AppType):
+    name = "slow"
+
+    def command(self, script, port, workers, threads, entrypoint=None):
+        return [sys.executable, script, str(port)]
+
+
+register(SlowType())
+"""
+
+SLOW_SERVER = """
+import sys
+import time
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+time.sleep(3)
+HTTPServer(("127.0.0.1", int(sys.argv[1])), SimpleHTTPRequestHandler).serve_forever()
+"""
+
+
+@pytest.fixture(scope="module")
+def agents(tmp_path_factory):
+    """Two AppNanny services on localhost, each with its own storage"""
+    plugin_dir = tmp_path_factory.mktemp("plugins")
+    (plugin_dir / "slow_app_type.py").write_text(SLOW_TYPE_PLUGIN)
+    processes, urls = [], []
+    try:
+        for i in range(2):
+            port = _free_port()
+            env = {
+                **os.environ,
+                "PYTHONPATH": str(plugin_dir),
+                "APPNANNY_APP_TYPE_PLUGINS": "slow_app_type",
+                "FLASK_ENV": "production",
+                "APPNANNY_PORT": str(port),
+                "APPNANNY_STORAGE_PATH": str(tmp_path_factory.mktemp(f"agent{i}")),
+            }
+            process = subprocess.Popen(
+                [sys.executable, "app.py"],
+                cwd=APPNANNY_DIR,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            processes.append(process)
+            urls.append(f"http://127.0.0.1:{port}")
+        for url, process in zip(urls, processes):
+            _wait_until_up(url, process)
+        yield urls
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(10)
+
+
+@pytest.fixture(scope="module")
+def client(agents, tmp_path_factory):
+    state_file = tmp_path_factory.mktemp("coordinator") / "placements.json"
+    coordinator = Coordinator(agents, str(state_file))
+    return create_coordinator_app(coordinator).test_client()
+
+
+@pytest.fixture(scope="module")
+def repo(tmp_path_factory):
+    path = tmp_path_factory.mktemp("repo")
+    (path / "main.py").write_text("print('hello')\n")
+    r = git.Repo.init(path)
+    r.index.add(["main.py"])
+    r.index.commit("init")
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def slow_repo(tmp_path_factory):
+    path = tmp_path_factory.mktemp("slow_repo")
+    (path / "server.py").write_text(SLOW_SERVER)
+    r = git.Repo.init(path)
+    r.index.add(["server.py"])
+    r.index.commit("init")
+    return str(path)
+
+
+def _create(client, name, repo, **extra):
+    return client.post(
+        "/create",
+        json={
+            "name": name,
+            "type": "streamlit",
+            "repo": repo,
+            "path": "main.py",
+            "email": "dev@example.com",
+            **extra,
+        },
+    )
+
+
+def test_nodes_reports_every_agent(client, agents):
+    nodes = client.get("/nodes").get_json()
+    assert set(nodes) == set(agents)
+    assert all(info and info["cpu_count"] > 0 for info in nodes.values())
+
+
+def test_create_places_app_on_requested_agent(client, agents, repo):
+    resp = _create(client, "placed", repo, node=agents[1])
+    assert resp.status_code == 200
+
+    apps = client.get("/apps").get_json()
+    assert apps["placed"]["node"] == agents[1]
+    assert not apps["placed"]["running"]
+    assert requests.get(f"{agents[0]}/apps").json().get("placed") is None
+
+
+def test_create_spreads_apps_over_agents(client, agents, repo):
+    assert _create(client, "auto", repo).status_code == 200
+    apps = client.get("/apps").get_json()
+    assert apps["auto"]["node"] in agents
+
+
+def test_control_is_forwarded_to_hosting_agent(client, agents, repo):
+    _create(client, "stopped", repo, node=agents[0])
+    # Relayed as the agent answered, the app is not running there
+    resp = client.post("/stop/stopped")
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "Failed to stop app 'stopped'"}
+    assert client.post("/stop/unknown").status_code == 404
+
+
+def test_create_on_unreachable_agent_is_502(client, repo):
+    resp = _create(client, "lost", repo, node=f"http://127.0.0.1:{_free_port()}")
+    assert resp.status_code == 502
+    assert resp.get_json() == {"error": "Agent unreachable"}
+
+
+def test_scale_and_pin_are_forwarded(client, agents, repo):
+    _create(client, "tuned", repo, node=agents[1])
+    assert client.post("/scale/tuned", json={"max_queue": 8}).status_code == 200
+    assert client.post("/pin/tuned", json={"priority": 3}).status_code == 200
+    apps = requests.get(f"{agents[1]}/apps").json()
+    assert apps["tuned"]["priority"] == 3
+
+
+def test_delete_removes_app_and_placement(client, agents, repo):
+    _create(client, "doomed", repo, node=agents[0])
+    assert client.post("/delete/doomed").status_code == 200
+    assert "doomed" not in client.get("/apps").get_json()
+    assert client.post("/delete/doomed").status_code == 404
+
+
+def test_invalid_priority_is_400(client, agents, repo):
+    _create(client, "picky", repo, node=agents[0])
+    resp = client.post("/pin/picky", json={"priority": "high"})
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "priority must be an integer"}
+
+
+@pytest.mark.parametrize(
+    "path, data",
+    [
+        ("/scale/picky", {"replicas": "abc"}),
+        ("/scale/picky", {"replicas": 0}),
+        ("/scale/picky", {"max_queue": [1]}),
+    ],
+)
+def test_invalid_scale_is_400(client, agents, repo, path, data):
+    _create(client, "picky", repo, node=agents[0])
+    assert client.post(path, json=data).status_code == 400
+
+
+@pytest.mark.parametrize("replicas", ["abc", 0, 10_000])
+def test_create_with_invalid_replicas_is_400(client, agents, repo, replicas):
+    resp = _create(client, "crowded", repo, node=agents[0], replicas=replicas)
+    assert resp.status_code == 400
+    assert "crowded" not in client.get("/apps").get_json()
+
+
+def test_slow_start_outlasts_request_timeout(client, agents, slow_repo, monkeypatch):
+    monkeypatch.setattr(config, "CLUSTER_REQUEST_TIMEOUT", 1)
+    resp = _create(
+        client, "sluggish", slow_repo, node=agents[0], type="slow", path="server.py"
+    )
+    assert resp.status_code == 200
+    try:
+        resp = client.post("/start/sluggish")
+        assert resp.status_code == 200
+        assert requests.get(f"http://127.0.0.1:{resp.get_json()['port']}/").ok
+    finally:
+        client.post("/stop/sluggish")
@@ -0,0 +1,77 @@
+import os
+import stat
+
+import pytest
+
+from env_store import ENV_FILE_VAR, EnvStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    os.makedirs(tmp_path / "app1")
+    return EnvStore(str(tmp_path))
+
+
+def test_later_scopes_override_earlier_ones(store):
+    store.replace(None, {"A": "global", "B": "global", "C": "global"}, "global")
+    store.replace(None, {"B": "type", "C": "type"}, "type", "flask")
+    store.replace("app1", {"C": "app", "D": "app"})
+    store.replace("app1", {"D": "secret"}, "secret")
+
+    assert store.merged("app1", "flask") == {
+        "A": "global",
+        "B": "type",
+        "C": "app",
+        "D": "secret",
+    }
+    # Type variables only reach apps of that type
+    assert store.merged("app1", "streamlit")["B"] == "global"
+
+
+def test_resolve_exports_merged_env(store, monkeypatch):
+    monkeypatch.setenv("SERVICE_VAR", "inherited")
+    store = EnvStore(store.storage_path)
+    store.replace("app1", {"A": "1"})
+
+    env = store.resolve("app1", "flask")
+    assert env["SERVICE_VAR"] == "inherited"
+    assert env["A"] == "1"
+    path = env[ENV_FILE_VAR]
+    with open(path) as f:
+        assert f.read() == "A=1\n"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_diff_reports_added_changed_and_removed(store):
+    store.replace("app1", {"KEEP": "1", "CHANGE": "old", "DROP": "x"})
+    diff = store.update("app1", {"CHANGE": "new", "ADD": "2"}, unset=["DROP"])
+    assert diff == {
+        "added": {"ADD": "2"},
+        "changed": {"CHANGE": "new"},
+        "removed": ["DROP"],
+    }
+    assert store.get("app1") == {"KEEP": "1", "CHANGE": "new", "ADD": "2"}
+
+
+def test_unchanged_env_is_not_rewritten(store):
+    store.replace("app1", {"A": "1"})
+    path = store.scope_path("app", "app1")
+    mtime = os.stat(path).st_mtime_ns
+    diff = store.update("app1", {"A": "1"})
+    assert not any(diff.values())
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_edited_file_is_read_again(store):
+    store.replace("app1", {"A": "1"})
+    assert store.get("app1") == {"A": "1"}
+    with open(store.scope_path("app", "app1"), "w") as f:
+        f.write("A=2\nB=3\n")
+    assert store.get("app1") == {"A": "2", "B": "3"}
+
+
+def test_secrets_are_private(store):
+    store.replace("app1", {"TOKEN": "s3cret"}, "secret")
+    path = store.scope_path("secret", "app1")
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert store.get("app1") == {}
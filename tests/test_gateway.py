@@ -0,0 +1,146 @@
+import socket
+import threading
+
+from gateway import Gateway, RoutingTable
+from proxy_stats import StatsRegistry
+
+
+class _Handler:
+    """Just what relay_websocket reads of a werkzeug request handler"""
+
+    command = "GET"
+
+    def __init__(self, connection, path):
+        self.connection = connection
+        self.path = path
+        self.headers = {
+            "Host": "localhost",
+            "Upgrade": "websocket",
+            "Connection": "Upgrade",
+        }
+
+
+def _upstream(answer):
+    """Listen on a free port, answer one handshake and close"""
+    server = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            head = b""
+            while b"\r\n\r\n" not in head:
+                head += conn.recv(65536)
+            conn.sendall(answer)
+        server.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def _gateway(registry=None):
+    return Gateway(RoutingTable(), lambda app_name: None, stats_registry=registry)
+
+
+def test_rejected_websocket_records_upstream_status():
+    port = _upstream(b"HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\n\r\n")
+    registry = StatsRegistry()
+    gateway = _gateway(registry)
+    gateway.routing_table.update("app1", [port], {"type": "streamlit"})
+
+    client, server_side = socket.socketpair()
+    with client, server_side:
+        gateway.relay_websocket(_Handler(server_side, "/app/app1/_stcore/stream"))
+        assert client.recv(65536).startswith(b"HTTP/1.1 403")
+
+    summary = registry.summary("app1")
+    assert summary["statuses"] == {"403": 1}
+    assert summary["websockets"] == 0
+
+
+def test_unreachable_websocket_upstream_is_502():
+    gateway = _gateway()
+    with socket.create_server(("127.0.0.1", 0)) as closed:
+        port = closed.getsockname()[1]
+    gateway.routing_table.update("app1", [port], {"type": "streamlit"})
+
+    client, server_side = socket.socketpair()
+    with client, server_side:
+        gateway.relay_websocket(_Handler(server_side, "/app/app1/_stcore/stream"))
+        assert client.recv(65536).startswith(b"HTTP/1.1 502")
+    assert gateway._stats_for("app1").snapshot()["statuses"] == {"502": 1}
+
+
+def test_forget_starts_deleted_app_from_scratch():
+    registry = StatsRegistry()
+    gateway = _gateway(registry)
+    gateway._stats_for("app1").record_request(200)
+    gateway._balancers["app1"] = object()
+
+    gateway.forget("app1")
+    registry.remove("app1")
+    assert registry.summary("app1") is None
+    assert "app1" not in gateway._balancers
+
+    gateway._stats_for("app1").record_request(500)
+    assert registry.summary("app1")["statuses"] == {"500": 1}
+
+
+def test_path_routing():
+    gateway = _gateway()
+    assert gateway._resolve("gw:9000", "/app/app1/_stcore/health") == (
+        "app1",
+        "/_stcore/health",
+    )
+    assert gateway._resolve("gw:9000", "/app/app1") == ("app1", "/")
+    assert gateway._resolve("gw:9000", "/other/app1/") == (None, None)
+
+
+def test_subdomain_routing():
+    gateway = Gateway(
+        RoutingTable(),
+        lambda app_name: None,
+        routing="subdomain",
+        domain="apps.example.com",
+    )
+    assert gateway._resolve("app1.apps.example.com:9000", "/x") == ("app1", "/x")
+    assert gateway._resolve("example.com", "/x") == (None, None)
+
+
+def test_routes_follow_ports_and_metadata():
+    table = RoutingTable()
+    table.update("app1", [8001, 8002], {"type": "streamlit", "max_inflight": 4})
+    route = table.route("app1")
+    assert route.app_type == "streamlit"
+    assert route.limits[0] == 8  # per replica
+
+    # Scaling keeps the metadata of the route
+    table.update("app1", [8001])
+    assert table.route("app1").limits[0] == 4
+    table.update_metadata("app1", {"type": "streamlit", "max_inflight": 2})
+    assert table.route("app1").limits[0] == 2
+    # Metadata of a stopped app creates no route
+    table.update_metadata("app2", {"type": "flask"})
+    assert table.lookup("app2") == []
+
+    table.update("app1", [])
+    assert table.route("app1") is None
+    assert len(table) == 0
+
+
+def test_removed_app_loses_its_route():
+    table = RoutingTable()
+    table.update("app1", [8001], {"type": "streamlit"})
+    table.update_metadata("app1", None)
+    assert table.lookup("app1") == []
+
+
+def test_requests_are_routed_to_running_apps():
+    gateway = _gateway()
+    client = gateway.app.test_client()
+    assert client.get("/elsewhere").status_code == 404
+    assert client.get("/app/app1/").status_code == 503
+
+    gateway.routing_table.update("app1", [8001], {"type": "streamlit"})
+    resp = client.get("/app/app1")
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/app/app1/")
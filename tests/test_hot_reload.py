@@ -0,0 +1,27 @@
+import pytest
+
+from hot_reload import classify_changes
+
+
+@pytest.mark.parametrize(
+    "app_type, changed, workers, action",
+    [
+        # Data files never need the server to do anything
+        ("fastapi", ["data/users.csv", "README.md"], None, "none"),
+        # Streamlit reruns changed scripts, voila re-executes notebooks
+        ("streamlit", ["pages/home.py", "main.py"], None, "none"),
+        ("voila", ["dashboard.ipynb"], None, "none"),
+        # uvicorn's supervisor reloads code on a signal with several workers
+        ("fastapi", ["api/routes.py"], None, "reload"),
+        ("fastapi", ["api/routes.py"], 1, "restart"),
+        ("voila", ["helpers.py"], None, "restart"),
+        ("unknown", ["main.py"], None, "restart"),
+        ("unknown", ["data.json"], None, "none"),
+        # Dependencies and server config always restart
+        ("streamlit", ["requirements.txt"], None, "restart"),
+        ("streamlit", [".streamlit/config.toml"], None, "restart"),
+        ("fastapi", ["api/routes.py", "requirements-dev.txt"], None, "restart"),
+    ],
+)
+def test_classify_changes(app_type, changed, workers, action):
+    assert classify_changes(app_type, changed, workers) == action
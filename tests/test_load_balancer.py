@@ -0,0 +1,43 @@
+from load_balancer import STICKY_COOKIE, LoadBalancer, sticky_port_from_cookie_header
+
+
+def test_least_connections_picks_idlest_replica():
+    balancer = LoadBalancer()
+    balancer.acquire(8001)
+    balancer.acquire(8001)
+    balancer.acquire(8002)
+    assert balancer.choose([8001, 8002, 8003]) == 8003
+    balancer.acquire(8003)
+    balancer.acquire(8003)
+    assert balancer.choose([8001, 8002, 8003]) == 8002
+
+
+def test_release_forgets_idle_replicas():
+    balancer = LoadBalancer()
+    balancer.acquire(8001)
+    balancer.acquire(8001)
+    balancer.release(8001)
+    assert balancer.inflight() == {8001: 1}
+    balancer.release(8001)
+    assert balancer.inflight() == {}
+
+
+def test_sticky_replica_wins_while_it_is_up():
+    balancer = LoadBalancer()
+    for _ in range(5):
+        balancer.acquire(8001)
+    assert balancer.choose([8001, 8002], sticky_port=8001) == 8001
+    # Its replica went away, the client moves to the idlest one
+    assert balancer.choose([8002, 8003], sticky_port=8001) == 8002
+
+
+def test_no_replicas():
+    assert LoadBalancer().choose([]) is None
+
+
+def test_sticky_port_from_cookie_header():
+    header = f"session=abc; {STICKY_COOKIE}=8002"
+    assert sticky_port_from_cookie_header(header) == 8002
+    assert sticky_port_from_cookie_header(f"{STICKY_COOKIE}=x") is None
+    assert sticky_port_from_cookie_header("session=abc") is None
+    assert sticky_port_from_cookie_header(None) is None
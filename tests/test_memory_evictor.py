@@ -0,0 +1,60 @@
+import memory_evictor
+from memory_evictor import MemoryPressureEvictor, read_memory_psi
+
+
+def _app(running=True, last_access_time=None, **info):
+    return {"running": running, "last_access_time": last_access_time, **info}
+
+
+def test_eviction_order():
+    apps = {
+        "recent": _app(last_access_time=300),
+        "stale": _app(last_access_time=100),
+        "never_used": _app(),
+        "important": _app(last_access_time=50, priority=5),
+        "pinned": _app(last_access_time=10, pinned=True),
+        "stopped": _app(running=False, last_access_time=20),
+    }
+    # Lowest priority first, least recently used first within a priority
+    assert MemoryPressureEvictor.eviction_order(apps) == [
+        "never_used",
+        "stale",
+        "recent",
+        "important",
+    ]
+
+
+def test_read_memory_psi(tmp_path):
+    psi = tmp_path / "memory"
+    psi.write_text(
+        "some avg10=12.50 avg60=3.00 avg300=1.00 total=123456\n"
+        "full avg10=1.00 avg60=0.50 avg300=0.10 total=6543\n"
+    )
+    assert read_memory_psi(str(psi)) == (12.5, 123456)
+    assert read_memory_psi(str(tmp_path / "missing")) is None
+
+
+def test_check_evicts_until_pressure_clears(monkeypatch):
+    apps = {
+        "a": _app(last_access_time=1),
+        "b": _app(last_access_time=2),
+        "c": _app(last_access_time=3),
+    }
+    stopped = []
+
+    def stop_app(app_name):
+        stopped.append(app_name)
+        return app_name != "a"  # a fails to stop, the next one goes
+
+    evictor = MemoryPressureEvictor(lambda: apps, stop_app)
+    monkeypatch.setattr(evictor, "pressure_reason", lambda: "low memory")
+    monkeypatch.setattr(evictor, "pressure_cleared", lambda window: True)
+    assert evictor.check() == ["b"]
+    assert stopped == ["a", "b"]
+
+
+def test_no_pressure_evicts_nothing(monkeypatch):
+    monkeypatch.setattr(memory_evictor, "memory_available_percent", lambda: 80.0)
+    monkeypatch.setattr(memory_evictor, "read_memory_psi", lambda: (0.0, 0))
+    evictor = MemoryPressureEvictor(lambda: {"a": _app()}, lambda app_name: True)
+    assert evictor.check() == []
@@ -0,0 +1,84 @@
+import threading
+
+from proxy_stats import (
+    NUM_BUCKETS,
+    NUM_SHARDS,
+    LatencyHistogram,
+    ProxyStats,
+    StatsRegistry,
+)
+
+
+def test_removed_app_stats_are_gone():
+    registry = StatsRegistry()
+    stats = ProxyStats()
+    stats.record_request(200)
+    registry.track("app1", "gateway", stats)
+    registry.report("app1", "proxy-1", ProxyStats().snapshot())
+    registry.report("app2", "proxy-2", ProxyStats().snapshot())
+
+    registry.remove("app1")
+    assert registry.summary("app1") is None
+    assert registry.app_names() == {"app2"}
+
+
+def test_percentiles_are_bucket_upper_bounds():
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    assert histogram.count == 100
+    # Buckets are 2^(1/4) wide, the bound is at most ~19% above the value
+    for q, value in ((50, 0.050), (90, 0.090), (99, 0.099)):
+        assert value <= histogram.percentile(q) <= value * 2**0.25
+    assert LatencyHistogram().percentile(50) is None
+
+
+def test_extreme_latencies_land_in_edge_buckets():
+    assert LatencyHistogram.bucket_of(0) == 0
+    assert LatencyHistogram.bucket_of(10_000) == NUM_BUCKETS - 1
+
+
+def test_histogram_round_trips_through_dict():
+    histogram = LatencyHistogram()
+    for seconds in (0.001, 0.01, 0.01, 1.5):
+        histogram.record(seconds)
+    copy = LatencyHistogram.from_dict(histogram.to_dict())
+    assert copy.counts == histogram.counts
+    assert (copy.count, copy.sum) == (histogram.count, histogram.sum)
+
+
+def test_snapshot_merges_all_shards():
+    stats = ProxyStats()
+
+    def record(status):
+        for _ in range(100):
+            stats.record_request(status, bytes_in=1, bytes_out=2, latency=0.01)
+
+    threads = [
+        threading.Thread(target=record, args=(200 if i % 2 else 500,))
+        for i in range(NUM_SHARDS * 2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = stats.snapshot()
+    assert snapshot["statuses"] == {"200": 1600, "500": 1600}
+    assert (snapshot["bytes_in"], snapshot["bytes_out"]) == (3200, 6400)
+    assert snapshot["latency"]["count"] == 3200
+
+
+def test_summary_adds_up_proxies():
+    registry = StatsRegistry()
+    for source, status in (("proxy-1", 200), ("proxy-2", 500)):
+        stats = ProxyStats()
+        stats.record_request(status, latency=0.02)
+        registry.report("app1", source, stats.snapshot())
+        # A repeated report replaces the earlier one of its source
+        registry.report("app1", source, stats.snapshot())
+
+    summary = registry.summary("app1")
+    assert summary["requests"] == 2
+    assert summary["error_rate"] == 0.5
+    assert 20 <= summary["latency_ms"]["p50"] <= 20 * 2**0.25
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from start_scheduler import StartScheduler, TokenBucket
+
+
+class _StateManager:
+    def __init__(self, *app_names):
+        self.metadata = {
+            name: {"name": name, "type": "streamlit"} for name in app_names
+        }
+        self.running = set()
+
+    def get_app_metadata(self, app_name):
+        return self.metadata.get(app_name)
+
+    def is_app_running(self, app_name):
+        return app_name in self.running
+
+    def get_app_port(self, app_name):
+        return 8000
+
+    def get_access_score(self, app_name):
+        return 0.0
+
+
+class _AppService:
+    def __init__(self, state_manager):
+        self.state_manager = state_manager
+        self.started = []
+        self.release = {}  # app_name -> Event the start blocks on
+
+    def start_app(self, app_name):
+        self.started.append(app_name)
+        if app_name in self.release:
+            self.release[app_name].wait(5)
+        return None
+
+
+@pytest.fixture(autouse=True)
+def idle_host(monkeypatch):
+    monkeypatch.setattr(TokenBucket, "load_factor", staticmethod(lambda: 1.0))
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_unknown_app_takes_no_token_or_slot():
+    service = _AppService(_StateManager("app1"))
+    scheduler = StartScheduler(service, max_concurrent=1)
+    tokens = scheduler.bucket.tokens
+
+    assert scheduler.start("typo") is None
+    assert scheduler.bucket.tokens == tokens
+    assert scheduler._active == 0
+    assert service.started == []
+
+
+def test_submit_leaves_out_unknown_apps():
+    service = _AppService(_StateManager("app1"))
+    scheduler = StartScheduler(service)
+    scheduler.start = service.start_app
+    assert scheduler.submit(["typo", "app1"]) == ["app1"]
+
+
+def test_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+    bucket._last_refill -= 1  # one second passed
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+
+
+def test_busy_host_slows_refill(monkeypatch):
+    monkeypatch.setattr(TokenBucket, "load_factor", staticmethod(lambda: 0.5))
+    bucket = TokenBucket(rate=2, capacity=2)
+    bucket.tokens = 0
+    bucket._last_refill -= 1
+    assert bucket.take()
+    assert not bucket.take()
+
+
+def test_hottest_waiting_app_starts_first():
+    service = _AppService(_StateManager("busy", "cold", "warm", "hot"))
+    scheduler = StartScheduler(service, max_concurrent=1)
+    scheduler.bucket = TokenBucket(rate=100, capacity=100)
+    service.release["busy"] = threading.Event()
+
+    threads = [threading.Thread(target=scheduler.start, args=("busy",))]
+    threads[0].start()
+    _wait_for(lambda: service.started == ["busy"])
+    for app_name, priority in (("cold", 1), ("hot", 9), ("warm", 5)):
+        thread = threading.Thread(target=scheduler.start, args=(app_name, priority))
+        thread.start()
+        threads.append(thread)
+    _wait_for(lambda: scheduler.queue_depth() == 3)
+
+    service.release["busy"].set()
+    for thread in threads:
+        thread.join()
+    assert service.started == ["busy", "hot", "warm", "cold"]
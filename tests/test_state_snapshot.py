@@ -0,0 +1,36 @@
+import marshal
+import os
+
+import state_snapshot
+from state_snapshot import load_snapshot, save_snapshot
+
+
+def test_round_trip_consumes_the_snapshot(tmp_path):
+    path = str(tmp_path / "snapshot")
+    state = {
+        "apps_metadata": [{"name": "app1", "port": 8001, "tags": ["a", "b"]}],
+        "running": {"app1": {"replicas": [[1234, 8001, 1700000000.5]]}},
+        "access_scores": {"app1": [2.5, 1700000000.0]},
+    }
+    save_snapshot(path, state)
+    assert load_snapshot(path) == state
+    assert not os.path.exists(path)
+    assert load_snapshot(path) is None
+
+
+def test_snapshot_of_another_python_version_is_ignored(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot")
+    # Same layout as written by a different interpreter version
+    monkeypatch.setattr(state_snapshot, "MAGIC", b"ANSNAP1" + bytes((3, 0)))
+    save_snapshot(path, {"apps_metadata": []})
+    monkeypatch.undo()
+
+    assert load_snapshot(path) is None
+    assert not os.path.exists(path)
+
+
+def test_corrupt_snapshot_is_ignored(tmp_path):
+    path = tmp_path / "snapshot"
+    path.write_bytes(state_snapshot.MAGIC + marshal.dumps({"a": 1})[:-3])
+    assert load_snapshot(str(path)) is None
+    assert not path.exists()